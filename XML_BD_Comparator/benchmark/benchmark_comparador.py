@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Benchmark de punta a punta de compare_xml_with_db sobre corpus sintéticos (ver generar_corpus.py).
+
+Para cada tamaño de corpus mide archivos/segundo, consultas por archivo y memoria máxima (RSS).
+Cada medición corre en un proceso aparte para que la memoria de un tamaño no afecte al siguiente.
+Los corpus se guardan en benchmark/corpus/ y se reutilizan; los resultados se guardan en
+benchmark/resultados/ para comparar entre versiones.
+
+Uso:
+    python benchmark/benchmark_comparador.py --archivos 1000,10000,100000
+    python benchmark/benchmark_comparador.py --archivos 10000 --extraccion xslt
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+BASE_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, BENCHMARK_DIR)
+sys.path.insert(0, os.path.join(BASE_DIR, 'src'))
+
+
+def peak_rss_mb():
+    """Memoria máxima del proceso (y de sus workers) en MB, o None si no se puede medir."""
+    try:
+        import resource
+    except ImportError:
+        # Windows: resource no existe; usar psutil si está instalado
+        try:
+            import psutil
+            return round(psutil.Process().memory_info().peak_wset / 1024 ** 2, 1)
+        except (ImportError, AttributeError):
+            return None
+
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss está en KB en Linux y en bytes en macOS
+    scale = 1024 ** 2 if sys.platform == 'darwin' else 1024
+    return round(max(own, children) / scale, 1)
+
+
+# Opciones de processing de cada modo de extracción: trie (por defecto), XPath por mapeo u hoja XSLT
+EXTRACTION_MODES = {
+    'trie': {},
+    'xpath': {'trie_extraction': False},
+    'xslt': {'extraction_engine': 'xslt'},
+}
+
+
+def extraction_config(corpus_dir, extraction):
+    """config.json del corpus con las opciones del modo de extracción (se escribe junto al original)."""
+    config_path = os.path.join(corpus_dir, 'config.json')
+    if not EXTRACTION_MODES[extraction]:
+        return config_path
+    
+    with open(config_path, 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    config.setdefault('processing', {}).update(EXTRACTION_MODES[extraction])
+    mode_config_path = os.path.join(corpus_dir, f"config_{extraction}.json")
+    with open(mode_config_path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2)
+    return mode_config_path
+
+
+def run_once(corpus_dir, workers, db_workers, output_format, log_level, keep_report, async_mode=False, extraction='trie'):
+    """Ejecutar una comparación completa sobre el corpus y devolver sus métricas."""
+    from xml_compare import XPathMapper
+
+    with open(os.path.join(corpus_dir, 'corpus.json'), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    xml_dir = os.path.join(corpus_dir, 'xml')
+
+    start = time.perf_counter()
+    mapper = XPathMapper(config_file=extraction_config(corpus_dir, extraction), mapping_file=manifest['mapping_file'])
+    mapping_seconds = time.perf_counter() - start
+    mapper.logger.setLevel(getattr(logging, log_level))
+
+    # El config.json del corpus usa el backend sqlite sobre corpus.db
+    if not mapper.connect_to_db():
+        raise RuntimeError("No se pudo abrir la BD SQLite del corpus (ver el log)")
+
+    start = time.perf_counter()
+    if async_mode:
+        report_path = asyncio.run(mapper.compare_xml_with_db_async(xml_dir, workers=workers, output_format=output_format, db_workers=db_workers))
+    else:
+        report_path = mapper.compare_xml_with_db(xml_dir, workers=workers, output_format=output_format, db_workers=db_workers)
+    seconds = time.perf_counter() - start
+
+    queries = mapper.db.query_count
+    if mapper.db_pool is not None:
+        queries += mapper.db_pool.query_count
+    mapper.close_db_connection()
+
+    if report_path is None:
+        raise RuntimeError("La comparación no generó reporte (ver el log)")
+
+    report_mb = round(os.path.getsize(report_path) / 1024 ** 2, 1)
+    if not keep_report:
+        os.remove(report_path)
+        for suffix in ('_resumen.json', '_rendimiento.json'):
+            sidecar_path = os.path.splitext(report_path)[0] + suffix
+            if os.path.exists(sidecar_path):
+                os.remove(sidecar_path)
+
+    files = manifest['archivos']
+    return {
+        'archivos': files,
+        'segundos': round(seconds, 2),
+        'archivos_por_segundo': round(files / seconds, 1) if seconds else None,
+        'consultas': queries,
+        'consultas_por_archivo': round(queries / files, 2),
+        'rss_max_mb': peak_rss_mb(),
+        'carga_mapeo_segundos': round(mapping_seconds, 3),
+        'reporte_mb': report_mb,
+    }
+
+
+def ensure_corpus(n_files, args):
+    """Generar el corpus de n_files archivos, o reutilizarlo si ya existe con los mismos parámetros."""
+    from generar_corpus import CORPUS_VERSION, DEFAULT_MAPPING, DEFAULT_TEMPLATE, generate_corpus
+
+    corpus_dir = os.path.join(BENCHMARK_DIR, 'corpus', f"corpus_{n_files}")
+    expected = {
+        'version': CORPUS_VERSION,
+        'archivos': n_files,
+        'plantillas': [os.path.abspath(path) for path in (args.plantilla or [DEFAULT_TEMPLATE])],
+        'mapping_file': os.path.abspath(args.mapeo or DEFAULT_MAPPING),
+        'seed': args.seed,
+    }
+
+    manifest_path = os.path.join(corpus_dir, 'corpus.json')
+    if os.path.exists(manifest_path) and not args.regenerar:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if all(manifest.get(key) == value for key, value in expected.items()):
+            return corpus_dir
+
+    print(f"Generando corpus de {n_files} archivos en {corpus_dir}...")
+    if os.path.exists(corpus_dir):
+        import shutil
+        shutil.rmtree(corpus_dir)
+    generate_corpus(corpus_dir, n_files, args.plantilla, args.mapeo, args.seed)
+    return corpus_dir
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de compare_xml_with_db sobre corpus sintéticos")
+    parser.add_argument('--archivos', default='1000,10000,100000', help="Tamaños de corpus separados por coma")
+    parser.add_argument('--workers', type=int, default=1, help="Procesos de extracción (processing.workers)")
+    parser.add_argument('--db-workers', type=int, default=1, help="Conexiones e hilos de consulta a la BD (database.pool_size)")
+    parser.add_argument('--async', dest='async_mode', action='store_true', help="Medir compare_xml_with_db_async en lugar de compare_xml_with_db")
+    parser.add_argument('--extraccion', default='trie', choices=sorted(EXTRACTION_MODES),
+                        help="Extracción: trie de rutas simples (por defecto), xpath (una evaluación por mapeo) o xslt (una transformación por archivo)")
+    parser.add_argument('--formato', default='csv', help="Formato del reporte (xlsx admite hasta ~1M filas)")
+    parser.add_argument('--plantilla', action='append', help="XML de plantilla o plantilla JSON con example_data")
+    parser.add_argument('--mapeo', help="Archivo de mapeo correspondiente a las plantillas")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--regenerar', action='store_true', help="Volver a generar los corpus aunque existan")
+    parser.add_argument('--log-level', default='INFO', choices=['DEBUG', 'INFO', 'WARNING', 'ERROR'], help="Nivel del log del comparador durante la medición")
+    parser.add_argument('--conservar-reportes', action='store_true', help="No borrar los reportes generados")
+    parser.add_argument('--ejecutar', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    # Proceso hijo: una sola medición, resultado en JSON por stdout
+    if args.ejecutar:
+        result = run_once(args.ejecutar, args.workers, args.db_workers, args.formato, args.log_level, args.conservar_reportes, args.async_mode, args.extraccion)
+        print(json.dumps(result))
+        return
+
+    sizes = [int(size) for size in args.archivos.split(',') if size.strip()]
+    results = []
+
+    for n_files in sizes:
+        corpus_dir = ensure_corpus(n_files, args)
+        print(f"Midiendo {n_files} archivos...")
+
+        command = [sys.executable, os.path.abspath(__file__), '--ejecutar', corpus_dir,
+                   '--workers', str(args.workers), '--db-workers', str(args.db_workers), '--formato', args.formato, '--log-level', args.log_level, '--extraccion', args.extraccion]
+        if args.conservar_reportes:
+            command.append('--conservar-reportes')
+        if args.async_mode:
+            command.append('--async')
+        completed = subprocess.run(command, capture_output=True, text=True)
+        if completed.returncode != 0:
+            print(completed.stderr)
+            sys.exit(f"❌ Falló la medición de {n_files} archivos")
+
+        results.append(json.loads(completed.stdout.strip().splitlines()[-1]))
+
+    print()
+    print(f"{'archivos':>10} {'segundos':>10} {'arch/s':>10} {'consultas/arch':>15} {'RSS máx (MB)':>13}")
+    for result in results:
+        print(f"{result['archivos']:>10} {result['segundos']:>10} {result['archivos_por_segundo']:>10} "
+              f"{result['consultas_por_archivo']:>15} {str(result['rss_max_mb']):>13}")
+
+    output_dir = os.path.join(BENCHMARK_DIR, 'resultados')
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(output_dir, f"benchmark_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump({
+            'fecha': datetime.now().isoformat(),
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'plataforma': platform.platform(),
+            'workers': args.workers,
+            'db_workers': args.db_workers,
+            'async': args.async_mode,
+            'extraccion': args.extraccion,
+            'formato': args.formato,
+            'log_level': args.log_level,
+            'resultados': results,
+        }, f, indent=2, ensure_ascii=False)
+    print(f"\nResultados guardados en: {output_path}")
+
+
+if __name__ == "__main__":
+    main()
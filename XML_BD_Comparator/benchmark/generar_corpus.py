@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Generador de un corpus sintético para medir el comparador sin conexión a la BD real.
+
+A partir de XML de plantilla (por defecto xml/will_county/*.xml, o los example_data de las
+plantillas JSON de integración) genera N archivos XML con identificadores únicos y una base
+SQLite con los registros correspondientes, armada con las tablas y columnas del archivo de mapeo.
+
+Uso:
+    python benchmark/generar_corpus.py --archivos 1000 --salida benchmark/corpus/will_county_1000
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+from datetime import datetime
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(BASE_DIR, 'src'))
+
+from xml_compare import XPathMapper
+
+DEFAULT_TEMPLATE = sorted(glob.glob(os.path.join(BASE_DIR, 'xml', 'will_county', '*.xml')))[0]
+DEFAULT_MAPPING = os.path.join(BASE_DIR, 'mappings', 'will_county', 'xpath_mappings_will_county.xlsx')
+
+# Filtros de la configuración del corpus; los registros generados siempre los cumplen
+BATT_DEPT_ID = 4611
+START_DATETIME = '2025-01-01 00:00:00'
+CREATED_AT = '2025-06-01 00:00:00'
+
+# Versión del formato del corpus: los corpus guardados con otra versión se vuelven a generar
+CORPUS_VERSION = 2
+
+# Columnas que usa el comparador para ubicar los registros, además de las del mapeo
+KEY_COLUMNS = ['id', 'batt_dept_id', 'created_at', 'xref_id', 'dispatch_number', 'incident_number', 'nfirs_notification_id']
+
+
+def load_templates(template_paths):
+    """Leer las plantillas XML: archivos .xml o plantillas .json con 'example_data'."""
+    templates = []
+
+    for path in template_paths:
+        if path.lower().endswith('.json'):
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            for template in data.get('templates', []):
+                for example in template.get('example_data', []) or []:
+                    if str(example.get('value', '')).lstrip().startswith('<'):
+                        templates.append((f"{os.path.basename(path)}:{example.get('name', '')}", example['value']))
+        else:
+            with open(path, 'r', encoding='utf-8') as f:
+                templates.append((os.path.basename(path), f.read()))
+
+    if not templates:
+        raise ValueError("No se encontraron plantillas XML")
+    return templates
+
+
+def analyze_template(mapper, name, text, work_dir):
+    """
+    Extraer de una plantilla sus identificadores y los valores de cada mapeo, igual que lo hace el comparador.
+    Los identificadores (valores de al menos 6 caracteres) son los que se reemplazan en cada archivo generado.
+    """
+    template_file = 'plantilla.xml'
+    with open(os.path.join(work_dir, template_file), 'w', encoding='utf-8') as f:
+        f.write(text)
+
+    _, identifiers, values, error = mapper._extract_xml_file(work_dir, template_file)
+    if error:
+        raise ValueError(f"No se pudo procesar la plantilla {name}: {error}")
+
+    tokens = sorted({str(value) for value in identifiers.values() if value and len(str(value)) >= 6}, key=len, reverse=True)
+    if not tokens:
+        raise ValueError(f"La plantilla {name} no tiene identificadores (xref_id/dispatch_number/incident_number)")
+
+    return {'name': name, 'text': text, 'identifiers': identifiers, 'values': values, 'tokens': tokens}
+
+
+def _replace_tokens(value, replacements):
+    for old, new in replacements:
+        value = value.replace(old, new)
+    return value
+
+
+def generate_corpus(output_dir, n_files, template_paths=None, mapping_file=None, seed=0,
+                    missing_ratio=0.05, mismatch_ratio=0.1):
+    """
+    Generar el corpus en output_dir: carpeta xml/ con n_files archivos, corpus.db (SQLite) con los
+    registros, config.json con los filtros y el backend sqlite, y corpus.json con los parámetros de generación.
+    missing_ratio: fracción de archivos sin registro en la BD. mismatch_ratio: fracción de registros
+    con un valor distinto al del XML.
+    """
+    template_paths = template_paths or [DEFAULT_TEMPLATE]
+    mapping_file = os.path.abspath(mapping_file or DEFAULT_MAPPING)
+    rng = random.Random(seed)
+
+    xml_dir = os.path.join(output_dir, 'xml')
+    os.makedirs(xml_dir, exist_ok=True)
+    db_path = os.path.join(output_dir, 'corpus.db')
+    if os.path.exists(db_path):
+        os.remove(db_path)
+
+    config = {
+        'database': {'backend': 'sqlite', 'path': os.path.abspath(db_path)},
+        'filters': {
+            'batt_dept_id': {'column_name': 'batt_dept_id', 'values': [BATT_DEPT_ID]},
+            'datetime': {'column_name': 'created_at', 'start_datetime': START_DATETIME, 'format': '%Y-%m-%d %H:%M:%S'}
+        },
+        'processing': {'workers': 1, 'mapping_cache': True, 'output_format': 'csv'}
+    }
+    config_path = os.path.join(output_dir, 'config.json')
+    with open(config_path, 'w', encoding='utf-8') as f:
+        json.dump(config, f, indent=2)
+
+    mapper = XPathMapper(config_file=config_path, mapping_file=mapping_file)
+    if mapper.mapping_data is None:
+        raise ValueError(f"No se pudo cargar el archivo de mapeo: {mapping_file}")
+
+    with tempfile.TemporaryDirectory() as work_dir:
+        templates = [analyze_template(mapper, name, text, work_dir) for name, text in load_templates(template_paths)]
+
+    # Esquema: columnas del mapeo por tabla más las columnas de búsqueda
+    columns_by_table = {}
+    for row in mapper.valid_mappings:
+        columns = columns_by_table.setdefault(row['table_name'], [])
+        column = row['column_name'].replace(' ', '_')
+        if column not in columns:
+            columns.append(column)
+    columns_by_table.setdefault('dispatch', [])
+    columns_by_table.setdefault('nfirs_notification', [])
+
+    conn = sqlite3.connect(db_path)
+    for table, columns in columns_by_table.items():
+        all_columns = KEY_COLUMNS + [c for c in columns if c not in KEY_COLUMNS]
+        conn.execute(f"CREATE TABLE {table} ({', '.join(all_columns)})")
+    conn.execute("CREATE INDEX idx_dispatch_xref_id ON dispatch (xref_id)")
+    conn.execute("CREATE INDEX idx_nfirs_dispatch_number ON nfirs_notification (dispatch_number)")
+    conn.execute("CREATE INDEX idx_nfirs_incident_number ON nfirs_notification (incident_number)")
+    for table in columns_by_table:
+        if table.startswith('nfirs_notification_'):
+            conn.execute(f"CREATE INDEX idx_{table}_parent ON {table} (nfirs_notification_id)")
+
+    rows_by_table = {table: [] for table in columns_by_table}
+    digits = len(str(n_files))
+
+    for i in range(n_files):
+        template = templates[i % len(templates)]
+        suffix = f"{i:0{digits}d}"
+        replacements = [(token, f"{token[:-len(suffix)] if len(token) > len(suffix) + 2 else token}{suffix}") for token in template['tokens']]
+
+        xml_file = f"sintetico_{suffix}.xml"
+        with open(os.path.join(xml_dir, xml_file), 'w', encoding='utf-8') as f:
+            f.write(_replace_tokens(template['text'], replacements))
+
+        if rng.random() < missing_ratio:
+            continue
+
+        identifiers = {key: _replace_tokens(str(value), replacements) if value else None for key, value in template['identifiers'].items()}
+        primary = identifiers['xref_id'] or identifiers['dispatch_number']
+
+        # Valores del registro: los del XML, con algún valor alterado según mismatch_ratio
+        record = {table: {} for table in columns_by_table}
+        for row, value in zip(mapper.valid_mappings, template['values']):
+            column = row['column_name'].replace(' ', '_')
+            if value is not None and column not in record[row['table_name']]:
+                record[row['table_name']][column] = _replace_tokens(str(value), replacements)
+        if rng.random() < mismatch_ratio:
+            table = rng.choice([t for t in record if record[t]] or ['dispatch'])
+            if record[table]:
+                column = rng.choice(sorted(record[table]))
+                record[table][column] = f"{record[table][column]} (modificado)"
+
+        for table, values in record.items():
+            values.update({'id': i + 1, 'batt_dept_id': BATT_DEPT_ID})
+            values.setdefault('created_at', CREATED_AT)
+            if table == 'dispatch':
+                values['xref_id'] = primary
+            elif table == 'nfirs_notification':
+                values['dispatch_number'] = primary
+                values.setdefault('incident_number', identifiers['incident_number'])
+            elif table.startswith('nfirs_notification_'):
+                values['nfirs_notification_id'] = i + 1
+            elif table == 'batt_dept':
+                if i > 0:
+                    continue
+                values['id'] = BATT_DEPT_ID
+            rows_by_table[table].append(values)
+
+    for table, rows in rows_by_table.items():
+        for row in rows:
+            columns = list(row)
+            conn.execute(f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", [row[c] for c in columns])
+    conn.commit()
+    conn.close()
+
+    manifest = {
+        'version': CORPUS_VERSION,
+        'archivos': n_files,
+        'plantillas': [os.path.abspath(path) for path in template_paths],
+        'mapping_file': mapping_file,
+        'seed': seed,
+        'missing_ratio': missing_ratio,
+        'mismatch_ratio': mismatch_ratio,
+        'generado': datetime.now().isoformat(),
+    }
+    with open(os.path.join(output_dir, 'corpus.json'), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generar un corpus sintético de XML y su base SQLite")
+    parser.add_argument('--archivos', type=int, default=1000, help="Cantidad de archivos XML a generar")
+    parser.add_argument('--salida', required=True, help="Carpeta de salida del corpus")
+    parser.add_argument('--plantilla', action='append', help="XML de plantilla o plantilla JSON con example_data (se puede repetir)")
+    parser.add_argument('--mapeo', default=DEFAULT_MAPPING, help="Archivo de mapeo (xlsx) correspondiente a las plantillas")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--sin-registro', type=float, default=0.05, help="Fracción de archivos sin registro en la BD")
+    parser.add_argument('--diferencias', type=float, default=0.1, help="Fracción de registros con un valor distinto al XML")
+    args = parser.parse_args()
+
+    manifest = generate_corpus(args.salida, args.archivos, args.plantilla, args.mapeo, args.seed, args.sin_registro, args.diferencias)
+    print(f"✅ Corpus generado en {args.salida}: {manifest['archivos']} archivos")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,521 @@
+"""
+Backends de base de datos del comparador.
+
+XPathMapper arma sus consultas en un único dialecto (el de PostgreSQL: parámetros %s, arreglos
+'= ANY(%s)' y uniones entre paréntesis) y las ejecuta a través de un backend. Cada backend se conecta a
+su motor, adapta las consultas a su dialecto y ofrece lectura por bloques e introspección del esquema.
+Hay un backend para PostgreSQL (psycopg2) y otro para SQLite (snapshots locales, corpus de benchmark).
+ConnectionPool reparte varias conexiones a la misma BD entre los hilos que consultan en paralelo, y
+create_async_pool ofrece la misma interfaz de consultas como corrutinas para el comparador async.
+"""
+import asyncio
+import os
+import queue
+import re
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+# Filas por bloque en las lecturas masivas (stream)
+FETCH_SIZE = 5000
+
+# Partes del dialecto del comparador: literales entre comillas simples, identificadores entre comillas dobles,
+# arreglos '= ANY(%s)', '%%' (un '%' literal, como en psycopg2) y parámetros %s
+QUERY_TOKEN_PATTERN = re.compile(r"'(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|=\s*ANY\(%s\)|%%|%s")
+PARAMETER = '%s'
+ARRAY_PARAMETER = '= ANY(%s)'
+
+
+def split_query(query):
+    """
+    Partes de una consulta con parámetros: texto SQL y los marcadores PARAMETER y ARRAY_PARAMETER, en orden.
+    '%%' pasa a ser '%'. Dentro de un literal o identificador entre comillas, %s es texto y no un parámetro.
+    """
+    parts = []
+    position = 0
+    for match in QUERY_TOKEN_PATTERN.finditer(query):
+        text = query[position:match.start()]
+        token = match.group()
+        position = match.end()
+        if token == '%s':
+            parts.extend([text, PARAMETER])
+        elif token.startswith('='):
+            parts.extend([text, ARRAY_PARAMETER])
+        else:
+            parts.append(text + token.replace('%%', '%'))
+    parts.append(query[position:])
+    return parts
+
+
+class DatabaseBackend:
+    """Interfaz de los backends: conexión, consultas parametrizadas, lectura por bloques y columnas de las tablas."""
+
+    name = None
+
+    def __init__(self):
+        self.conn = None
+        self.cursor = None
+        self.query_count = 0
+
+    def connect(self):
+        """Abrir la conexión; lanza la excepción del driver si falla."""
+        raise NotImplementedError
+
+    def describe(self):
+        """Descripción de la conexión para el log."""
+        raise NotImplementedError
+
+    @property
+    def closed(self):
+        """True si la conexión se cerró o se perdió."""
+        raise NotImplementedError
+
+    def close(self):
+        if self.cursor is not None:
+            self.cursor.close()
+        if self.conn is not None:
+            self.conn.close()
+
+    @property
+    def supports_clone(self):
+        """True si la BD admite otra conexión con clone() (para el pool de conexiones)."""
+        return False
+
+    def clone(self):
+        """Backend nuevo (sin conectar) hacia la misma BD, para el pool de conexiones; solo si supports_clone."""
+        raise NotImplementedError
+
+    def adapt_query(self, query, params):
+        """Traducir una consulta del dialecto del comparador al del motor. Retorna (consulta, parámetros)."""
+        return query, params
+
+    def execute(self, query, params=None, prepare=False):
+        """
+        Ejecutar una consulta con parámetros y retornar el cursor. prepare: la consulta es una plantilla que
+        se repite con otros parámetros; el backend puede prepararla una sola vez por conexión.
+        """
+        self.query_count += 1
+        query, params = self.adapt_query(query, params)
+        if params is None:
+            self.cursor.execute(query)
+        else:
+            self.cursor.execute(query, params)
+        return self.cursor
+
+    def fetchone(self, query, params=None, prepare=False):
+        """Primera fila de la consulta, o None."""
+        return self.execute(query, params, prepare).fetchone()
+
+    def fetchall(self, query, params=None, prepare=False):
+        return self.execute(query, params, prepare).fetchall()
+
+    def stream(self, query, params=None, size=FETCH_SIZE):
+        """
+        Lectura masiva por bloques de size filas. Retorna (description, bloques): la descripción de las
+        columnas del cursor y un iterador de listas de filas.
+        """
+        cursor = self._stream_cursor()
+        self.query_count += 1
+        query, params = self.adapt_query(query, params)
+        if params is None:
+            cursor.execute(query)
+        else:
+            cursor.execute(query, params)
+        rows = cursor.fetchmany(size)
+        description = cursor.description
+
+        def batches(rows=rows):
+            try:
+                while rows:
+                    yield rows
+                    rows = cursor.fetchmany(size)
+            finally:
+                if cursor is not self.cursor:
+                    cursor.close()
+
+        return description, batches()
+
+    def _stream_cursor(self):
+        return self.cursor
+
+    def table_columns(self, table_name):
+        """Columnas de una tabla en orden con su tipo ({columna: tipo}), o None si la tabla no existe."""
+        raise NotImplementedError
+
+
+class PostgresBackend(DatabaseBackend):
+    """PostgreSQL mediante psycopg2 (sección 'database' de la configuración)."""
+
+    name = 'postgresql'
+
+    def __init__(self, db_config):
+        super().__init__()
+        self.db_config = db_config
+        # Sentencias preparadas en la conexión actual: {plantilla: nombre}
+        self._prepared = {}
+
+    def connect(self):
+        import psycopg2
+        db_config = self.db_config
+        self.conn = psycopg2.connect(
+            host=db_config['host'],
+            port=db_config['port'],
+            database=db_config['dbname'],
+            user=db_config['user'],
+            password=db_config['password']
+        )
+        # Configurar autocommit para evitar errores de transacción
+        self.conn.autocommit = True
+        self.cursor = self.conn.cursor()
+        self._prepared = {}
+
+    @property
+    def supports_clone(self):
+        return True
+
+    def clone(self):
+        return PostgresBackend(self.db_config)
+
+    def describe(self):
+        return f"{self.db_config.get('host', 'N/A')}:{self.db_config.get('port', 'N/A')}/{self.db_config.get('dbname', 'N/A')}"
+
+    @property
+    def closed(self):
+        return self.conn is None or bool(self.conn.closed)
+
+    def execute(self, query, params=None, prepare=False):
+        if prepare and params:
+            query = self._prepared_statement(query, len(params))
+        return super().execute(query, params)
+
+    def _prepared_statement(self, query, param_count):
+        """
+        PREPARE de la plantilla la primera vez que se usa en la conexión (PostgreSQL la planifica una sola
+        vez) y retornar el EXECUTE equivalente, con los mismos parámetros %s.
+        Los parámetros se numeran $1, $2... y '%%' pasa a ser '%' (el PREPARE se ejecuta sin parámetros, así
+        que psycopg2 no lo traduce). Si la cantidad de parámetros no coincide con param_count (por ejemplo, un
+        %s dentro de un literal entre comillas), la consulta se retorna sin preparar.
+        """
+        name = self._prepared.get(query)
+        if name is None:
+            numbered = []
+            count = 0
+            for part in split_query(query):
+                if part is PARAMETER or part is ARRAY_PARAMETER:
+                    count += 1
+                    part = f"${count}" if part is PARAMETER else f"= ANY(${count})"
+                numbered.append(part)
+            if count != param_count:
+                self._prepared[query] = False
+                return query
+            name = f"comparador_{sum(1 for prepared in self._prepared.values() if prepared) + 1}"
+            self.cursor.execute(f"PREPARE {name} AS {''.join(numbered)}")
+            self._prepared[query] = name
+        elif name is False:
+            return query
+        return f"EXECUTE {name} ({', '.join(['%s'] * param_count)})"
+
+    def _stream_cursor(self):
+        # Cursor con nombre (del lado del servidor): las filas llegan por bloques sin cargarlas todas en memoria
+        self._stream_number = getattr(self, '_stream_number', 0) + 1
+        return self.conn.cursor(name=f"comparador_stream_{self._stream_number}", withhold=True)
+
+    def table_columns(self, table_name):
+        # Solo las tablas visibles en el search_path, igual que en las consultas sin esquema explícito
+        rows = self.fetchall(
+            """SELECT column_name, data_type FROM information_schema.columns
+               WHERE table_name = %s AND table_schema = ANY(current_schemas(false))
+               ORDER BY ordinal_position""",
+            (table_name,)
+        )
+        return {column: data_type for column, data_type in rows} or None
+
+
+class SQLiteBackend(DatabaseBackend):
+    """
+    SQLite (database.path en la configuración, o un snapshot de la BD). Traduce los parámetros %s, los
+    arreglos '= ANY(%s)', los '%%' y las uniones entre paréntesis de PostgreSQL. Las plantillas (prepare=True) no
+    necesitan un PREPARE explícito: sqlite3 reutiliza la sentencia compilada mientras el texto no cambie.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path, conn=None):
+        super().__init__()
+        self.path = path
+        self._closed = False
+        if conn is not None:
+            self.conn = conn
+            self.cursor = conn.cursor()
+
+    def connect(self):
+        # Cada conexión la usa un solo hilo a la vez, pero en el pool puede pasar de un hilo a otro
+        self.conn = sqlite3.connect(self.path, check_same_thread=False)
+        self.cursor = self.conn.cursor()
+        self._closed = False
+
+    @property
+    def supports_clone(self):
+        # Una base en memoria (snapshot Parquet) solo existe dentro de su conexión
+        return bool(self.path) and os.path.isfile(self.path)
+
+    def clone(self):
+        return SQLiteBackend(self.path)
+
+    def describe(self):
+        return f"sqlite:{self.path}"
+
+    @property
+    def closed(self):
+        return self.conn is None or self._closed
+
+    def close(self):
+        super().close()
+        self._closed = True
+
+    def adapt_query(self, query, params):
+        # (SELECT ...) UNION (SELECT ...) -> SELECT * FROM (SELECT ...) UNION SELECT * FROM (SELECT ...)
+        if query.strip().startswith('(') and ') UNION (' in query:
+            query = 'SELECT * FROM ' + query.strip().replace(') UNION (', ') UNION SELECT * FROM (')
+
+        if params is None:
+            return query, None
+
+        sql_parts = []
+        sql_params = []
+        param_iter = iter(params)
+        for part in split_query(query):
+            if part is PARAMETER:
+                sql_parts.append('?')
+                sql_params.append(next(param_iter))
+            elif part is ARRAY_PARAMETER:
+                values = list(next(param_iter))
+                sql_parts.append(f"IN ({', '.join('?' * len(values)) or 'NULL'})")
+                sql_params.extend(values)
+            else:
+                sql_parts.append(part)
+
+        return ''.join(sql_parts), sql_params
+
+    def _stream_cursor(self):
+        return self.conn.cursor()
+
+    def table_columns(self, table_name):
+        rows = self.fetchall(f"PRAGMA table_info(\"{table_name}\")")
+        return {row[1]: row[2] for row in rows} or None
+
+
+class ConnectionPool:
+    """
+    Pool de hasta size conexiones a la misma BD para consultar desde varios hilos. Cada conexión es un
+    backend propio (su conexión y su cursor) que un solo hilo usa a la vez: se toma con connection() y se
+    devuelve al terminar. Las conexiones se abren a medida que se necesitan y, si al tomar una se encuentra
+    cerrada o perdida, se vuelve a conectar.
+    """
+
+    def __init__(self, backend_factory, size):
+        self.size = size
+        self.reconnects = 0
+        self._backend_factory = backend_factory
+        self._backends = []
+        self._lock = threading.Lock()
+        # None: lugar libre para una conexión que todavía no se abrió
+        self._idle = queue.LifoQueue()
+        for _ in range(size):
+            self._idle.put(None)
+
+    def acquire(self):
+        """
+        Tomar una conexión libre (espera si están todas en uso), conectándola si hace falta.
+        Lanza ConnectionError si no se puede conectar.
+        """
+        backend = self._idle.get()
+        try:
+            if backend is None:
+                backend = self._backend_factory()
+                with self._lock:
+                    self._backends.append(backend)
+            if backend.closed:
+                if backend.conn is not None:
+                    with self._lock:
+                        self.reconnects += 1
+                backend.connect()
+        except Exception as e:
+            self._idle.put(backend)
+            raise ConnectionError(f"No se pudo abrir una conexión del pool: {e}") from e
+        return backend
+
+    def release(self, backend):
+        self._idle.put(backend)
+
+    @contextmanager
+    def connection(self):
+        backend = self.acquire()
+        try:
+            yield backend
+        finally:
+            self.release(backend)
+
+    @property
+    def query_count(self):
+        return sum(backend.query_count for backend in self._backends)
+
+    def close(self):
+        for backend in self._backends:
+            if not backend.closed:
+                backend.close()
+
+
+class ThreadedAsyncPool:
+    """
+    Consultas async sobre los backends síncronos: cada consulta se ejecuta en un hilo propio del pool con
+    una conexión del ConnectionPool, así el loop de asyncio sigue atendiendo las demás etapas mientras
+    espera a la BD. Si la BD no admite más conexiones (snapshot Parquet en memoria) se usa el backend
+    recibido, desde un único hilo. Una consulta cuya conexión se pierde se repite una vez con una conexión nueva.
+    """
+
+    name = 'hilos'
+
+    def __init__(self, backend, size):
+        self._backend = backend
+        self._pool = None
+        if size > 1 and backend.supports_clone:
+            self._pool = ConnectionPool(backend.clone, size)
+        self.size = size if self._pool is not None else 1
+        self._executor = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix='consultas_bd')
+
+    @property
+    def query_count(self):
+        """Consultas hechas por las conexiones propias del pool (las del backend recibido las cuenta él)."""
+        return self._pool.query_count if self._pool is not None else 0
+
+    async def fetchone(self, query, params=None, prepare=False):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._run, 'fetchone', query, params, prepare)
+
+    async def fetchall(self, query, params=None, prepare=False):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, self._run, 'fetchall', query, params, prepare)
+
+    def _run(self, method, query, params, prepare):
+        if self._pool is None:
+            return getattr(self._backend, method)(query, params, prepare)
+        for attempt in range(2):
+            with self._pool.connection() as backend:
+                try:
+                    return getattr(backend, method)(query, params, prepare)
+                except Exception:
+                    if attempt or not backend.closed:
+                        raise
+
+    async def close(self):
+        self._executor.shutdown()
+        if self._pool is not None:
+            self._pool.close()
+
+
+class AsyncPostgresPool:
+    """
+    Consultas async nativas a PostgreSQL con psycopg 3 (AsyncConnection): hasta size conexiones propias,
+    abiertas a medida que se necesitan, con los mismos parámetros %s y arreglos '= ANY(%s)' que psycopg2.
+    Las plantillas (prepare=True) las prepara el servidor una vez por conexión. Una consulta cuya conexión
+    se pierde se repite una vez con una conexión nueva.
+    """
+
+    name = 'psycopg async'
+
+    def __init__(self, db_config, size):
+        self.db_config = db_config
+        self.size = max(1, size)
+        self.query_count = 0
+        self.reconnects = 0
+        # Conexiones abiertas del pool (a lo sumo size): una conexión perdida se reemplaza por la nueva
+        self._connections = []
+        # Se crea dentro del loop que la usa; None: lugar libre para una conexión que todavía no se abrió
+        self._idle = None
+
+    async def _acquire(self):
+        import psycopg
+        if self._idle is None:
+            self._idle = asyncio.LifoQueue()
+            for _ in range(self.size):
+                self._idle.put_nowait(None)
+        
+        conn = await self._idle.get()
+        try:
+            if conn is not None and conn.closed:
+                # La conexión perdida deja su lugar libre: _connections guarda solo las conexiones vigentes
+                self.reconnects += 1
+                self._connections.remove(conn)
+                conn = None
+            if conn is None:
+                db_config = self.db_config
+                conn = await psycopg.AsyncConnection.connect(
+                    host=db_config['host'],
+                    port=db_config['port'],
+                    dbname=db_config['dbname'],
+                    user=db_config['user'],
+                    password=db_config['password'],
+                    autocommit=True
+                )
+                self._connections.append(conn)
+        except Exception as e:
+            self._idle.put_nowait(conn)
+            raise ConnectionError(f"No se pudo abrir una conexión del pool: {e}") from e
+        return conn
+
+    async def _execute(self, method, query, params, prepare):
+        for attempt in range(2):
+            conn = await self._acquire()
+            try:
+                async with conn.cursor() as cursor:
+                    self.query_count += 1
+                    await cursor.execute(query, params, prepare=True if prepare else None)
+                    return await getattr(cursor, method)()
+            except Exception:
+                if attempt or not conn.closed:
+                    raise
+            finally:
+                self._idle.put_nowait(conn)
+
+    async def fetchone(self, query, params=None, prepare=False):
+        return await self._execute('fetchone', query, params, prepare)
+
+    async def fetchall(self, query, params=None, prepare=False):
+        return await self._execute('fetchall', query, params, prepare)
+
+    async def close(self):
+        for conn in self._connections:
+            if not conn.closed:
+                await conn.close()
+
+
+def create_async_pool(backend, size):
+    """
+    Pool de consultas async hacia la BD de backend: psycopg 3 nativo si el backend es PostgreSQL y psycopg
+    está instalado (opcional), o los backends síncronos en hilos (ThreadedAsyncPool) en los demás casos.
+    """
+    if backend.name == 'postgresql':
+        try:
+            import psycopg
+        except ImportError:
+            psycopg = None
+        if psycopg is not None:
+            return AsyncPostgresPool(backend.db_config, size)
+    return ThreadedAsyncPool(backend, size)
+
+
+DATABASE_BACKENDS = {backend_class.name: backend_class for backend_class in (PostgresBackend, SQLiteBackend)}
+
+
+def create_backend(db_config):
+    """Backend para la sección 'database' de la configuración (database.backend: 'postgresql' o 'sqlite')."""
+    backend_name = str(db_config.get('backend', 'postgresql')).lower()
+    if backend_name == 'postgres':
+        backend_name = 'postgresql'
+    if backend_name not in DATABASE_BACKENDS:
+        raise ValueError(f"Backend de BD no soportado: '{backend_name}' (opciones: {', '.join(DATABASE_BACKENDS)})")
+    if backend_name == 'sqlite':
+        if not db_config.get('path'):
+            raise ValueError("El backend sqlite requiere database.path")
+        return SQLiteBackend(db_config['path'])
+    return PostgresBackend(db_config)
@@ -0,0 +1,301 @@
+"""
+Copia local (snapshot) de las tablas de la BD que usa el comparador.
+
+El snapshot guarda, para los batt_dept_id y la fecha de inicio configurados, los registros de dispatch,
+nfirs_notification, sus tablas hijas (apparatus/personnel), batt_dept y las demás tablas del mapeo, en
+SQLite (un archivo) o Parquet (una carpeta con un archivo por tabla). El comparador puede luego ejecutar
+sus consultas contra esa copia indexada en lugar del servidor PostgreSQL.
+"""
+import json
+import os
+import shutil
+import sqlite3
+from datetime import datetime
+
+from db_backend import FETCH_SIZE, SQLiteBackend
+from report_writer import import_pyarrow
+
+# Tablas que siempre se incluyen, además de las del mapeo
+SNAPSHOT_TABLES = ['dispatch', 'nfirs_notification', 'nfirs_notification_apparatus', 'nfirs_notification_personnel', 'batt_dept']
+# Tablas hijas de nfirs_notification: se filtran por su registro padre
+CHILD_TABLES = ['nfirs_notification_apparatus', 'nfirs_notification_personnel']
+
+# Índices del snapshot según las búsquedas del comparador; las demás tablas se indexan por (batt_dept_id, created_at)
+SNAPSHOT_INDEXES = {
+    'dispatch': [('xref_id',), ('batt_dept_id', 'created_at')],
+    'nfirs_notification': [('dispatch_number',), ('incident_number',), ('id',), ('batt_dept_id', 'created_at')],
+    'nfirs_notification_apparatus': [('nfirs_notification_id',)],
+    'nfirs_notification_personnel': [('nfirs_notification_id',)],
+    'batt_dept': [('id',)],
+}
+DEFAULT_INDEXES = [('batt_dept_id', 'created_at')]
+
+# Tipos de PostgreSQL (OID) que se guardan como números; el resto se guarda como texto, tal como lo compara el comparador
+INTEGER_TYPE_OIDS = {20, 21, 23, 26}
+REAL_TYPE_OIDS = {700, 701}
+
+MANIFEST_TABLE = 'snapshot_info'
+MANIFEST_FILE = 'snapshot.json'
+
+
+def snapshot_tables(mapped_tables):
+    """Tablas del snapshot: las fijas más las del mapeo, sin duplicados."""
+    tables = list(SNAPSHOT_TABLES)
+    for table_name in mapped_tables:
+        if table_name not in tables:
+            tables.append(table_name)
+    return tables
+
+
+def _export_query(table_name):
+    """Consulta que trae los registros de una tabla dentro de los filtros (parámetros: batt_dept_ids, start_datetime)."""
+    if table_name == 'batt_dept':
+        return "SELECT * FROM batt_dept WHERE id = ANY(%s)", False
+    if table_name in CHILD_TABLES:
+        return f"""SELECT c.* FROM {table_name} c
+                   INNER JOIN nfirs_notification nn ON c.nfirs_notification_id = nn.id
+                   WHERE nn.batt_dept_id = ANY(%s) AND nn.created_at >= %s""", True
+    return f"SELECT * FROM {table_name} WHERE batt_dept_id = ANY(%s) AND created_at >= %s", True
+
+
+def _column_types(description, first_rows):
+    """Tipo SQLite de cada columna: por el tipo de PostgreSQL si se conoce, si no por el primer valor no nulo."""
+    types = []
+    for i, column in enumerate(description):
+        type_code = column[1]
+        if type_code in INTEGER_TYPE_OIDS:
+            types.append('INTEGER')
+        elif type_code in REAL_TYPE_OIDS:
+            types.append('REAL')
+        else:
+            value = next((row[i] for row in first_rows if row[i] is not None), None)
+            if isinstance(value, int) and not isinstance(value, bool):
+                types.append('INTEGER')
+            elif isinstance(value, float):
+                types.append('REAL')
+            else:
+                types.append('TEXT')
+    return types
+
+
+def _convert_value(value, column_type):
+    """Valor tal como se guarda: los números quedan numéricos; fechas, decimales, booleanos, etc. como su texto."""
+    if value is None:
+        return None
+    if column_type == 'INTEGER' and isinstance(value, int) and not isinstance(value, bool):
+        return value
+    if column_type == 'REAL' and isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    return str(value)
+
+
+def _quote(identifier):
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+class _SQLiteSnapshotWriter:
+    """Snapshot en un archivo SQLite."""
+
+    def __init__(self, path):
+        self.conn = sqlite3.connect(path)
+
+    def create_table(self, table_name, columns, types):
+        self.conn.execute(f"CREATE TABLE {_quote(table_name)} ({', '.join(f'{_quote(c)} {t}' for c, t in zip(columns, types))})")
+
+    def write_rows(self, table_name, columns, rows):
+        placeholders = ', '.join('?' * len(columns))
+        self.conn.executemany(f"INSERT INTO {_quote(table_name)} VALUES ({placeholders})", rows)
+
+    def drop_table(self, table_name):
+        self.conn.execute(f"DROP TABLE IF EXISTS {_quote(table_name)}")
+
+    def close(self, manifest):
+        create_indexes(self.conn, manifest['tablas'])
+        self.conn.execute(f"CREATE TABLE {MANIFEST_TABLE} (clave TEXT PRIMARY KEY, valor TEXT)")
+        self.conn.executemany(f"INSERT INTO {MANIFEST_TABLE} VALUES (?, ?)",
+                              [(key, json.dumps(value, ensure_ascii=False)) for key, value in manifest.items()])
+        self.conn.commit()
+        self.conn.close()
+
+    def discard(self):
+        self.conn.close()
+
+
+class _ParquetSnapshotWriter:
+    """Snapshot en una carpeta con un archivo Parquet por tabla y snapshot.json. Requiere pyarrow."""
+
+    ARROW_TYPES = {'INTEGER': 'int64', 'REAL': 'float64', 'TEXT': 'string'}
+
+    def __init__(self, path):
+        self.pa, self.pq = import_pyarrow("El snapshot de la BD en formato parquet")
+        self.path = path
+        os.makedirs(path)
+        self.writers = {}
+
+    def create_table(self, table_name, columns, types):
+        schema = self.pa.schema([(column, getattr(self.pa, self.ARROW_TYPES[t])()) for column, t in zip(columns, types)])
+        self.writers[table_name] = self.pq.ParquetWriter(os.path.join(self.path, f"{table_name}.parquet"), schema)
+
+    def write_rows(self, table_name, columns, rows):
+        writer = self.writers[table_name]
+        data = {column: [row[i] for row in rows] for i, column in enumerate(columns)}
+        writer.write_table(self.pa.Table.from_pydict(data, schema=writer.schema))
+
+    def drop_table(self, table_name):
+        writer = self.writers.pop(table_name, None)
+        if writer is not None:
+            writer.close()
+            os.remove(os.path.join(self.path, f"{table_name}.parquet"))
+
+    def close(self, manifest):
+        for writer in self.writers.values():
+            writer.close()
+        with open(os.path.join(self.path, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, indent=2, ensure_ascii=False)
+
+    def discard(self):
+        for writer in self.writers.values():
+            writer.close()
+
+
+SNAPSHOT_WRITERS = {'sqlite': _SQLiteSnapshotWriter, 'parquet': _ParquetSnapshotWriter}
+
+
+def create_snapshot(backend, snapshot_path, tables, batt_dept_ids, start_datetime, snapshot_format='sqlite', logger=None):
+    """
+    Exportar las tablas desde el backend conectado a snapshot_path con los filtros dados. Las tablas que no existen en la BD (o no
+    tienen las columnas de filtro) se omiten con una advertencia. El snapshot se escribe primero en una
+    ruta temporal y reemplaza al anterior solo si la exportación termina. Retorna el manifiesto.
+    """
+    if snapshot_format not in SNAPSHOT_WRITERS:
+        raise ValueError(f"Formato de snapshot no soportado: '{snapshot_format}' (opciones: {', '.join(SNAPSHOT_WRITERS)})")
+
+    tmp_path = snapshot_path + '.tmp'
+    _remove_path(tmp_path)
+    writer = SNAPSHOT_WRITERS[snapshot_format](tmp_path)
+    table_rows = {}
+    table_columns = {}
+
+    try:
+        for table_name in tables:
+            query, uses_datetime = _export_query(table_name)
+            params = (list(batt_dept_ids), start_datetime) if uses_datetime else (list(batt_dept_ids),)
+
+            batches = None
+            try:
+                description, batches = backend.stream(query, params)
+                columns = [column[0] for column in description]
+                types = None
+                count = 0
+                for rows in batches:
+                    if types is None:
+                        types = _column_types(description, rows)
+                        writer.create_table(table_name, columns, types)
+                    writer.write_rows(table_name, columns, [
+                        tuple(_convert_value(value, column_type) for value, column_type in zip(row, types)) for row in rows
+                    ])
+                    count += len(rows)
+                if types is None:
+                    writer.create_table(table_name, columns, _column_types(description, []))
+            except Exception as e:
+                if batches is not None:
+                    batches.close()
+                writer.drop_table(table_name)
+                if logger:
+                    logger.warning(f"⚠️ Tabla {table_name} omitida del snapshot: {e}")
+                continue
+
+            table_rows[table_name] = count
+            table_columns[table_name] = columns
+            if logger:
+                logger.info(f"📦 {table_name}: {count} registros exportados")
+
+        manifest = {
+            'creado': datetime.now().isoformat(),
+            'origen': backend.describe(),
+            'batt_dept_ids': list(batt_dept_ids),
+            'start_datetime': start_datetime,
+            'tablas': table_rows,
+            'columnas': table_columns,
+        }
+        writer.close(manifest)
+    except BaseException:
+        writer.discard()
+        _remove_path(tmp_path)
+        raise
+
+    _remove_path(snapshot_path)
+    os.replace(tmp_path, snapshot_path)
+    return manifest
+
+
+def create_indexes(conn, tables):
+    """Crear los índices de las búsquedas del comparador sobre las columnas que existan en cada tabla."""
+    for table_name in tables:
+        existing = {row[1] for row in conn.execute(f"PRAGMA table_info({_quote(table_name)})")}
+        for columns in SNAPSHOT_INDEXES.get(table_name, DEFAULT_INDEXES):
+            if all(column in existing for column in columns):
+                index_name = f"idx_{table_name}_{'_'.join(columns)}"
+                conn.execute(f"CREATE INDEX IF NOT EXISTS {_quote(index_name)} ON {_quote(table_name)} ({', '.join(map(_quote, columns))})")
+
+
+def connect_snapshot(snapshot_path):
+    """
+    Abrir un snapshot: un archivo SQLite, o una carpeta Parquet que se carga en una base SQLite en memoria.
+    Retorna (backend SQLite conectado, manifiesto).
+    """
+    if os.path.isdir(snapshot_path):
+        conn = _load_parquet_snapshot(snapshot_path)
+        with open(os.path.join(snapshot_path, MANIFEST_FILE), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    elif os.path.isfile(snapshot_path):
+        conn = sqlite3.connect(snapshot_path, check_same_thread=False)
+        try:
+            manifest = {key: json.loads(value) for key, value in conn.execute(f"SELECT clave, valor FROM {MANIFEST_TABLE}")}
+        except sqlite3.DatabaseError:
+            conn.close()
+            raise ValueError(f"{snapshot_path} no es un snapshot de la BD del comparador")
+    else:
+        raise FileNotFoundError(f"No existe el snapshot: {snapshot_path}")
+
+    return SQLiteBackend(snapshot_path, conn), manifest
+
+
+def _load_parquet_snapshot(snapshot_path):
+    """Cargar los archivos Parquet del snapshot en una base SQLite en memoria, con sus índices."""
+    pa, pq = import_pyarrow("El snapshot de la BD en formato parquet")
+
+    # La conexión puede usarse desde el hilo de consultas del comparador async (una sola a la vez)
+    conn = sqlite3.connect(':memory:', check_same_thread=False)
+    tables = []
+    for file_name in sorted(os.listdir(snapshot_path)):
+        if not file_name.endswith('.parquet'):
+            continue
+        table_name = file_name[:-len('.parquet')]
+        parquet_file = pq.ParquetFile(os.path.join(snapshot_path, file_name))
+        types = []
+        for field in parquet_file.schema_arrow:
+            if pa.types.is_integer(field.type):
+                types.append('INTEGER')
+            elif pa.types.is_floating(field.type):
+                types.append('REAL')
+            else:
+                types.append('TEXT')
+        columns = parquet_file.schema_arrow.names
+        conn.execute(f"CREATE TABLE {_quote(table_name)} ({', '.join(f'{_quote(c)} {t}' for c, t in zip(columns, types))})")
+        placeholders = ', '.join('?' * len(columns))
+        for batch in parquet_file.iter_batches(batch_size=FETCH_SIZE):
+            conn.executemany(f"INSERT INTO {_quote(table_name)} VALUES ({placeholders})",
+                             zip(*(batch.column(i).to_pylist() for i in range(len(columns)))))
+        tables.append(table_name)
+
+    create_indexes(conn, tables)
+    conn.commit()
+    return conn
+
+
+def _remove_path(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,99 @@
+"""
+Caché persistente de la extracción de los XML.
+
+Guarda, por (hash del contenido del XML, hash del plan de extracción), los registros que produjo el archivo:
+identificadores y valor de cada mapeo, uno por bloque en los archivos con varios bloques. Al volver a comparar
+la misma carpeta (por ejemplo, después de corregir datos en la BD) los archivos sin cambios no se parsean ni se
+evalúan sus XPath: solo se consulta la BD y se compara. El hash del plan cambia con el mapeo, el motor de
+extracción, el delimitador de bloques o la versión del comparador, así que nunca se usan valores extraídos
+con otro plan.
+
+Los registros se guardan en una base SQLite como JSON comprimido con zlib (ventana de 4 KB: los registros son
+chicos y con la ventana por defecto preparar el compresor cuesta más que comprimir). La base se puede usar desde los
+procesos worker y desde el hilo de extracción del comparador async: cada proceso abre su propia conexión y las
+escrituras se serializan con el bloqueo de SQLite (modo WAL).
+"""
+import json
+import os
+import sqlite3
+import threading
+import zlib
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS extracciones (
+    xml_hash TEXT NOT NULL,
+    plan_hash TEXT NOT NULL,
+    registros BLOB NOT NULL,
+    creado TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (xml_hash, plan_hash)
+)
+"""
+
+
+def _compress(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 12, 4)
+    return compressor.compress(data) + compressor.flush()
+
+
+class ExtractionCache:
+    """Registros extraídos de cada XML, por hash del contenido, para un plan de extracción (plan_hash)."""
+
+    def __init__(self, path, plan_hash):
+        self.path = path
+        self.plan_hash = plan_hash
+        self._connection = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_connection'] = None
+        state['_lock'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _db(self):
+        if self._connection is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(SCHEMA)
+            connection.commit()
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    def get(self, xml_hash, xml_file):
+        """
+        Registros guardados del XML con contenido xml_hash, como tuplas (registro, identificadores, valores, None)
+        con los nombres de registro para xml_file. Retorna None si el archivo no está en la caché.
+        """
+        with self._lock:
+            row = self._db().execute(
+                "SELECT registros FROM extracciones WHERE xml_hash = ? AND plan_hash = ?", (xml_hash, self.plan_hash)
+            ).fetchone()
+        if row is None:
+            return None
+        return [(xml_file + suffix, identifiers, tuple(values), None)
+                for suffix, identifiers, values in json.loads(zlib.decompress(row[0]).decode('utf-8'))]
+
+    def put(self, xml_hash, xml_file, records):
+        """Guardar los registros de xml_file; los nombres se guardan relativos al archivo ('' o '[n]')."""
+        stored = [[record_name[len(xml_file):], identifiers, list(values)] for record_name, identifiers, values, _ in records]
+        data = _compress(json.dumps(stored, ensure_ascii=False).encode('utf-8'))
+        with self._lock:
+            connection = self._db()
+            connection.execute(
+                "INSERT OR REPLACE INTO extracciones (xml_hash, plan_hash, registros) VALUES (?, ?, ?)",
+                (xml_hash, self.plan_hash, sqlite3.Binary(data))
+            )
+            connection.commit()
+
+    def close(self):
+        if self._connection is not None and self._pid == os.getpid():
+            self._connection.close()
+        self._connection = None
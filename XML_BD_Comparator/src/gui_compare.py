@@ -265,7 +265,11 @@ class ComparadorXMLGUI:
             
             # Crear comparador
             comparator = XPathMapper(self.config_path, self.mapping_path)
-            
+
+            # Informar los mapeos que no se pudieron compilar
+            if comparator.rejected_mappings:
+                self.log_message(f"⚠️ {len(comparator.rejected_mappings)} mapeos rechazados al compilar (ver log para detalles)")
+
             # Conectar a BD
             self.log_message("Conectando a la base de datos...")
             if not comparator.connect_to_db():
@@ -276,9 +280,18 @@ class ComparadorXMLGUI:
                 )
                 return
             
+            # Ofrecer reanudar una ejecución interrumpida de esta carpeta
+            resume = False
+            if comparator.has_checkpoint(self.xml_folder):
+                resume = messagebox.askyesno(
+                    "Ejecución interrumpida",
+                    "Hay una comparación interrumpida para esta carpeta.\n\n"
+                    "¿Deseas reanudarla desde donde quedó?"
+                )
+            
             # Procesar los XMLs
             self.log_message(f"Procesando archivos XML en: {self.xml_folder}")
-            report_path = comparator.compare_xml_with_db(self.xml_folder)
+            report_path = comparator.compare_xml_with_db(self.xml_folder, resume=resume)
             
             # Cerrar conexión
             comparator.close_db_connection()
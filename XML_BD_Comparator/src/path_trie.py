@@ -0,0 +1,136 @@
+"""
+Extracción en una sola pasada de las rutas simples del mapeo.
+
+Las rutas sin predicados ni funciones ('//Incident/Location/City', '/Export/Data/Id') se compilan en un
+único trie de tags recorrido desde la hoja hacia la raíz, y un solo etree.iterparse del documento junta
+el valor del primer elemento (en orden del documento) de cada ruta, en vez de una búsqueda '//' por
+mapeo sobre el árbol completo. Los tags se comparan en minúsculas para registrar también las variantes
+de mayúsculas/minúsculas de cada ruta presentes en el documento, que usa el respaldo case-insensitive.
+Si no hace falta el árbol para ninguna otra expresión, los elementos se liberan a medida que se leen.
+"""
+import re
+from lxml import etree
+
+# Ruta simple: '/' o '//' seguido de nombres de elementos separados por '/'
+SIMPLE_PATH_PATTERN = re.compile(r'^(//?)([A-Za-z_][\w.\-]*(?:/[A-Za-z_][\w.\-]*)*)$')
+
+
+def parse_simple_path(xpath):
+    """(absoluta, tags) de una ruta simple, o None si el XPath necesita el motor XPath."""
+    match = SIMPLE_PATH_PATTERN.match(xpath.strip()) if xpath else None
+    if not match:
+        return None
+    return match.group(1) == '/', tuple(match.group(2).split('/'))
+
+
+def iterparse_events(source, recover=False):
+    """
+    Lectura por streaming de un XML con los eventos 'start' y 'end' que recorren PathTrie.scan y
+    xml_blocks.iter_blocks. Con recover=True se toleran los errores de formato, que quedan en su error_log.
+    """
+    return etree.iterparse(source, events=('start', 'end'), recover=recover)
+
+
+def path_variant(absolute, tags):
+    """Clave de una variante de ruta: los tags reales unidos por '/', con '/' inicial si es absoluta."""
+    return ('/' if absolute else '') + '/'.join(tags)
+
+
+class PathTrie:
+    """
+    Trie de las rutas simples, con los tags en minúsculas desde el último hacia el primero. Cada nodo es
+    (hijos, rutas que terminan ahí); un elemento coincide con una ruta si sus ancestros recorren el trie
+    hasta un nodo con esa ruta (y, si la ruta es absoluta, llegan a la raíz del documento).
+    """
+
+    def __init__(self, xpaths):
+        self.paths = {}
+        self._root = {}
+        for xpath in xpaths:
+            parsed = parse_simple_path(xpath)
+            if parsed is None or xpath in self.paths:
+                continue
+            self.paths[xpath] = parsed
+            absolute, tags = parsed
+            children, node = self._root, None
+            for tag in reversed(tags):
+                node = children.setdefault(tag.lower(), ({}, []))
+                children = node[0]
+            node[1].append((xpath, absolute))
+        # Tags en minúsculas que cierran alguna ruta: los demás elementos no se comparan
+        self.leaf_tags = set(self._root)
+
+    def __len__(self):
+        return len(self.paths)
+
+    def scan(self, source, element_value, keep_tree=True):
+        """
+        Recorrer el documento una sola vez. Retorna (raíz, coincidencias), con coincidencias
+        {xpath: {variante: valor}}: para cada variante real de la ruta encontrada en el documento (en orden
+        de aparición), element_value del primer elemento que la cumple. keep_tree=False libera cada elemento
+        al cerrarlo (salvo los que contienen un valor pendiente) y la raíz retornada queda vacía.
+        source también puede ser un elemento ya parseado (se recorre su árbol sin liberarlo) o un iterparse_events
+        ya abierto, por ejemplo con recover=True, para leer después su error_log.
+        """
+        matches = {xpath: {} for xpath in self.paths}
+        pending = {}
+        real_tags = []
+        lower_tags = []
+        root = None
+
+        if isinstance(source, etree._Element):
+            events = etree.iterwalk(source, events=('start', 'end'))
+            keep_tree = True
+        else:
+            events = source if isinstance(source, etree.iterparse) else iterparse_events(source)
+
+        for event, element in events:
+            if event == 'start':
+                if root is None:
+                    root = element
+                tag = element.tag
+                real_tags.append(tag)
+                lower_tags.append(tag.lower() if isinstance(tag, str) else tag)
+                if lower_tags[-1] in self.leaf_tags:
+                    found = self._match(real_tags, lower_tags, matches)
+                    if found:
+                        pending[element] = found
+                continue
+
+            found = pending.pop(element, None)
+            if found:
+                value = element_value(element)
+                for xpath, variant in found:
+                    matches[xpath][variant] = value
+            real_tags.pop()
+            lower_tags.pop()
+
+            # El valor de un ancestro pendiente puede necesitar el texto de sus descendientes
+            if not keep_tree and not pending and element is not root:
+                element.clear()
+                parent = element.getparent()
+                while element.getprevious() is not None:
+                    del parent[0]
+
+        return root, matches
+
+    def _match(self, real_tags, lower_tags, matches):
+        """Rutas que cumple el elemento que se acaba de abrir y cuya variante todavía no tiene elemento."""
+        found = []
+        level = len(lower_tags) - 1
+        node = self._root.get(lower_tags[level])
+        while node is not None:
+            for xpath, absolute in node[1]:
+                if absolute and level != 0:
+                    continue
+                variant = path_variant(absolute, real_tags[level:])
+                variants = matches[xpath]
+                if variant not in variants:
+                    # Reservar el lugar en orden de aparición; el valor se completa al cerrar el elemento
+                    variants[variant] = None
+                    found.append((xpath, variant))
+            level -= 1
+            if level < 0:
+                break
+            node = node[0].get(lower_tags[level])
+        return found
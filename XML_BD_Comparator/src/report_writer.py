@@ -0,0 +1,293 @@
+"""
+Escritura del reporte de comparación por streaming.
+
+Las filas se escriben a medida que termina cada archivo XML y la hoja de resumen se arma con
+contadores acumulados, sin mantener todos los resultados en memoria.
+"""
+import csv
+import json
+import os
+import openpyxl
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.formatting.rule import FormulaRule
+from openpyxl.styles import Font, PatternFill
+from openpyxl.utils import get_column_letter
+
+# Columnas del reporte, en el orden en que se escriben
+REPORT_COLUMNS = ['archivo', 'tabla', 'campo', 'xpath', 'valor_xml', 'valor_bd', 'coincide', 'observaciones']
+
+
+class ReportWriter:
+    """Base de los escritores de reporte: lleva los contadores del resumen mientras se escriben las filas."""
+
+    extension = None
+
+    def __init__(self, report_path):
+        self.report_path = report_path
+        self.total_comparaciones = 0
+        self.coincidencias = 0
+        self.errores = 0
+
+    def write_rows(self, rows):
+        """Agregar al reporte las filas de un archivo y actualizar los contadores."""
+        for row in rows:
+            self.total_comparaciones += 1
+            if row['coincide']:
+                self.coincidencias += 1
+            if 'ERROR' in str(row['valor_xml']) or 'ERROR' in str(row['valor_bd']):
+                self.errores += 1
+            self._write_row([row.get(column) for column in REPORT_COLUMNS])
+
+    def summary_rows(self):
+        """Filas (métrica, valor) de la hoja de resumen."""
+        total = self.total_comparaciones
+        return [
+            ('Total de comparaciones', total),
+            ('Coincidencias', self.coincidencias),
+            ('Diferencias', total - self.coincidencias - self.errores),
+            ('Errores', self.errores),
+            ('Porcentaje de coincidencias', f"{(self.coincidencias/total*100):.2f}%" if total > 0 else "0%"),
+        ]
+
+    def summary(self):
+        """Resumen como diccionario (para los formatos sin hoja de resumen)."""
+        return {metric: value for metric, value in self.summary_rows()}
+
+    def _write_summary_file(self, performance=None):
+        """
+        Guardar el resumen junto al reporte como <reporte>_resumen.json y, si se midió,
+        el rendimiento como <reporte>_rendimiento.json.
+        """
+        base_path = os.path.splitext(self.report_path)[0]
+        with open(base_path + '_resumen.json', 'w', encoding='utf-8') as f:
+            json.dump(self.summary(), f, indent=2, ensure_ascii=False)
+        
+        if performance is not None:
+            with open(base_path + '_rendimiento.json', 'w', encoding='utf-8') as f:
+                json.dump(performance, f, indent=2, ensure_ascii=False)
+
+    def _write_row(self, values):
+        raise NotImplementedError
+
+    def close(self, performance=None):
+        """
+        Terminar el reporte y devolver su ruta. performance: resumen de rendimiento de la
+        ejecución (XPathMapper.performance_summary()) para agregarlo al reporte.
+        """
+        raise NotImplementedError
+
+    def discard(self):
+        """Liberar los recursos de un reporte que no se va a terminar (ejecución interrumpida)."""
+        raise NotImplementedError
+
+
+class ExcelReportWriter(ReportWriter):
+    """
+    Reporte Excel en modo write-only de openpyxl: las filas se vuelcan a disco al agregarlas.
+    Los colores de 'observaciones' se definen como reglas de formato condicional sobre la columna
+    en lugar de pintar celda por celda.
+    """
+
+    # (texto buscado en observaciones, color); se aplica la primera regla que coincide
+    COLOR_RULES = [
+        ('coinciden', 'C6EFCE'),   # Verde claro - coincidencias
+        ('error', 'FFEB9C'),       # Amarillo claro - errores
+        ('diferentes', 'FFC7CE'),  # Rojo claro - diferencias
+        ('nulo', 'BDD7EE'),        # Azul claro - valores nulos
+    ]
+
+    extension = 'xlsx'
+
+    def __init__(self, report_path):
+        super().__init__(report_path)
+        self.workbook = openpyxl.Workbook(write_only=True)
+        self.worksheet = self.workbook.create_sheet('Resultados')
+        self._append_header(self.worksheet, REPORT_COLUMNS)
+
+    def _append_header(self, worksheet, headers):
+        header_cells = []
+        for header in headers:
+            cell = WriteOnlyCell(worksheet, value=header)
+            cell.font = Font(bold=True)
+            header_cells.append(cell)
+        worksheet.append(header_cells)
+
+    def _write_row(self, values):
+        self.worksheet.append(values)
+
+    def _add_color_rules(self):
+        """Formato condicional de la columna 'observaciones' según su contenido."""
+        if self.total_comparaciones == 0:
+            return
+
+        column = get_column_letter(REPORT_COLUMNS.index('observaciones') + 1)
+        cell_range = f"{column}2:{column}{self.total_comparaciones + 1}"
+
+        for text, color in self.COLOR_RULES:
+            fill = PatternFill(start_color=color, end_color=color, fill_type='solid')
+            rule = FormulaRule(formula=[f'ISNUMBER(SEARCH("{text}",{column}2))'], fill=fill, stopIfTrue=True)
+            self.worksheet.conditional_formatting.add(cell_range, rule)
+
+    def close(self, performance=None):
+        """Agregar las reglas de color, la hoja de resumen y la de rendimiento, y guardar el archivo."""
+        self._add_color_rules()
+
+        resumen = self.workbook.create_sheet('Resumen')
+        self._append_header(resumen, ['Métrica', 'Valor'])
+        for metric, value in self.summary_rows():
+            resumen.append([metric, value])
+
+        if performance is not None:
+            self._add_performance_sheet(performance)
+
+        self.workbook.save(self.report_path)
+        return self.report_path
+
+    def _add_performance_sheet(self, performance):
+        """Hoja 'Rendimiento': tiempo por etapa, mapeos más costosos y consultas más lentas."""
+        worksheet = self.workbook.create_sheet('Rendimiento')
+
+        sections = [
+            ('etapas', ['etapa', 'segundos', 'veces', 'promedio_ms']),
+            ('mapeos_mas_lentos', ['tabla', 'campo', 'xpath', 'segundos', 'veces', 'promedio_ms', 'max_ms']),
+            ('consultas_mas_lentas', ['tabla', 'segundos', 'consulta']),
+        ]
+        for i, (section, columns) in enumerate(sections):
+            if i:
+                worksheet.append([])
+            self._append_header(worksheet, [section])
+            self._append_header(worksheet, columns)
+            for row in performance.get(section, []):
+                worksheet.append([row.get(column) for column in columns])
+
+    def discard(self):
+        # openpyxl no tiene una API pública para descartar una hoja en streaming: guardar el libro cierra la hoja
+        # y borra su archivo temporal, y después se elimina el reporte incompleto
+        try:
+            self.workbook.save(self.report_path)
+        finally:
+            if os.path.exists(self.report_path):
+                os.remove(self.report_path)
+
+
+class CsvReportWriter(ReportWriter):
+    """Reporte CSV (UTF-8): cada archivo procesado agrega sus filas al final del archivo."""
+
+    extension = 'csv'
+
+    def __init__(self, report_path):
+        super().__init__(report_path)
+        self.file = open(report_path, 'w', encoding='utf-8', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(REPORT_COLUMNS)
+
+    def _write_row(self, values):
+        self.writer.writerow(values)
+
+    def close(self, performance=None):
+        self.file.close()
+        self._write_summary_file(performance)
+        return self.report_path
+
+    def discard(self):
+        self.file.close()
+
+
+class JsonlReportWriter(ReportWriter):
+    """Reporte JSONL: un objeto JSON por comparación y por línea."""
+
+    extension = 'jsonl'
+
+    def __init__(self, report_path):
+        super().__init__(report_path)
+        self.file = open(report_path, 'w', encoding='utf-8')
+
+    def _write_row(self, values):
+        self.file.write(json.dumps(dict(zip(REPORT_COLUMNS, values)), ensure_ascii=False, default=str))
+        self.file.write('\n')
+
+    def close(self, performance=None):
+        self.file.close()
+        self._write_summary_file(performance)
+        return self.report_path
+
+    def discard(self):
+        self.file.close()
+
+
+class ParquetReportWriter(ReportWriter):
+    """
+    Reporte Parquet con columnas tipadas (texto y 'coincide' booleano). Las filas se acumulan en
+    bloques de chunk_size y cada bloque se escribe como un row group. Requiere pyarrow.
+    """
+
+    extension = 'parquet'
+
+    def __init__(self, report_path, chunk_size=50000):
+        super().__init__(report_path)
+        pa, pq = import_pyarrow()
+        self._pa = pa
+        self.schema = pa.schema([
+            (column, pa.bool_() if column == 'coincide' else pa.string())
+            for column in REPORT_COLUMNS
+        ])
+        self.writer = pq.ParquetWriter(report_path, self.schema)
+        self.chunk_size = chunk_size
+        self._chunk = {column: [] for column in REPORT_COLUMNS}
+        self._chunk_rows = 0
+
+    def _write_row(self, values):
+        for column, value in zip(REPORT_COLUMNS, values):
+            if column == 'coincide':
+                self._chunk[column].append(bool(value))
+            else:
+                self._chunk[column].append(None if value is None else str(value))
+        self._chunk_rows += 1
+        if self._chunk_rows >= self.chunk_size:
+            self._flush()
+
+    def _flush(self):
+        if self._chunk_rows:
+            self.writer.write_table(self._pa.Table.from_pydict(self._chunk, schema=self.schema))
+            self._chunk = {column: [] for column in REPORT_COLUMNS}
+            self._chunk_rows = 0
+
+    def close(self, performance=None):
+        self._flush()
+        self.writer.close()
+        self._write_summary_file(performance)
+        return self.report_path
+
+    def discard(self):
+        self.writer.close()
+
+
+def import_pyarrow(feature="El formato de reporte 'parquet'"):
+    """
+    Importar pyarrow y pyarrow.parquet. pyarrow es opcional: solo lo necesitan el reporte y el snapshot de la BD
+    en formato parquet; feature describe cuál de ellos lo pide, para el mensaje de error si no está instalado.
+    """
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError(f"{feature} requiere pyarrow (pip install pyarrow)")
+    return pyarrow, pyarrow.parquet
+
+
+REPORT_WRITERS = {
+    writer_class.extension: writer_class
+    for writer_class in (ExcelReportWriter, CsvReportWriter, JsonlReportWriter, ParquetReportWriter)
+}
+
+
+def get_report_writer_class(output_format):
+    """Clase de escritor para un formato de reporte ('xlsx', 'csv', 'jsonl' o 'parquet')."""
+    output_format = (output_format or 'xlsx').lower().lstrip('.')
+    if output_format == 'excel':
+        output_format = 'xlsx'
+    if output_format not in REPORT_WRITERS:
+        raise ValueError(f"Formato de reporte no soportado: '{output_format}' (opciones: {', '.join(REPORT_WRITERS)})")
+    if output_format == 'parquet':
+        import_pyarrow()
+    return REPORT_WRITERS[output_format]
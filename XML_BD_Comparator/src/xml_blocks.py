@@ -0,0 +1,77 @@
+"""
+División por streaming de los XML que agrupan varios incidentes en un solo archivo.
+
+Con processing.is_multiple_blocks_file, cada elemento que cumple processing.multiple_blocks_delimiter_xpath
+(una ruta simple, como en las plantillas de integración JSON) es un bloque: un registro propio. El archivo
+se lee con etree.iterparse y cada bloque se entrega como un documento aparte con sus ancestros y los
+elementos que lo preceden fuera de los bloques (encabezado del lote), para que los XPath absolutos y '//'
+del mapeo se evalúen igual que sobre un archivo de un solo incidente. Los bloques ya entregados se liberan,
+así que la memoria no crece con la cantidad de incidentes del archivo.
+"""
+import copy
+from lxml import etree
+
+from path_trie import iterparse_events
+
+
+def iter_blocks(source, delimiter):
+    """
+    Generar (número, documento) por cada bloque de source, con número desde 1 y documento la raíz de
+    una copia que contiene solo ese bloque. delimiter: (absoluta, tags) de path_trie.parse_simple_path. Un bloque
+    dentro de otro no se separa. Si no hay ningún bloque, se genera (0, raíz) con el documento completo.
+    source puede ser un iterparse_events ya abierto (por ejemplo con recover=True) para leer después su error_log.
+    """
+    absolute, tags = delimiter[0], list(delimiter[1])
+    depth = len(tags)
+    path = []
+    block = None
+    previous_block = None
+    root = None
+    count = 0
+
+    events = source if isinstance(source, etree.iterparse) else iterparse_events(source)
+    for event, element in events:
+        if event == 'start':
+            if root is None:
+                root = element
+            path.append(element.tag)
+            if block is None and path[-depth:] == tags and (not absolute or len(path) == depth):
+                block = element
+            continue
+
+        path.pop()
+        if element is not block:
+            continue
+
+        # El bloque anterior ya se entregó: sacarlo del árbol antes de copiar el documento
+        if previous_block is not None:
+            previous_block.getparent().remove(previous_block)
+        count += 1
+        yield count, _block_document(block)
+        block.clear()
+        previous_block = block
+        block = None
+
+    if count == 0 and root is not None:
+        yield 0, root
+
+
+def _block_document(block):
+    """
+    Copia del documento hasta el bloque: sus ancestros con los hijos que lo preceden y el bloque. iterparse
+    puede haber leído más allá del bloque, así que lo que viene después no se copia.
+    """
+    document = copy.deepcopy(block)
+    document.tail = None
+    node = block
+    parent = node.getparent()
+    while parent is not None:
+        parent_copy = etree.Element(parent.tag, parent.attrib, nsmap=parent.nsmap)
+        parent_copy.text = parent.text
+        for child in parent:
+            if child is node:
+                break
+            parent_copy.append(copy.deepcopy(child))
+        parent_copy.append(document)
+        document, node, parent = parent_copy, parent, parent.getparent()
+    return document
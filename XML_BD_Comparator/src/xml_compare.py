@@ -1,55 +1,288 @@
 import pandas as pd
-import openpyxl
-from openpyxl.styles import PatternFill
 from lxml import etree
-import psycopg2
 import logging
-from datetime import datetime
+import logging.handlers
+import asyncio
+import atexit
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
 import os
 import json
+import heapq
+import itertools
+import multiprocessing
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from report_writer import get_report_writer_class
+from db_backend import ConnectionPool, create_async_pool, create_backend
+from db_snapshot import connect_snapshot, create_snapshot, snapshot_tables
+from path_trie import PathTrie, iterparse_events, parse_simple_path, path_variant
+from xslt_extraction import XsltExtractor
+from xml_blocks import iter_blocks
+from xml_input import open_xml_input
+from extraction_cache import ExtractionCache
+
+# Nivel de los mensajes de resumen (uno por archivo y por ejecución); el perfil 'quiet' registra solo estos
+SUMMARY_LEVEL = 25
+logging.addLevelName(SUMMARY_LEVEL, 'RESUMEN')
+# Perfiles de log (logging.profile en la configuración)
+LOG_PROFILES = {'debug': logging.DEBUG, 'normal': logging.INFO, 'quiet': SUMMARY_LEVEL}
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Log del proceso actual: (pid, archivo de log, QueueListener); se instala una sola vez por proceso
+_log_state = None
+
+
+def _install_log_handlers():
+    """
+    Instalar el handler del logger 'XPathMapper' una sola vez por proceso: los mensajes se encolan
+    (QueueHandler) y un hilo en segundo plano (QueueListener) los escribe en logs/comparison_<fecha>.log,
+    así la comparación no espera la escritura a disco. Retorna la ruta del archivo de log.
+    """
+    global _log_state
+    if _log_state is not None and _log_state[0] == os.getpid():
+        return _log_state[1]
+    
+    logger = logging.getLogger('XPathMapper')
+    # Un proceso creado con fork hereda los handlers del padre, pero no el hilo que vacía su cola
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    
+    # Crear el directorio de logs si no existe
+    logs_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'logs')
+    os.makedirs(logs_dir, exist_ok=True)
+    
+    # Crear el archivo de log con la fecha actual
+    log_file = os.path.join(logs_dir, f'comparison_{datetime.now().strftime("%Y%m%d_%H%M%S")}.log')
+    # Configurar FileHandler con encoding UTF-8 para soportar emojis
+    file_handler = logging.FileHandler(log_file, encoding='utf-8')
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(log_queue, file_handler)
+    listener.start()
+    # Al terminar el proceso, escribir los mensajes pendientes y cerrar el archivo
+    atexit.register(listener.stop)
+    
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    _log_state = (os.getpid(), log_file, listener)
+    return log_file
+
 
 class XPathMapper:
+    # Patrones de XPath condicionales que se evalúan manualmente cuando el XPath directo no devuelve valor
+    CONTAINS_CONDITION_PATTERN = r'(.+?)\[contains\(([^,]+),\s*[\'"]([^\'\"]+)[\'"]\)\]/(.+)'
+    COMPARISON_CONDITION_PATTERN = r'(.+?)\[([^=!<>]+)\s*(=|!=|>|<|>=|<=)\s*[\'"]([^\'\"]+)[\'"]\]/(.+)'
+    # Versión del comparador: incrementarla cuando cambie la forma de resolver los mapeos (invalida la caché de planes)
+    COMPARATOR_VERSION = '1.2'
+    # Cantidad de consultas más lentas y de mapeos más costosos que se informan en el rendimiento
+    SLOWEST_ENTRIES = 20
+    # Archivos por bloque entre la extracción y la BD: se verifican con una consulta en bloque y sus consultas
+    # por archivo se hacen mientras se extrae el bloque siguiente
+    COMPARE_CHUNK_SIZE = 1000
+    # Etapas medidas, en el orden en que se informan
+    PERFORMANCE_STAGES = [
+        'carga_mapeo', 'esquema_bd', 'cache_extraccion', 'parseo_xml', 'transformacion_xslt', 'identificadores', 'xpath_mapeos', 'extraccion',
+        'verificacion_bd', 'consultas_bd', 'comparacion', 'escritura_reporte', 'checkpoint', 'cierre_reporte', 'total'
+    ]
+    # Verificación por archivo: el identificador del XML en dispatch.xref_id y en nfirs_notification.dispatch_number
+    # (parámetros: batt_dept_ids, start_datetime y el valor del XML, para cada tabla)
+    VERIFY_RECORD_QUERY = """(
+                SELECT 'dispatch' as tabla_encontrada, xref_id FROM dispatch d 
+                WHERE d.batt_dept_id = ANY(%s)
+                AND d.created_at >= %s
+                AND d.xref_id = %s
+                LIMIT 1
+            ) UNION (
+                SELECT 'nfirs_notification' as tabla_encontrada, dispatch_number FROM nfirs_notification n 
+                WHERE n.batt_dept_id = ANY(%s)
+                AND n.created_at >= %s
+                AND n.dispatch_number = %s
+                LIMIT 1
+            )"""
+    # Verificación en bloque: los identificadores de un lote en dispatch.xref_id y en nfirs_notification.dispatch_number
+    # (parámetros: batt_dept_ids, start_datetime y la lista de valores, para cada tabla)
+    BULK_VERIFY_QUERY = """
+                SELECT 'dispatch' AS tabla_encontrada, d.xref_id FROM dispatch d
+                WHERE d.batt_dept_id = ANY(%s)
+                AND d.created_at >= %s
+                AND d.xref_id = ANY(%s)
+                UNION
+                SELECT 'nfirs_notification' AS tabla_encontrada, n.dispatch_number FROM nfirs_notification n
+                WHERE n.batt_dept_id = ANY(%s)
+                AND n.created_at >= %s
+                AND n.dispatch_number = ANY(%s)
+            """
+    # Columnas de narrativas y comentarios, que se concatenan con su propia lógica
+    NARRATIVE_COLUMNS = ['call_notes', 'narratives', 'narrative', 'comment1', 'comment', 'comments']
+    # Rutas comunes de los identificadores cuando el mapeo no los incluye, en orden de prioridad
+    COMMON_IDENTIFIER_XPATHS = {
+        'xref_id': [
+            '//XRefId',
+            '//xref_id', 
+            '//Xref_Id',
+            '//CADMasterCallTable/CADActiveCallTable/RelatedRecordNumber',
+            '//MasterIncidentNumber',
+            '//DispatchID'
+        ],
+        'dispatch_number': [
+            '//DispatchNumber',
+            '//FirstDueExport/NFIRSData/DispatchNumber',  # Específico para FirstDueExport
+            '//FirstDueExport/NfirsData/DispatchNumber',   # Fallback case-insensitive
+            '//dispatch_number',
+            '//CallNumber',
+            '//IncidentNumber',
+            '//CADNumber'
+        ],
+        'incident_number': [
+            '//IncidentNumber',
+            '//incident_number',
+            '//RunNumber',
+            '//CallNumber'
+        ]
+    }
+    # Reglas WHEN condición = 'valor' THEN 'a' ELSE 'b' (status_code)
+    WHEN_THEN_ELSE_PATTERN = r'WHEN\s+(.+?)\s*=\s*[\'"]([^\'\"]+)[\'"]\s+THEN\s+[\'"]([^\'\"]+)[\'"]\s+ELSE\s+[\'"]([^\'\"]+)[\'"]'
+    # Notas de las celdas de mapeo que no son parte de la ruta: '[target agency]', '[ORDER BY ...]', '(see mappings)'
+    MAPPING_NOTE_PATTERN = r'\[[^\[\]]*\]|\([^()]*\)'
+    # Cláusulas descriptivas que siguen a la ruta ('<A> <B> WHERE <C> = ...'): sus elementos no son pasos de la ruta
+    MAPPING_CLAUSE_PATTERN = r'\b(?:WHERE|ORDER\s+BY|SELECT\s+TOP)\b'
+    # Categorías de los tipos de columna del esquema de la BD (PostgreSQL o SQLite) que se comparan por valor
+    COLUMN_TYPE_CATEGORIES = [
+        ('fecha_hora', r'^(?:timestamp|datetime)\b'),
+        ('fecha', r'^date$'),
+        ('booleano', r'^bool(?:ean)?$'),
+        ('numerico', r'^(?:smallint|integer|bigint|tinyint|mediumint|int\d*|numeric|decimal|real|double(?: precision)?|float\d*)\b'),
+    ]
+    BOOLEAN_TEXT_VALUES = {
+        'true': 'true', 't': 'true', 'yes': 'true', 'y': 'true', 'si': 'true', 'sí': 'true', '1': 'true',
+        'false': 'false', 'f': 'false', 'no': 'false', 'n': 'false', '0': 'false',
+    }
+    # Formatos de fecha del XML que datetime.fromisoformat no interpreta (ISO con otras fracciones, fechas de EE.UU.)
+    DATETIME_TEXT_FORMATS = [
+        '%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%d %H:%M:%S.%f',
+        '%m/%d/%Y %H:%M:%S', '%m/%d/%Y %I:%M:%S %p', '%m/%d/%Y %H:%M', '%m/%d/%Y',
+    ]
+
     def __init__(self, config_file=None, mapping_file=None):
         self.config_file = config_file
         self.mapping_file = mapping_file
         self.mapping_data = None
-        self.conn = None
-        self.cursor = None
+        # Backend de la BD (db_backend): PostgreSQL o SQLite según database.backend, o un snapshot local
+        self.db = None
+        # Pool de conexiones de la ejecución cuando las consultas por archivo se hacen en paralelo (database.pool_size)
+        self.db_pool = None
+        # Columnas de cada tabla del mapeo en la BD ({tabla: {columna: tipo}}), leídas una vez por ejecución,
+        # y columnas del mapeo que no existen en la BD ({tabla: [columnas]})
+        self.db_schema = None
+        self.missing_columns = {}
         self.config = None
+        # Ruta del snapshot local de la BD cuando las consultas se hacen contra él (--db-snapshot)
+        self.db_snapshot = None
         self.logger = self._setup_logger()
         
+        # Caché de expresiones XPath compiladas, compartida entre todos los archivos
+        self._xpath_cache = {}
+        self.xpath_cache_hits = 0
+        self.xpath_cache_misses = 0
+        
+        # Plantillas SQL parametrizadas de _build_filtered_query, por (tabla, columnas, tipo de búsqueda)
+        self._query_templates = {}
+        
+        # Índice de tags del documento actual y correcciones case-insensitive encontradas en la ejecución
+        self._tag_index_root = None
+        self._tag_index = None
+        self._xpath_corrections = {}
+        
+        # Predicados condicionales y reglas WHEN compilados al cargar el mapeo
+        self._conditional_xpaths = {}
+        self._when_rules = {}
+        self.rejected_mappings = []
+        
+        # Trie de las rutas simples del mapeo (una sola pasada por documento), mapeos que resuelve
+        # (alineado con valid_mappings), filas del mapeo con identificadores y si el árbol se puede liberar
+        self.path_trie = None
+        self._trie_mappings = []
+        self._identifier_mappings = []
+        self._streaming_extraction = False
+        
+        # Entrada de los XML de la ejecución: carpeta, .zip o .tar.gz (ver xml_input)
+        self._xml_input = None
+        
+        # Ruta que separa los incidentes de un archivo con varios bloques ((absoluta, tags), o None si cada
+        # archivo es un solo registro; processing.is_multiple_blocks_file)
+        self._block_delimiter = None
+        
+        # Hoja XSLT con todas las expresiones del mapeo (processing.extraction_engine = 'xslt') y los valores
+        # que produjo para el documento actual, que _xpath usa en lugar de evaluar esas expresiones
+        self.xslt_extractor = None
+        self._xslt_root = None
+        self._xslt_values = None
+        
+        # Caché persistente de los registros extraídos por hash del XML y del plan de extracción
+        # (processing.extraction_cache), o None si está desactivada
+        self.extraction_cache = None
+        
+        # Tiempos por etapa, por mapeo y consultas más lentas de la ejecución (los hilos de consulta también los suman)
+        self.mapping_load_seconds = 0.0
+        self._stats_lock = threading.Lock()
+        self._reset_performance_stats()
+        
         # Cargar configuración primero
         if config_file:
             self._load_config()
+        self._apply_log_profile()
         
         # Si se proporciona archivo de mapeo, cargarlo después de la configuración
         if mapping_file:
             self.mapping_file = mapping_file
             self.load_mapping_file()
 
+    def __getstate__(self):
+        """
+        Estado para enviar el mapper a procesos worker: sin conexión a BD ni expresiones compiladas
+        (no serializables); los workers vuelven a compilar las expresiones la primera vez que las usan.
+        """
+        state = self.__dict__.copy()
+        state['db'] = None
+        state['db_pool'] = None
+        state['_stats_lock'] = None
+        state['_xpath_cache'] = {}
+        state['_conditional_xpaths'] = {}
+        state['_when_rules'] = {}
+        state['_tag_index_root'] = None
+        state['_tag_index'] = None
+        state['_xslt_root'] = None
+        state['_xslt_values'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._stats_lock = threading.Lock()
+
     def _setup_logger(self):
-        # Configurar el logger
+        """Logger 'XPathMapper'; todas las instancias del proceso comparten su handler y su archivo de log."""
         logger = logging.getLogger('XPathMapper')
         logger.setLevel(logging.INFO)
-        
-        # Crear el directorio de logs si no existe
-        logs_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'logs')
-        os.makedirs(logs_dir, exist_ok=True)
-        
-        # Crear el archivo de log con la fecha actual
-        log_file = os.path.join(logs_dir, f'comparison_{datetime.now().strftime("%Y%m%d_%H%M%S")}.log')
-        # Configurar FileHandler con encoding UTF-8 para soportar emojis
-        file_handler = logging.FileHandler(log_file, encoding='utf-8')
-        
-        # Configurar el formato del log
-        formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
-        file_handler.setFormatter(formatter)
-        
-        # Agregar el handler al logger
-        logger.addHandler(file_handler)
-        
+        self.log_file = _install_log_handlers()
+        self.log_profile = 'normal'
         return logger
 
+    def _apply_log_profile(self):
+        """
+        Nivel del log según logging.profile de la configuración: 'normal' (INFO), 'quiet' (solo el
+        resumen de cada archivo y de la ejecución, más advertencias y errores) o 'debug' (detalle por campo).
+        """
+        profile = str(((self.config or {}).get('logging') or {}).get('profile', 'normal')).lower()
+        if profile not in LOG_PROFILES:
+            self.logger.warning("Perfil de log desconocido '%s', se usa 'normal' (opciones: %s)", profile, ', '.join(LOG_PROFILES))
+            profile = 'normal'
+        self.log_profile = profile
+        self.logger.setLevel(LOG_PROFILES[profile])
+
     def _process_xpath(self, xpath_raw):
         """Procesar rutas XPath desde diferentes formatos, incluyendo clausulas WHEN."""
         if pd.isna(xpath_raw) or not xpath_raw:
@@ -66,7 +299,7 @@ class XPathMapper:
             return xpath_str
         
         # Detectar clausulas WHEN descriptivas
-        if 'WHEN' in xpath_str.upper():
+        if self._is_when_clause(xpath_str):
             return self._parse_when_clause(xpath_str)
         
         # Si contiene el operador de concatenación "+", procesarlo por partes
@@ -79,8 +312,7 @@ class XPathMapper:
                 # Procesar cada parte individualmente
                 if '<' in part and '>' in part:
                     # Extraer los nombres de los elementos
-                    import re
-                    elements = re.findall(r'<([^>]+)>', part)
+                    elements = self._mapping_path_elements(part)
                     if elements:
                         # Construir la ruta XPath para esta parte
                         part_xpath = '//' + '/'.join(elements)
@@ -100,8 +332,7 @@ class XPathMapper:
         # Si está en formato de elementos XML: <Incident> <IncidentNumber>
         if '<' in xpath_str and '>' in xpath_str:
             # Extraer los nombres de los elementos
-            import re
-            elements = re.findall(r'<([^>]+)>', xpath_str)
+            elements = self._mapping_path_elements(xpath_str)
             if elements:
                 # Construir la ruta XPath
                 xpath = '//' + '/'.join(elements)
@@ -117,6 +348,42 @@ class XPathMapper:
         
         return None
 
+    def _mapping_path_elements(self, text):
+        """
+        Nombres de los elementos de la ruta en una celda con formato '<A> <B>'. Las notas entre corchetes o
+        paréntesis y los elementos de una cláusula WHERE / ORDER BY posterior no se agregan como pasos.
+        """
+        import re
+        
+        # Las notas pueden contener otras notas ('(EX: ... [16] ...)'): quitar de adentro hacia afuera
+        previous = None
+        while previous != text:
+            previous = text
+            text = re.sub(self.MAPPING_NOTE_PATTERN, ' ', text)
+        path_text = re.split(self.MAPPING_CLAUSE_PATTERN, text, maxsplit=1, flags=re.IGNORECASE)[0]
+        return [element.strip() for element in re.findall(r'<([^>]+)>', path_text)]
+
+    def _unsupported_mapping_clause(self, xpath_raw):
+        """
+        Motivo de rechazo si la descripción del mapeo ordena o filtra los valores con una cláusula que la ruta no
+        expresa: ORDER BY / SELECT TOP, o WHERE sobre un valor literal. None si no tiene ninguna. Un WHERE sobre
+        un marcador entre corchetes ('<AgencyCode> = [target agency]') no tiene valor que comparar y se ignora.
+        """
+        import re
+        
+        text = str(xpath_raw or '')
+        if re.search(r'\b(?:ORDER\s+BY|SELECT\s+TOP)\b', text, re.IGNORECASE):
+            return "Orden de los valores (ORDER BY / SELECT TOP) no expresable como XPath"
+        where_match = re.search(r'\bWHERE\b(.*)', text, re.IGNORECASE | re.DOTALL)
+        if where_match and re.search(r'=\s*[\'"]', re.sub(self.MAPPING_NOTE_PATTERN, ' ', where_match.group(1))):
+            return "Condición WHERE sobre un valor literal no soportada (usar un XPath con predicado)"
+        return None
+
+    def _is_when_clause(self, text):
+        """Detectar la palabra clave WHEN, sin confundirla con nombres de elementos como <CreateWhen>."""
+        import re
+        return re.search(r'\bWHEN\b', str(text), re.IGNORECASE) is not None
+
     def _parse_when_clause(self, description):
         """
         Parsear clausulas WHEN descriptivas del Excel.
@@ -127,6 +394,16 @@ class XPathMapper:
             
             self.logger.debug(f"Parseando clausula WHEN: {description}")
             
+            # Reglas WHEN ... THEN ... ELSE: normalizar a "WHEN //xpath = 'valor' THEN 'a' ELSE 'b'"
+            then_else_match = re.search(self.WHEN_THEN_ELSE_PATTERN, description, re.IGNORECASE)
+            if then_else_match:
+                condition_raw = then_else_match.group(1).strip()
+                condition_elements = [element.strip() for element in re.findall(r'<([^>]+)>', condition_raw)]
+                condition_xpath = '//' + '/'.join(condition_elements) if condition_elements else condition_raw
+                when_rule = f"WHEN {condition_xpath} = '{then_else_match.group(2)}' THEN '{then_else_match.group(3)}' ELSE '{then_else_match.group(4)}'"
+                self.logger.info(f"Regla WHEN/THEN/ELSE generada: {when_rule}")
+                return when_rule
+            
             # Inicializar variables para evitar errores de scope
             operator = None
             condition_value = None
@@ -224,6 +501,193 @@ class XPathMapper:
             self.logger.error(f"Error parseando clausula WHEN: {str(e)}")
             return None
 
+    def _compile_xpath(self, xpath_expr):
+        """
+        Obtener la expresión XPath compilada desde la caché, compilándola la primera vez.
+        Las expresiones inválidas también se recuerdan para no volver a intentar compilarlas.
+        """
+        compiled = self._xpath_cache.get(xpath_expr)
+        if compiled is not None:
+            self.xpath_cache_hits += 1
+        else:
+            self.xpath_cache_misses += 1
+            try:
+                compiled = etree.XPath(xpath_expr)
+            except etree.XPathError as e:
+                compiled = e
+            self._xpath_cache[xpath_expr] = compiled
+        
+        if isinstance(compiled, Exception):
+            raise compiled.with_traceback(None)
+        return compiled
+
+    def _xpath(self, node, xpath_expr):
+        """
+        Evaluar un XPath sobre un nodo usando la caché de expresiones compiladas. Sobre la raíz del
+        documento actual, las expresiones de la hoja XSLT devuelven los valores ya extraídos por la transformación.
+        """
+        if node is self._xslt_root:
+            values = self._xslt_values.get(xpath_expr)
+            if values is not None:
+                return values
+        return self._compile_xpath(xpath_expr)(node)
+
+    def _mapping_xpath_parts(self, xpath_str):
+        """Partes XPath de la expresión de un mapeo: separa concatenaciones con '+' o AND."""
+        for separator in ['+', ' AND ', ' and ']:
+            if separator in xpath_str:
+                return [part.strip() for part in xpath_str.split(separator) if part.strip()]
+        return [xpath_str]
+
+    def _compile_conditional_xpath(self, xpath_part):
+        """
+        Precompilar un XPath condicional 'base[condición]/objetivo' en un predicado evaluable sin regex.
+        Retorna un diccionario con los XPaths compilados de base, condición y objetivo, el operador y el
+        valor esperado; o None si la expresión no es condicional o alguna de sus partes no compila.
+        """
+        import re
+        
+        contains_match = re.match(self.CONTAINS_CONDITION_PATTERN, xpath_part)
+        if contains_match:
+            base_path, condition_element, condition_value, target_element = contains_match.groups()
+            operator = 'contains'
+        else:
+            condition_match = re.match(self.COMPARISON_CONDITION_PATTERN, xpath_part)
+            if not condition_match:
+                return None
+            base_path, condition_element, operator, condition_value, target_element = condition_match.groups()
+        
+        condition_element = condition_element.strip()
+        if not condition_element.startswith('.//'):
+            condition_element = './/' + condition_element
+        
+        try:
+            return {
+                'base': self._compile_xpath(base_path),
+                'condition': self._compile_xpath(condition_element),
+                'operator': operator,
+                'value': condition_value,
+                # Buscar el objetivo primero en descendientes y después relativo al elemento base
+                'targets': [self._compile_xpath('.//' + target_element), self._compile_xpath(target_element)],
+                'description': f"Base: {base_path}, Condicion: {condition_element} {operator} '{condition_value}', Target: {target_element}"
+            }
+        except etree.XPathError as e:
+            self.logger.debug(f"No se pudo compilar el XPath condicional '{xpath_part}': {e}")
+            return None
+
+    def _get_conditional_xpath(self, xpath_part):
+        """Predicado condicional precompilado para un XPath (se compila una sola vez por expresión)."""
+        if xpath_part not in self._conditional_xpaths:
+            self._conditional_xpaths[xpath_part] = self._compile_conditional_xpath(xpath_part)
+        return self._conditional_xpaths[xpath_part]
+
+    def _compile_when_rule(self, xpath_str):
+        """
+        Precompilar una regla "WHEN xpath = 'valor' THEN 'a' ELSE 'b'".
+        Retorna None si el texto no tiene ese formato.
+        """
+        import re
+        
+        match = re.search(self.WHEN_THEN_ELSE_PATTERN, xpath_str, re.IGNORECASE)
+        if not match:
+            return None
+        
+        condition_xpath = match.group(1).strip()
+        try:
+            # Validar la condición como XPath nativo y dejarla compilada en la caché
+            self._compile_xpath(condition_xpath)
+        except etree.XPathError as e:
+            self.logger.debug(f"Condición WHEN no compilable '{condition_xpath}': {e}")
+            return None
+        
+        return {
+            'condition_xpath': condition_xpath,
+            'condition_value': match.group(2),
+            'then_value': match.group(3),
+            'else_value': match.group(4)
+        }
+
+    def _get_when_rule(self, xpath_str):
+        """Regla WHEN/THEN/ELSE precompilada para un texto (se compila una sola vez por expresión)."""
+        if xpath_str not in self._when_rules:
+            self._when_rules[xpath_str] = self._compile_when_rule(xpath_str)
+        return self._when_rules[xpath_str]
+
+    def _compile_mapping_expression(self, mapping):
+        """
+        Compilar la expresión de un mapeo: XPaths nativos, predicados condicionales y reglas WHEN.
+        Retorna el motivo de rechazo, o None si la expresión se puede evaluar.
+        """
+        unsupported_clause = self._unsupported_mapping_clause(mapping.get('xpath_raw'))
+        if unsupported_clause:
+            return unsupported_clause
+        
+        xpath_str = mapping['xpath']
+        
+        if xpath_str.upper().startswith('WHEN '):
+            if self._get_when_rule(xpath_str) is None:
+                return "Regla WHEN/THEN/ELSE con formato o XPath de condición no soportado"
+            if str(mapping['column_name']).lower() != 'status_code':
+                return "Las reglas WHEN/THEN/ELSE solo se soportan para status_code"
+            return None
+        
+        from_when_clause = self._is_when_clause(mapping.get('xpath_raw', ''))
+        
+        for xpath_part in self._mapping_xpath_parts(xpath_str):
+            try:
+                self._compile_xpath(xpath_part)
+                continue
+            except etree.XPathError as e:
+                compile_error = e
+            
+            # Un XPath condicional que no compila de forma nativa necesita su predicado precompilado
+            is_conditional = from_when_clause or '[' in xpath_part
+            if is_conditional and self._get_conditional_xpath(xpath_part) is None:
+                return f"XPath condicional no compilable '{xpath_part}': {compile_error}"
+            
+            self.logger.debug(f"XPath no compilable (se resolverá con la lógica de respaldo): {xpath_part} - {compile_error}")
+        
+        # Dejar precompilados los predicados de las partes condicionales
+        for xpath_part in self._mapping_xpath_parts(xpath_str):
+            self._get_conditional_xpath(xpath_part)
+        
+        return None
+
+    def _compile_mappings(self, valid_mappings):
+        """
+        Compilar una sola vez todas las expresiones de valid_mappings al cargar el mapeo.
+        Retorna los mapeos aceptados; los rechazados se agregan a self.rejected_mappings.
+        """
+        accepted_mappings = []
+        
+        for mapping in valid_mappings:
+            rejection_reason = self._compile_mapping_expression(mapping)
+            if rejection_reason:
+                self.rejected_mappings.append({
+                    'row_index': mapping.get('row_index'),
+                    'table_name': mapping['table_name'],
+                    'column_name': mapping['column_name'],
+                    'xpath_raw': mapping.get('xpath_raw'),
+                    'motivo': rejection_reason
+                })
+            else:
+                accepted_mappings.append(mapping)
+        
+        # La compilación previa no cuenta como uso de la caché
+        self.xpath_cache_hits = 0
+        self.xpath_cache_misses = 0
+        self.logger.info(f"Expresiones XPath precompiladas: {len(self._xpath_cache)}, "
+                         f"predicados condicionales: {sum(1 for c in self._conditional_xpaths.values() if c)}, "
+                         f"reglas WHEN: {sum(1 for r in self._when_rules.values() if r)}")
+        
+        if self.rejected_mappings:
+            self.logger.warning(f"⚠️ {len(self.rejected_mappings)} mapeos rechazados al compilar el archivo de mapeo:")
+            for rejected in self.rejected_mappings:
+                self.logger.warning(f"   Fila {rejected['row_index']} ({rejected['table_name']}.{rejected['column_name']}): "
+                                    f"'{rejected['xpath_raw']}' -> {rejected['motivo']}")
+        
+        return accepted_mappings
+
     def _evaluate_xpath_with_conditions(self, root, xpath_str):
         """
         Evaluar XPath con soporte para condiciones condicionales.
@@ -250,7 +714,7 @@ class XPathMapper:
                 return self._evaluate_single_xpath_with_condition(root, xpath_str)
                 
         except Exception as e:
-            self.logger.error(f"Error evaluando XPath condicional '{xpath_str}': {str(e)}")
+            self.logger.error("Error evaluando XPath condicional '%s': %s", xpath_str, str(e))
             return "ERROR_XPATH_CONDITION"
 
     def _evaluate_single_xpath_with_condition(self, root, xpath_part):
@@ -259,130 +723,82 @@ class XPathMapper:
         Maneja tanto XPath tradicionales como clausulas descriptivas.
         """
         try:
-            self.logger.debug(f"Evaluando XPath: {xpath_part}")
+            self.logger.debug("Evaluando XPath: %s", xpath_part)
             
             # Método 1: Intentar XPath directo primero
             try:
-                elements = root.xpath(xpath_part)
+                elements = self._xpath(root, xpath_part)
                 if elements:
                     value = self._extract_element_value(elements[0])
                     if value:
-                        self.logger.debug(f"XPath directo exitoso: '{value}'")
+                        self.logger.debug("XPath directo exitoso: '%s'", value)
                         return value
             except Exception as e:
-                self.logger.debug(f"XPath directo falló: {str(e)}")
-            
-            # Método 2: Si el XPath directo falla, intentar parsing manual
-            # Buscar patrones como "//VehicleData[contains(.//Description, 'Cancelled')]/TimeCallCleared"
-            import re
-            
-            # Detectar XPath con función contains()
-            contains_pattern = r'(.+?)\[contains\(([^,]+),\s*[\'"]([^\'\"]+)[\'"]\)\]/(.+)'
-            contains_match = re.match(contains_pattern, xpath_part)
-            
-            if contains_match:
-                base_path = contains_match.group(1)
-                condition_element = contains_match.group(2).strip()
-                condition_value = contains_match.group(3)
-                target_element = contains_match.group(4)
-                
-                self.logger.debug(f"Patron contains detectado - Base: {base_path}, Condicion: {condition_element} contains '{condition_value}', Target: {target_element}")
-                
-                # Buscar todos los elementos base
-                base_elements = root.xpath(base_path)
-                self.logger.debug(f"Encontrados {len(base_elements)} elementos base")
-                
-                for element in base_elements:
-                    # Evaluar la condición contains
-                    try:
-                        if condition_element.startswith('.//'):
-                            # Buscar en descendientes
-                            condition_elements = element.xpath(condition_element)
-                        else:
-                            # Buscar relativo al elemento
-                            condition_elements = element.xpath('.//' + condition_element)
-                        
-                        for cond_elem in condition_elements:
-                            cond_value = self._extract_element_value(cond_elem)
-                            self.logger.debug(f"Verificando condicion: '{cond_value}' contains '{condition_value}'")
-                            
-                            if condition_value.lower() in str(cond_value).lower():
-                                # Condición se cumple, buscar el elemento target
-                                target_elements = element.xpath('.//' + target_element)
-                                if not target_elements:
-                                    target_elements = element.xpath(target_element)
-                                
-                                if target_elements:
-                                    target_value = self._extract_element_value(target_elements[0])
-                                    self.logger.info(f"Condicion cumplida! Valor extraido: '{target_value}'")
-                                    return target_value
-                                else:
-                                    self.logger.debug(f"Condicion cumplida pero elemento target '{target_element}' no encontrado")
-                    except Exception as e:
-                        self.logger.debug(f"Error evaluando condicion en elemento: {str(e)}")
-                        continue
-                
-                self.logger.debug("Ninguna condicion se cumplio")
-                return None
-            
-            # Método 3: XPath con otras condiciones [elemento = 'valor']
-            condition_pattern = r'(.+?)\[([^=!<>]+)\s*(=|!=|>|<|>=|<=)\s*[\'"]([^\'\"]+)[\'"]\]/(.+)'
-            condition_match = re.match(condition_pattern, xpath_part)
+                self.logger.debug("XPath directo falló: %s", str(e))
             
-            if condition_match:
-                base_path = condition_match.group(1)
-                condition_element = condition_match.group(2).strip()
-                operator = condition_match.group(3)
-                condition_value = condition_match.group(4)
-                target_element = condition_match.group(5)
-                
-                self.logger.debug(f"Patron condicional detectado - Base: {base_path}, Condicion: {condition_element} {operator} '{condition_value}', Target: {target_element}")
-                
-                base_elements = root.xpath(base_path)
-                
-                for element in base_elements:
-                    try:
-                        # Buscar elemento de condición
-                        if condition_element.startswith('.//'):
-                            condition_elements = element.xpath(condition_element)
-                        else:
-                            condition_elements = element.xpath('.//' + condition_element)
-                        
-                        for cond_elem in condition_elements:
-                            cond_value = self._extract_element_value(cond_elem)
-                            
-                            # Evaluar la condición
-                            if self._compare_values(cond_value, operator, condition_value):
-                                # Buscar elemento target
-                                target_elements = element.xpath('.//' + target_element)
-                                if not target_elements:
-                                    target_elements = element.xpath(target_element)
-                                
-                                if target_elements:
-                                    target_value = self._extract_element_value(target_elements[0])
-                                    self.logger.info(f"Condicion '{cond_value}' {operator} '{condition_value}' cumplida! Valor: '{target_value}'")
-                                    return target_value
-                    except Exception as e:
-                        self.logger.debug(f"Error evaluando condicion: {str(e)}")
-                        continue
-                
-                return None
+            # Método 2: Si el XPath directo falla, evaluar el predicado condicional precompilado
+            # Ejemplo: "//VehicleData[contains(.//Description, 'Cancelled')]/TimeCallCleared"
+            conditional = self._get_conditional_xpath(xpath_part)
+            if conditional is not None:
+                return self._evaluate_conditional_xpath(root, conditional)
             
-            # Método 4: XPath simple sin condiciones
+            # Método 3: XPath simple sin condiciones
             try:
-                elements = root.xpath(xpath_part)
+                elements = self._xpath(root, xpath_part)
                 if elements:
                     return self._extract_element_value(elements[0])
             except:
                 pass
             
-            self.logger.debug(f"No se pudo evaluar el XPath: {xpath_part}")
+            self.logger.debug("No se pudo evaluar el XPath: %s", xpath_part)
             return None
                     
         except Exception as e:
-            self.logger.error(f"Error evaluando XPath '{xpath_part}': {str(e)}")
+            self.logger.error("Error evaluando XPath '%s': %s", xpath_part, str(e))
             return None
 
+    def _evaluate_conditional_xpath(self, root, conditional):
+        """
+        Evaluar un predicado condicional precompilado: recorre los elementos base y devuelve el
+        objetivo del primero que cumple la condición (contains sin distinguir mayúsculas, o comparación).
+        """
+        self.logger.debug("Patron condicional - %s", conditional['description'])
+        
+        operator = conditional['operator']
+        condition_value = conditional['value']
+        
+        base_elements = conditional['base'](root)
+        self.logger.debug("Encontrados %s elementos base", len(base_elements))
+        
+        for element in base_elements:
+            try:
+                for cond_elem in conditional['condition'](element):
+                    cond_value = self._extract_element_value(cond_elem)
+                    
+                    if operator == 'contains':
+                        condition_met = condition_value.lower() in str(cond_value).lower()
+                    else:
+                        condition_met = self._compare_values(cond_value, operator, condition_value)
+                    
+                    if condition_met:
+                        # Condición se cumple, buscar el elemento target
+                        target_elements = conditional['targets'][0](element)
+                        if not target_elements:
+                            target_elements = conditional['targets'][1](element)
+                        
+                        if target_elements:
+                            target_value = self._extract_element_value(target_elements[0])
+                            self.logger.info("Condicion '%s' %s '%s' cumplida! Valor: '%s'", cond_value, operator, condition_value, target_value)
+                            return target_value
+                        elif operator == 'contains':
+                            self.logger.debug("Condicion cumplida pero elemento target no encontrado")
+            except Exception as e:
+                self.logger.debug("Error evaluando condicion en elemento: %s", str(e))
+                continue
+        
+        self.logger.debug("Ninguna condicion se cumplio")
+        return None
+
     def _evaluate_condition(self, element, condition_str):
         """
         Evaluar una condición XPath contra un elemento.
@@ -403,7 +819,7 @@ class XPathMapper:
                         right_value = parts[1].strip().strip("'\"")  # Remover comillas
                         
                         # Evaluar la expresión izquierda contra el elemento
-                        left_elements = element.xpath(left_expr)
+                        left_elements = self._xpath(element, left_expr)
                         if left_elements:
                             left_actual_value = self._extract_element_value(left_elements[0])
                             
@@ -413,11 +829,11 @@ class XPathMapper:
                             # Si no se encuentra el elemento, considerar como valor vacío
                             return self._compare_values("", op, right_value)
             
-            self.logger.warning(f"No se pudo parsear la condición: {condition_str}")
+            self.logger.warning("No se pudo parsear la condición: %s", condition_str)
             return False
             
         except Exception as e:
-            self.logger.error(f"Error evaluando condición '{condition_str}': {str(e)}")
+            self.logger.error("Error evaluando condición '%s': %s", condition_str, str(e))
             return False
 
     def _compare_values(self, actual_value, operator, expected_value):
@@ -454,11 +870,11 @@ class XPathMapper:
             else:
                 result = False
             
-            self.logger.debug(f"Comparación: '{actual_str}' {operator} '{expected_str}' = {result}")
+            self.logger.debug("Comparación: '%s' %s '%s' = %s", actual_str, operator, expected_str, result)
             return result
             
         except Exception as e:
-            self.logger.error(f"Error comparando valores: {str(e)}")
+            self.logger.error("Error comparando valores: %s", str(e))
             return False
 
     def _extract_element_value(self, element):
@@ -473,7 +889,7 @@ class XPathMapper:
                 # Si es un atributo o valor directo
                 return str(element).strip()
         except Exception as e:
-            self.logger.error(f"Error extrayendo valor del elemento: {str(e)}")
+            self.logger.error("Error extrayendo valor del elemento: %s", str(e))
             return ""
 
     def _load_config(self):
@@ -520,12 +936,12 @@ class XPathMapper:
             return self._extract_status_code_value(root, xpath_str)
         
         # 2. Lógica especial para call_notes, narratives y comentarios  
-        if column_name.lower() in ['call_notes', 'narratives', 'narrative', 'comment1', 'comment', 'comments']:
+        if column_name.lower() in self.NARRATIVE_COLUMNS:
             return self._extract_narratives_value(root, xpath_str)
         
         # 3. Lógica especial para cross_street
         if 'cross_street' in column_name.lower():
-            self.logger.info(f"Activando lógica especial de cross_street para campo: {column_name}")
+            self.logger.info("Activando lógica especial de cross_street para campo: %s", column_name)
             return self._extract_cross_street_value(root, xpath_str)
         
         # Para otros campos, usar la lógica estándar con fallback case-insensitive
@@ -533,174 +949,149 @@ class XPathMapper:
         
         # Si no se encontró nada, intentar con variaciones de mayúsculas/minúsculas
         if result is None and xpath_str:
-            self.logger.debug(f"XPath '{xpath_str}' no encontró elementos, intentando con variaciones case-insensitive")
+            self.logger.debug("XPath '%s' no encontró elementos, intentando con variaciones case-insensitive", xpath_str)
             result = self._try_case_insensitive_xpath(root, xpath_str)
         
         return result
     
+    def _build_tag_index(self, root):
+        """
+        Índice del documento: ruta de tags en minúsculas -> rutas reales, en orden del documento.
+        Incluye las rutas absolutas ('/a/b' -> '/A/B') y todos los sufijos para XPaths con '//' ('a/b' -> 'A/B').
+        """
+        index = {}
+        stack = [(root, (root.tag,), (str(root.tag).lower(),))]
+        
+        while stack:
+            element, real_path, lower_path = stack.pop()
+            
+            entries = [('/' + '/'.join(lower_path), '/' + '/'.join(real_path))]
+            for i in range(len(lower_path)):
+                entries.append(('/'.join(lower_path[i:]), '/'.join(real_path[i:])))
+            
+            for key, real in entries:
+                real_paths = index.setdefault(key, [])
+                if real not in real_paths:
+                    real_paths.append(real)
+            
+            # Agregar hijos en orden inverso para recorrer el documento en orden
+            for child in reversed(element):
+                if isinstance(child.tag, str):
+                    stack.append((child, real_path + (child.tag,), lower_path + (child.tag.lower(),)))
+        
+        return index
+
+    def _get_tag_index(self, root):
+        """Índice de tags del documento actual; se construye una sola vez por documento."""
+        if self._tag_index_root is not root:
+            self._tag_index = self._build_tag_index(root)
+            self._tag_index_root = root
+        return self._tag_index
+
+    def _case_insensitive_candidates(self, root, xpath_str):
+        """
+        XPaths corregidos a probar para un XPath que no encontró elementos: la corrección recordada de
+        archivos anteriores, las rutas reales del índice del documento y algunas variaciones conocidas.
+        """
+        import re
+        
+        candidates = []
+        
+        # Corrección ya encontrada en un archivo anterior
+        if xpath_str in self._xpath_corrections:
+            candidates.append(self._xpath_corrections[xpath_str])
+        
+        # Rutas simples (solo nombres de elementos): una búsqueda en el índice del documento
+        stripped = xpath_str.strip()
+        if stripped.startswith('//'):
+            prefix, rest = '//', stripped[2:]
+        elif stripped.startswith('/'):
+            prefix, rest = '/', stripped[1:]
+        else:
+            prefix, rest = '//', stripped
+        
+        segments = [segment.strip() for segment in rest.split('/')]
+        if segments and all(re.match(r'^[A-Za-z_][\w.\-]*$', segment) for segment in segments):
+            lower_key = '/'.join(segments).lower()
+            if prefix == '/':
+                real_paths = self._get_tag_index(root).get('/' + lower_key, [])
+                candidates.extend(real_paths)
+            else:
+                real_paths = self._get_tag_index(root).get(lower_key, [])
+                candidates.extend('//' + real_path for real_path in real_paths)
+        
+        # También agregar algunas variaciones específicas conocidas
+        candidates.extend([
+            xpath_str.replace('NfirsData', 'NFIRSData'),
+            xpath_str.replace('nfirsdata', 'NFIRSData'),
+            xpath_str.replace('Nfirs', 'NFIRS'),
+            xpath_str.replace('nfirs', 'NFIRS'),
+            xpath_str.replace('DATA', 'Data'),
+            xpath_str.replace('data', 'Data'),
+        ])
+        
+        # Remover duplicados y el XPath original, manteniendo el orden
+        unique_candidates = []
+        for candidate in candidates:
+            if candidate != xpath_str and candidate not in unique_candidates:
+                unique_candidates.append(candidate)
+        
+        return unique_candidates
+
     def _try_case_insensitive_xpath(self, root, xpath_str):
         """
         Intentar variaciones case-insensitive del XPath si el original falla.
-        Genera todas las combinaciones posibles de case-insensitive basadas en elementos reales del XML.
+        Las rutas reales salen del índice de tags del documento y la corrección encontrada se recuerda
+        para el resto de la ejecución.
         """
         try:
-            import re
-            from itertools import product
-            
-            self.logger.debug(f"Buscando variaciones case-insensitive para: {xpath_str}")
+            self.logger.debug("Buscando variaciones case-insensitive para: %s", xpath_str)
             
-            # Extraer partes del XPath (elementos entre /)
-            xpath_parts = [part.strip() for part in xpath_str.split('/') if part.strip()]
-            
-            # Obtener todos los elementos del XML para hacer matching case-insensitive
-            all_elements = root.xpath("//*")
-            element_names = set()
-            
-            for element in all_elements:
-                element_names.add(element.tag)
-                # También agregar elementos padre para navegación
-                parent = element.getparent()
-                if parent is not None:
-                    element_names.add(parent.tag)
-            
-            self.logger.debug(f"Elementos encontrados en XML: {sorted(element_names)}")
-            
-            # Para cada parte del XPath, encontrar todas las variaciones case-insensitive posibles
-            xpath_part_variations = []
-            
-            for xpath_part in xpath_parts:
-                if xpath_part and not xpath_part.startswith('//'):
-                    # Encontrar todas las variaciones case-insensitive para esta parte
-                    part_variations = [xpath_part]  # Incluir original
-                    
-                    for xml_element in element_names:
-                        if xpath_part.lower() == xml_element.lower() and xpath_part != xml_element:
-                            part_variations.append(xml_element)
-                    
-                    xpath_part_variations.append(part_variations)
-                    self.logger.debug(f"Parte '{xpath_part}' tiene variaciones: {part_variations}")
-                else:
-                    # Mantener partes especiales como '//' sin cambios
-                    xpath_part_variations.append([xpath_part])
-            
-            # Generar todas las combinaciones posibles usando product de itertools
-            all_combinations = list(product(*xpath_part_variations))
-            
-            # Crear XPaths completos para cada combinación
-            variations_to_try = []
-            
-            for combination in all_combinations:
-                # Reconstruir el XPath con esta combinación
-                new_xpath = '/' + '/'.join(combination)
-                if new_xpath != xpath_str:  # Solo agregar si es diferente al original
-                    variations_to_try.append(new_xpath)
-            
-            # También agregar algunas variaciones específicas conocidas
-            specific_variations = [
-                xpath_str.replace('NfirsData', 'NFIRSData'),
-                xpath_str.replace('nfirsdata', 'NFIRSData'),
-                xpath_str.replace('Nfirs', 'NFIRS'),
-                xpath_str.replace('nfirs', 'NFIRS'),
-                xpath_str.replace('DATA', 'Data'),
-                xpath_str.replace('data', 'Data'),
-            ]
-            
-            # Combinar todas las variaciones y remover duplicados
-            all_variations = variations_to_try + specific_variations
-            unique_variations = []
-            for variation in all_variations:
-                if variation not in unique_variations and variation != xpath_str:
-                    unique_variations.append(variation)
-            
-            self.logger.debug(f"Intentando {len(unique_variations)} variaciones case-insensitive")
+            variations = self._case_insensitive_candidates(root, xpath_str)
             
             # Intentar cada variación
-            for i, variation in enumerate(unique_variations):
-                self.logger.debug(f"Probando variación {i+1}/{len(unique_variations)}: {variation}")
+            for i, variation in enumerate(variations):
+                self.logger.debug("Probando variación %s/%s: %s", i+1, len(variations), variation)
                 try:
-                    elements = root.xpath(variation)
+                    elements = self._xpath(root, variation)
                     if elements:
-                        # Encontrado! usar la primera variación que funcione
-                        self.logger.info(f"✅ XPath corregido funciona: '{xpath_str}' -> '{variation}'")
                         result = self._extract_element_value(elements[0])
                         if result:
+                            if self._xpath_corrections.get(xpath_str) != variation:
+                                self.logger.info("✅ XPath corregido funciona: '%s' -> '%s'", xpath_str, variation)
+                                self._xpath_corrections[xpath_str] = variation
                             return result
                 except Exception as e:
-                    self.logger.debug(f"Error probando variación '{variation}': {e}")
+                    self.logger.debug("Error probando variación '%s': %s", variation, e)
                     continue
             
-            self.logger.warning(f"❌ Ninguna de las {len(unique_variations)} variaciones case-insensitive funcionó para: {xpath_str}")
+            self.logger.warning("❌ Ninguna de las %s variaciones case-insensitive funcionó para: %s", len(variations), xpath_str)
             return None
             
         except Exception as e:
-            self.logger.error(f"Error en fallback case-insensitive para {xpath_str}: {e}")
+            self.logger.error("Error en fallback case-insensitive para %s: %s", xpath_str, e)
             return None
     
     def _try_case_insensitive_xpath_elements(self, root, xpath_str):
         """
         Intentar variaciones case-insensitive del XPath y devolver los elementos encontrados.
-        Busca todos los elementos del XML y encuentra coincidencias case-insensitive.
+        Usa las mismas variaciones que _try_case_insensitive_xpath.
         """
         try:
-            import re
-            
-            # Extraer partes del XPath (elementos entre /)
-            xpath_parts = [part.strip() for part in xpath_str.split('/') if part.strip()]
-            
-            # Obtener todos los elementos del XML para hacer matching case-insensitive
-            all_elements = root.xpath("//*")  # Obtener todos los elementos
-            element_names = set()
-            
-            for element in all_elements:
-                element_names.add(element.tag)
-                # También agregar elementos padre para navegación
-                parent = element.getparent()
-                if parent is not None:
-                    element_names.add(parent.tag)
-            
-            # Crear variaciones del XPath original
-            original_variations = [
-                # Mantener XPath original
-                xpath_str,
-                # Casos específicos conocidos para compatibilidad
-                xpath_str.replace('NfirsData', 'NFIRSData'),
-                xpath_str.replace('nfirsdata', 'NFIRSData'),
-                xpath_str.replace('Nfirs', 'NFIRS'),
-                xpath_str.replace('nfirs', 'NFIRS'),
-            ]
-            
-            # Generar variaciones case-insensitive basadas en elementos reales del XML
-            for xpath_part in xpath_parts:
-                if xpath_part and not xpath_part.startswith('//'):
-                    # Buscar coincidencias case-insensitive en elementos reales
-                    for xml_element in element_names:
-                        if xpath_part.lower() == xml_element.lower() and xpath_part != xml_element:
-                            # Crear nueva variación reemplazando la parte case-insensitive
-                            new_variation = xpath_str.replace(xpath_part, xml_element)
-                            if new_variation not in original_variations:
-                                original_variations.append(new_variation)
-            
-            # Remover duplicados manteniendo orden
-            unique_variations = []
-            for variation in original_variations:
-                if variation not in unique_variations:
-                    unique_variations.append(variation)
-            
-            # Intentar cada variación
-            for variation in unique_variations:
-                if variation != xpath_str:  # Solo intentar variaciones diferentes al original
-                    self.logger.debug(f"Intentando variación case-insensitive para elementos: {variation}")
-                    elements = root.xpath(variation)
-                    if elements:
-                        # Encontrado! usar la primera variación que funcione
-                        self.logger.info(f"✅ XPath corregido funciona para elementos: '{xpath_str}' -> '{variation}'")
-                        return elements
+            for variation in self._case_insensitive_candidates(root, xpath_str):
+                self.logger.debug("Intentando variación case-insensitive para elementos: %s", variation)
+                elements = self._xpath(root, variation)
+                if elements:
+                    if self._xpath_corrections.get(xpath_str) != variation:
+                        self.logger.info("✅ XPath corregido funciona para elementos: '%s' -> '%s'", xpath_str, variation)
+                        self._xpath_corrections[xpath_str] = variation
+                    return elements
             
-            self.logger.debug(f"Ninguna variación case-insensitive funcionó para elementos: {xpath_str}")
+            self.logger.debug("Ninguna variación case-insensitive funcionó para elementos: %s", xpath_str)
             return None
             
         except Exception as e:
-            self.logger.error(f"Error en fallback case-insensitive para elementos {xpath_str}: {e}")
+            self.logger.error("Error en fallback case-insensitive para elementos %s: %s", xpath_str, e)
             return None
     
     def _extract_status_code_value(self, root, xpath_str):
@@ -710,7 +1101,7 @@ class XPathMapper:
         - Si no, si xpath tiene valor = closed, sino = open por defecto
         """
         try:
-            self.logger.debug(f"Procesando status_code con xpath: {xpath_str}")
+            self.logger.debug("Procesando status_code con xpath: %s", xpath_str)
             
             # Verificar si hay condiciones WHEN en el xpath
             if 'WHEN' in xpath_str.upper():
@@ -724,7 +1115,7 @@ class XPathMapper:
             else:
                 # Si no se encontró valor, intentar con case-insensitive fallback
                 if not value:
-                    self.logger.debug(f"XPath '{xpath_str}' no encontró valor para status_code, intentando case-insensitive")
+                    self.logger.debug("XPath '%s' no encontró valor para status_code, intentando case-insensitive", xpath_str)
                     case_insensitive_value = self._try_case_insensitive_xpath(root, xpath_str)
                     if case_insensitive_value and str(case_insensitive_value).strip():
                         return "closed"
@@ -733,7 +1124,7 @@ class XPathMapper:
                 return "open"
                 
         except Exception as e:
-            self.logger.error(f"Error procesando status_code: {e}")
+            self.logger.error("Error procesando status_code: %s", e)
             return "open"  # Valor por defecto
     
     def _extract_narratives_value(self, root, xpath_str):
@@ -743,14 +1134,14 @@ class XPathMapper:
         - Manejar DateTime+Text en múltiples líneas
         """
         try:
-            self.logger.debug(f"Procesando narratives con xpath: {xpath_str}")
+            self.logger.debug("Procesando narratives con xpath: %s", xpath_str)
             
             # Verificar si hay concatenación múltiple con +
             if '+' in xpath_str:
                 return self._extract_concatenated_narratives(root, xpath_str)
             
             # Para xpath simple, obtener todos los valores que coincidan
-            elements = root.xpath(xpath_str)
+            elements = self._xpath(root, xpath_str)
             if elements:
                 values = []
                 for element in elements:
@@ -764,7 +1155,7 @@ class XPathMapper:
             
             # Si no se encontró nada, intentar con variaciones case-insensitive
             if not elements:
-                self.logger.debug(f"XPath '{xpath_str}' no encontró elementos para narratives, intentando con variaciones case-insensitive")
+                self.logger.debug("XPath '%s' no encontró elementos para narratives, intentando con variaciones case-insensitive", xpath_str)
                 case_insensitive_result = self._try_case_insensitive_xpath(root, xpath_str)
                 if case_insensitive_result:
                     return case_insensitive_result
@@ -772,7 +1163,7 @@ class XPathMapper:
             return None
             
         except Exception as e:
-            self.logger.error(f"Error procesando narratives: {e}")
+            self.logger.error("Error procesando narratives: %s", e)
             return None
     
     def _extract_concatenated_narratives(self, root, xpath_str):
@@ -781,7 +1172,7 @@ class XPathMapper:
         """
         try:
             xpath_parts = [part.strip() for part in xpath_str.split('+')]
-            self.logger.debug(f"Partes de xpath para narratives: {xpath_parts}")
+            self.logger.debug("Partes de xpath para narratives: %s", xpath_parts)
             
             # Verificar si es patrón DateTime+Text
             if len(xpath_parts) == 2:
@@ -789,18 +1180,18 @@ class XPathMapper:
                 text_xpath = xpath_parts[1]
                 
                 # Obtener todos los elementos DateTime
-                datetime_elements = root.xpath(datetime_xpath)
-                text_elements = root.xpath(text_xpath)
+                datetime_elements = self._xpath(root, datetime_xpath)
+                text_elements = self._xpath(root, text_xpath)
                 
                 # Si no se encontraron elementos, intentar con case-insensitive
                 if not datetime_elements:
-                    self.logger.debug(f"XPath DateTime '{datetime_xpath}' no encontró elementos, intentando case-insensitive")
+                    self.logger.debug("XPath DateTime '%s' no encontró elementos, intentando case-insensitive", datetime_xpath)
                     datetime_fixed = self._try_case_insensitive_xpath_elements(root, datetime_xpath)
                     if datetime_fixed:
                         datetime_elements = datetime_fixed
                         
                 if not text_elements:
-                    self.logger.debug(f"XPath Text '{text_xpath}' no encontró elementos, intentando case-insensitive")
+                    self.logger.debug("XPath Text '%s' no encontró elementos, intentando case-insensitive", text_xpath)
                     text_fixed = self._try_case_insensitive_xpath_elements(root, text_xpath)
                     if text_fixed:
                         text_elements = text_fixed
@@ -833,11 +1224,11 @@ class XPathMapper:
             else:
                 values = []
                 for xpath_part in xpath_parts:
-                    elements = root.xpath(xpath_part)
+                    elements = self._xpath(root, xpath_part)
                     
                     # Si no se encontraron elementos, intentar case-insensitive
                     if not elements:
-                        self.logger.debug(f"XPath parte '{xpath_part}' no encontró elementos, intentando case-insensitive")
+                        self.logger.debug("XPath parte '%s' no encontró elementos, intentando case-insensitive", xpath_part)
                         elements = self._try_case_insensitive_xpath_elements(root, xpath_part)
                         if not elements:
                             elements = []
@@ -853,7 +1244,7 @@ class XPathMapper:
             return None
             
         except Exception as e:
-            self.logger.error(f"Error en concatenación narratives: {e}")
+            self.logger.error("Error en concatenación narratives: %s", e)
             return None
     
     def _extract_cross_street_value(self, root, xpath_str):
@@ -864,27 +1255,27 @@ class XPathMapper:
         Soporta múltiples operadores de concatenación para flexibilidad
         """
         try:
-            self.logger.debug(f"Procesando cross_street con xpath: {xpath_str}")
+            self.logger.debug("Procesando cross_street con xpath: %s", xpath_str)
             
             # Detectar operadores de concatenación (+ o AND)
             xpath_parts = []
             
             if '+' in xpath_str:
                 xpath_parts = [part.strip() for part in xpath_str.split('+')]
-                self.logger.debug(f"Detectado operador '+', partes: {xpath_parts}")
+                self.logger.debug("Detectado operador '+', partes: %s", xpath_parts)
             elif ' AND ' in xpath_str or ' and ' in xpath_str:
                 # Detectar AND en mayúsculas o minúsculas
                 if ' AND ' in xpath_str:
                     xpath_parts = [part.strip() for part in xpath_str.split(' AND ')]
-                    self.logger.debug(f"Detectado operador 'AND' (mayúsculas), partes: {xpath_parts}")
+                    self.logger.debug("Detectado operador 'AND' (mayúsculas), partes: %s", xpath_parts)
                 else:
                     xpath_parts = [part.strip() for part in xpath_str.split(' and ')]
-                    self.logger.debug(f"Detectado operador 'and' (minúsculas), partes: {xpath_parts}")
+                    self.logger.debug("Detectado operador 'and' (minúsculas), partes: %s", xpath_parts)
             else:
                 # DETECCIÓN AUTOMÁTICA: Buscar patrones de concatenación comunes
                 # Ejemplo: //Path/LowCrossStreet/Path/HighCrossStreet -> //Path/LowCrossStreet + //Path/HighCrossStreet
                 if 'LowCrossStreet' in xpath_str and 'HighCrossStreet' in xpath_str:
-                    self.logger.info(f"Detectado patrón de cross_street sin operadores explícitos, intentando separación automática")
+                    self.logger.info("Detectado patrón de cross_street sin operadores explícitos, intentando separación automática")
                     
                     # Buscar el patrón: ...LowCrossStreet/...HighCrossStreet
                     if '/LowCrossStreet/' in xpath_str and 'HighCrossStreet' in xpath_str:
@@ -904,7 +1295,7 @@ class XPathMapper:
                             high_part = base_path + '/HighCrossStreet'
                             
                             xpath_parts = [low_part, high_part]
-                            self.logger.info(f"Separación automática: {xpath_parts}")
+                            self.logger.info("Separación automática: %s", xpath_parts)
             
             
             # Si encontramos operadores de concatenación, procesar múltiples XPaths
@@ -915,22 +1306,22 @@ class XPathMapper:
                     value = self._evaluate_xpath_with_conditions(root, xpath_part)
                     if value and str(value).strip():
                         street_values.append(str(value).strip())
-                        self.logger.debug(f"Valor extraído de '{xpath_part}': '{value}'")
+                        self.logger.debug("Valor extraído de '%s': '%s'", xpath_part, value)
                 
                 if street_values:
                     # Unir con / entre valores
                     result = "/".join(street_values)
-                    self.logger.info(f"Cross street combinado: {result}")
+                    self.logger.info("Cross street combinado: %s", result)
                     return result
                 else:
-                    self.logger.warning(f"No se encontraron valores para ninguna parte del cross_street")
+                    self.logger.warning("No se encontraron valores para ninguna parte del cross_street")
             
             # Para xpath simple (sin operadores de concatenación)
-            self.logger.debug(f"Procesando como XPath simple: {xpath_str}")
+            self.logger.debug("Procesando como XPath simple: %s", xpath_str)
             return self._evaluate_xpath_with_conditions(root, xpath_str)
             
         except Exception as e:
-            self.logger.error(f"Error procesando cross_street: {e}")
+            self.logger.error("Error procesando cross_street: %s", e)
             return None
     
     def _parse_when_condition_status(self, root, xpath_str):
@@ -939,26 +1330,23 @@ class XPathMapper:
         Ejemplo: WHEN //Path/Status = 'Complete' THEN 'closed' ELSE 'open'
         """
         try:
-            import re
-            
-            # Patrón para WHEN condition THEN value ELSE value
-            when_pattern = r'WHEN\s+(.+?)\s*=\s*[\'"]([^\'\"]+)[\'"]\s+THEN\s+[\'"]([^\'\"]+)[\'"]\s+ELSE\s+[\'"]([^\'\"]+)[\'"]'
-            match = re.search(when_pattern, xpath_str, re.IGNORECASE)
-            
-            if match:
-                condition_xpath = match.group(1).strip()
-                condition_value = match.group(2)
-                then_value = match.group(3)
-                else_value = match.group(4)
+            # Regla WHEN condition THEN value ELSE value precompilada al cargar el mapeo
+            when_rule = self._get_when_rule(xpath_str)
+            
+            if when_rule:
+                condition_xpath = when_rule['condition_xpath']
+                condition_value = when_rule['condition_value']
+                then_value = when_rule['then_value']
+                else_value = when_rule['else_value']
                 
-                self.logger.debug(f"WHEN condition: {condition_xpath} = '{condition_value}' THEN '{then_value}' ELSE '{else_value}'")
+                self.logger.debug("WHEN condition: %s = '%s' THEN '%s' ELSE '%s'", condition_xpath, condition_value, then_value, else_value)
                 
                 # Evaluar condición
                 actual_value = self._evaluate_xpath_with_conditions(root, condition_xpath)
                 
                 # Si no se encontró valor, intentar con case-insensitive fallback
                 if not actual_value:
-                    self.logger.debug(f"XPath condición '{condition_xpath}' no encontró valor para status_code, intentando case-insensitive")
+                    self.logger.debug("XPath condición '%s' no encontró valor para status_code, intentando case-insensitive", condition_xpath)
                     actual_value = self._try_case_insensitive_xpath(root, condition_xpath)
                 
                 if actual_value and str(actual_value).strip().lower() == condition_value.lower():
@@ -979,13 +1367,14 @@ class XPathMapper:
                     return "open"
             
         except Exception as e:
-            self.logger.error(f"Error parseando WHEN condition: {e}")
+            self.logger.error("Error parseando WHEN condition: %s", e)
             return "open"
     
-    def _extract_record_identifiers(self, root, xml_file):
+    def _extract_record_identifiers(self, root, xml_file, trie_matches=None):
         """
         Extraer identificadores únicos del XML (xref_id, dispatch_number, incident_number).
-        Retorna un diccionario con los identificadores encontrados.
+        Retorna un diccionario con los identificadores encontrados. trie_matches: valores de las rutas
+        simples ya recorridas con el trie (ver _scan_xml_file); si el árbol no se conservó, root queda vacío.
         """
         identifiers = {
             'xref_id': None,
@@ -994,85 +1383,31 @@ class XPathMapper:
         }
         
         try:
-            self.logger.debug(f"Extrayendo identificadores del XML: {xml_file}")
-            
-            # Buscar xref_id y dispatch_number en el mapeo
-            if hasattr(self, 'mapping_data') and self.mapping_data is not None:
-                for _, row in self.mapping_data.iterrows():
-                    try:
-                        table_name = row.get('table_name', '')
-                        column_name = row.get('column_name', '')
-                        xpath = row.get('xpath', '')
-                        
-                        if pd.isna(table_name) or pd.isna(column_name) or pd.isna(xpath):
-                            continue
-                        
-                        column_lower = str(column_name).lower()
-                        
-                        # Buscar xref_id
-                        if 'xref' in column_lower and xpath:
-                            value = self._evaluate_xpath_with_conditions(root, xpath)
-                            if value:
-                                identifiers['xref_id'] = str(value).strip()
-                                self.logger.info(f"xref_id extraído: {identifiers['xref_id']}")
-                        
-                        # Buscar dispatch_number
-                        elif 'dispatch_number' in column_lower and xpath:
-                            value = self._evaluate_xpath_with_conditions(root, xpath)
-                            if value:
-                                identifiers['dispatch_number'] = str(value).strip()
-                                self.logger.info(f"dispatch_number extraído: {identifiers['dispatch_number']}")
-                        
-                        # Buscar incident_number
-                        elif 'incident_number' in column_lower and xpath:
-                            value = self._evaluate_xpath_with_conditions(root, xpath)
-                            if value:
-                                identifiers['incident_number'] = str(value).strip()
-                                self.logger.info(f"incident_number extraído: {identifiers['incident_number']}")
-                                
-                    except Exception as e:
-                        self.logger.debug(f"Error extrayendo identificador de fila: {e}")
-                        continue
+            self.logger.debug("Extrayendo identificadores del XML: %s", xml_file)
+            
+            # Buscar xref_id, dispatch_number e incident_number en las filas del mapeo que los contienen
+            for id_type, xpath in self._identifier_mappings:
+                try:
+                    value = self._identifier_value(root, xpath, trie_matches)
+                    if value:
+                        identifiers[id_type] = str(value).strip()
+                        self.logger.info("%s extraído: %s", id_type, identifiers[id_type])
+                except Exception as e:
+                    self.logger.debug("Error extrayendo identificador de fila: %s", e)
+                    continue
             
             # Si no se encontraron en el mapeo, intentar rutas comunes
             if not any(identifiers.values()):
                 self.logger.info("No se encontraron identificadores en mapeo, probando rutas comunes...")
                 
-                # Rutas XPath comunes para identificadores
-                common_xpaths = {
-                    'xref_id': [
-                        '//XRefId',
-                        '//xref_id', 
-                        '//Xref_Id',
-                        '//CADMasterCallTable/CADActiveCallTable/RelatedRecordNumber',
-                        '//MasterIncidentNumber',
-                        '//DispatchID'
-                    ],
-                    'dispatch_number': [
-                        '//DispatchNumber',
-                        '//FirstDueExport/NFIRSData/DispatchNumber',  # Específico para FirstDueExport
-                        '//FirstDueExport/NfirsData/DispatchNumber',   # Fallback case-insensitive
-                        '//dispatch_number',
-                        '//CallNumber',
-                        '//IncidentNumber',
-                        '//CADNumber'
-                    ],
-                    'incident_number': [
-                        '//IncidentNumber',
-                        '//incident_number',
-                        '//RunNumber',
-                        '//CallNumber'
-                    ]
-                }
-                
-                for id_type, xpaths in common_xpaths.items():
+                for id_type, xpaths in self.COMMON_IDENTIFIER_XPATHS.items():
                     if identifiers[id_type] is None:
                         for xpath in xpaths:
                             try:
-                                value = self._evaluate_xpath_with_conditions(root, xpath)
+                                value = self._identifier_value(root, xpath, trie_matches)
                                 if value:
                                     identifiers[id_type] = str(value).strip()
-                                    self.logger.info(f"{id_type} extraído con xpath común '{xpath}': {identifiers[id_type]}")
+                                    self.logger.info("%s extraído con xpath común '%s': %s", id_type, xpath, identifiers[id_type])
                                     break
                             except Exception as e:
                                 continue
@@ -1080,34 +1415,36 @@ class XPathMapper:
             # Log de resultado
             found_ids = {k: v for k, v in identifiers.items() if v}
             if found_ids:
-                self.logger.info(f"Identificadores encontrados para {xml_file}: {found_ids}")
+                self.logger.info("Identificadores encontrados para %s: %s", xml_file, found_ids)
             else:
-                self.logger.warning(f"No se pudieron extraer identificadores de {xml_file}")
+                self.logger.warning("No se pudieron extraer identificadores de %s", xml_file)
             
             return identifiers
             
         except Exception as e:
-            self.logger.error(f"Error extrayendo identificadores de {xml_file}: {e}")
+            self.logger.error("Error extrayendo identificadores de %s: %s", xml_file, e)
             return identifiers
     
-    def _verify_record_exists_in_db(self, record_identifiers):
+    def _identifier_value(self, root, xpath, trie_matches=None):
+        """Valor de un XPath de identificador: desde el trie si es una ruta simple, o evaluándolo sobre el árbol."""
+        if trie_matches is not None and xpath in trie_matches:
+            return trie_matches[xpath].get(path_variant(*parse_simple_path(xpath)))
+        return self._evaluate_xpath_with_conditions(root, xpath)
+
+    def _verify_record_exists_in_db(self, record_identifiers, db=None):
         """
         Verificar si existe al menos un registro en la BD que coincida con los identificadores del XML.
         Busca el valor del XML en AMBOS campos: dispatch.xref_id Y nfirs_notification.dispatch_number
         Retorna (found: bool, table_name: str or None) - la tabla donde se encontró el registro.
         """
+        if db is None:
+            db = self.db
         if not record_identifiers or not any(record_identifiers.values()):
             return False, None
         
         try:
             # Obtener filtros de configuración
-            filters = self.config.get('filters', {}) if self.config else {}
-            batt_dept_filter = filters.get('batt_dept_id', {})
-            datetime_filter = filters.get('datetime', {})
-            
-            batt_dept_values = batt_dept_filter.get('values', [4611])
-            batt_dept_ids = ','.join(str(val) for val in batt_dept_values)
-            start_datetime = datetime_filter.get('start_datetime', '2025-09-22 00:00:00')
+            batt_dept_ids, start_datetime = self._configured_filters()
             
             # Extraer el valor principal del XML (puede ser xref_id o dispatch_number)
             xml_value = None
@@ -1120,311 +1457,723 @@ class XPathMapper:
                 self.logger.warning("No se encontró xref_id ni dispatch_number en los identificadores")
                 return False, None
             
-            self.logger.info(f"🔍 Buscando valor '{xml_value}' en dispatch.xref_id y nfirs_notification.dispatch_number")
-            
-            # Buscar PRIMERO en dispatch.xref_id
-            dispatch_query = f"""
-                SELECT 'dispatch' as tabla_encontrada, xref_id FROM dispatch d 
-                WHERE d.batt_dept_id IN ({batt_dept_ids})
-                AND d.created_at >= '{start_datetime}'
-                AND d.xref_id = '{xml_value}'
-                LIMIT 1
-            """
-            
-            # Buscar SEGUNDO en nfirs_notification.dispatch_number
-            nfirs_query = f"""
-                SELECT 'nfirs_notification' as tabla_encontrada, dispatch_number FROM nfirs_notification n 
-                WHERE n.batt_dept_id IN ({batt_dept_ids})
-                AND n.created_at >= '{start_datetime}'
-                AND n.dispatch_number = '{xml_value}'
-                LIMIT 1
-            """
-            
-            # Combinar ambas queries con UNION para buscar en ambas tablas
-            combined_query = f"({dispatch_query}) UNION ({nfirs_query})"
+            self.logger.info("🔍 Buscando valor '%s' en dispatch.xref_id y nfirs_notification.dispatch_number", xml_value)
             
-            self.logger.debug(f"Query de búsqueda combinada: {combined_query}")
+            # Buscar en dispatch.xref_id y en nfirs_notification.dispatch_number con una sola consulta UNION
+            params = (batt_dept_ids, start_datetime, xml_value, batt_dept_ids, start_datetime, xml_value)
+            self.logger.debug("Query de búsqueda combinada: %s %s", self.VERIFY_RECORD_QUERY, params)
             
-            if self.cursor is not None:
-                self.cursor.execute(combined_query)
-                results = self.cursor.fetchall()
+            if db is not None:
+                query_start = time.perf_counter()
+                results = db.fetchall(self.VERIFY_RECORD_QUERY, params, prepare=True)
+                self._record_query_time('dispatch/nfirs_notification', self.VERIFY_RECORD_QUERY, time.perf_counter() - query_start, 'verificacion_bd')
                 
                 if results:
                     # Retornar el primer resultado encontrado
                     tabla_encontrada = results[0][0]
                     valor_encontrado = results[0][1]
-                    self.logger.info(f"✅ Registro encontrado en {tabla_encontrada}: {valor_encontrado}")
+                    self.logger.info("✅ Registro encontrado en %s: %s", tabla_encontrada, valor_encontrado)
                     return True, tabla_encontrada
                 else:
-                    self.logger.warning(f"❌ Valor '{xml_value}' NO encontrado en dispatch.xref_id ni en nfirs_notification.dispatch_number")
+                    self.logger.warning("❌ Valor '%s' NO encontrado en dispatch.xref_id ni en nfirs_notification.dispatch_number", xml_value)
                     return False, None
             
             return False, None
             
         except Exception as e:
-            self.logger.error(f"Error verificando existencia de registro: {e}")
+            self.logger.error("Error verificando existencia de registro: %s", e)
             return False, None
     
-    def load_mapping_file(self):
-        """Cargar el archivo de mapeo Excel."""
+    def _merge_found_records(self, found_records, rows):
+        """Agregar a found_records ({valor_xml: tabla}) las filas (tabla, valor) de una verificación en bloque."""
+        for tabla_encontrada, valor_encontrado in rows:
+            # dispatch tiene prioridad sobre nfirs_notification, igual que en la búsqueda por archivo
+            valor_encontrado = str(valor_encontrado)
+            if valor_encontrado not in found_records or tabla_encontrada == 'dispatch':
+                found_records[valor_encontrado] = tabla_encontrada
+
+    def _get_primary_identifier(self, record_identifiers):
+        """Valor principal del XML usado para buscar el registro: xref_id o, si no existe, dispatch_number."""
+        if not record_identifiers:
+            return None
+        return record_identifiers.get('xref_id') or record_identifiers.get('dispatch_number')
+
+    def _bulk_verify_records_exist_in_db(self, identifiers_by_file, batch_size=1000):
+        """
+        Verificar en bloque la existencia de todos los identificadores de la carpeta.
+        Busca los valores en dispatch.xref_id y nfirs_notification.dispatch_number con arreglos
+        (= ANY(%s)) en vez de una consulta UNION por archivo.
+        Retorna {valor_xml: tabla_encontrada} o None si la consulta en bloque no se pudo ejecutar.
+        """
+        if self.db is None:
+            return None
+        
         try:
-            if not self.mapping_file:
-                raise Exception("No se ha especificado el archivo de mapeo")
-                
-            # Leer el archivo Excel
-            self.mapping_data = pd.read_excel(self.mapping_file)
+            # Obtener filtros de configuración
+            batt_dept_ids, start_datetime = self._configured_filters()
             
-            self.logger.info(f"Columnas encontradas en el Excel: {list(self.mapping_data.columns)}")
+            xml_values = sorted({
+                str(value) for value in (self._get_primary_identifier(ids) for ids in identifiers_by_file.values()) if value
+            })
             
-            # Definir columnas específicas basándose en la estructura real del Excel
-            xpath_col = 'Data Source Mappings'
+            self.logger.info(f"🔍 Verificando en bloque {len(xml_values)} identificadores en dispatch y nfirs_notification")
             
-            # Columnas para CAD Dispatch (columnas 5 y 6)
-            dispatch_table_col = 'CAD Dispatch '  # Columna 5: nombres de tabla
-            dispatch_field_col = 'Unnamed: 6'    # Columna 6: nombres de campo
+            found_records = {}
+            for start in range(0, len(xml_values), batch_size):
+                batch = xml_values[start:start + batch_size]
+                query_start = time.perf_counter()
+                rows = self.db.fetchall(self.BULK_VERIFY_QUERY, (batt_dept_ids, start_datetime, batch, batt_dept_ids, start_datetime, batch), prepare=True)
+                self._record_query_time('dispatch/nfirs_notification', self.BULK_VERIFY_QUERY, time.perf_counter() - query_start, 'verificacion_bd')
+                self._merge_found_records(found_records, rows)
             
-            # Columnas para CAD Incident (columnas 7 y 8)
-            incident_table_col = 'CAD Incident'   # Columna 7: nombres de tabla
-            incident_field_col = 'Unnamed: 8'    # Columna 8: nombres de campo
+            self.logger.info(f"✅ {len(found_records)}/{len(xml_values)} identificadores encontrados en la BD")
+            return found_records
             
-            self.logger.info(f"Usando columnas definidas - XPath: {xpath_col}")
-            self.logger.info(f"Dispatch - Tabla: {dispatch_table_col} (col 5), Campo: {dispatch_field_col} (col 6)")
-            self.logger.info(f"Incident - Tabla: {incident_table_col} (col 7), Campo: {incident_field_col} (col 8)")
+        except Exception as e:
+            self.logger.warning(f"Verificación en bloque falló, se verificará archivo por archivo: {e}")
+            return None
+
+    def load_mapping_file(self):
+        """Cargar el archivo de mapeo Excel."""
+        load_start = time.perf_counter()
+        try:
+            if not self.mapping_file:
+                raise Exception("No se ha especificado el archivo de mapeo")
+                
+            self.rejected_mappings = []
             
-            # Crear mapeos válidos leyendo directamente del Excel
-            valid_mappings = []
+            # Reutilizar el plan de mapeos ya resuelto si el Excel y los filtros no cambiaron
+            cache_path, cache_key = self._mapping_plan_cache_location()
+            mapping_plan = self._load_mapping_plan_cache(cache_path, cache_key)
             
-            for idx, row in self.mapping_data.iterrows():
-                # Saltar fila de headers (fila 0)
-                if idx == 0:
-                    continue
-                    
-                # Obtener ruta XPath
-                xpath_raw = row.get(xpath_col, '') if xpath_col in self.mapping_data.columns else ''
-                if pd.isna(xpath_raw) or not str(xpath_raw).strip():
-                    continue
-                
-                # Procesar XPath
-                xpath = self._process_xpath(xpath_raw)
-                if not xpath:
-                    continue
-                
-                # Procesar AMBAS columnas (CAD Dispatch y CAD Incident) por separado
-                mappings_found = []
-                
-                # 1. Verificar CAD Dispatch (columnas 5 y 6)
-                if dispatch_table_col in self.mapping_data.columns and dispatch_field_col in self.mapping_data.columns:
-                    dispatch_table_val = row.get(dispatch_table_col, '')
-                    dispatch_field_val = row.get(dispatch_field_col, '')
-                    
-                    if (not pd.isna(dispatch_table_val) and str(dispatch_table_val).strip() and 
-                        str(dispatch_table_val).strip() not in ['CAD Table'] and
-                        not pd.isna(dispatch_field_val) and str(dispatch_field_val).strip() and
-                        str(dispatch_field_val).strip() not in ['CAD Column']):
-                        
-                        table_name = str(dispatch_table_val).strip()
-                        field_original = str(dispatch_field_val).strip()
-                        field_normalized = self._normalize_field_name(field_original)
-                        
-                        mappings_found.append({
-                            'table_name': table_name,
-                            'field_original': field_original,
-                            'field_normalized': field_normalized,
-                            'source': 'CAD_Dispatch'
-                        })
-                
-                # 2. Verificar CAD Incident (columnas 7 y 8)
-                if incident_table_col in self.mapping_data.columns and incident_field_col in self.mapping_data.columns:
-                    incident_table_val = row.get(incident_table_col, '')
-                    incident_field_val = row.get(incident_field_col, '')
-                    
-                    if (not pd.isna(incident_table_val) and str(incident_table_val).strip() and 
-                        str(incident_table_val).strip() not in ['CAD Table'] and
-                        not pd.isna(incident_field_val) and str(incident_field_val).strip() and
-                        str(incident_field_val).strip() not in ['CAD Column']):
-                        
-                        table_name = str(incident_table_val).strip()
-                        field_original = str(incident_field_val).strip()
-                        field_normalized = self._normalize_field_name(field_original)
-                        
-                        mappings_found.append({
-                            'table_name': table_name,
-                            'field_original': field_original,
-                            'field_normalized': field_normalized,
-                            'source': 'CAD_Incident'
-                        })
-                
-                # 3. Crear mapeos válidos para cada tabla/campo encontrado
-                for mapping_info in mappings_found:
-                    # Crear query SQL con filtros específicos
-                    query = self._build_filtered_query(mapping_info['table_name'], mapping_info['field_normalized'])
-                    
-                    valid_mappings.append({
-                        'xpath': xpath,
-                        'query': query,
-                        'xpath_raw': xpath_raw,
-                        'table_name': mapping_info['table_name'],
-                        'column_name': mapping_info['field_normalized'],
-                        'column_original': mapping_info['field_original'],
-                        'source': mapping_info['source'],
-                        'row_index': idx
-                    })
+            if mapping_plan is not None:
+                valid_mappings = mapping_plan['valid_mappings']
+                self.rejected_mappings = mapping_plan['rejected_mappings']
+            else:
+                valid_mappings = self._resolve_mapping_workbook()
+                self._save_mapping_plan_cache(cache_path, cache_key, valid_mappings)
             
-            if not valid_mappings:
-                self.logger.warning("No se encontraron mapeos válidos. Usando mapeo de ejemplo.")
-                # Crear un mapeo de ejemplo para probar
-                valid_mappings = [{
-                    'xpath': '//Incident/IncidentNumber',
-                    'query': self._build_filtered_query('nfirs_notification', 'incident_number'),
-                    'xpath_raw': '<Incident> <IncidentNumber>',
-                    'table_name': 'nfirs_notification',
-                    'column_name': 'incident_number',
-                    'column_original': 'incident_number',
-                    'source': 'Example'
-                }]
+            # Compilar las expresiones una sola vez para todos los archivos y rechazar las no compilables
+            valid_mappings = self._compile_mappings(valid_mappings)
             
             # Guardar los mapeos válidos tanto como lista como DataFrame
             self.valid_mappings = valid_mappings
             self.mapping_data = pd.DataFrame(valid_mappings)
+            self._prepare_path_trie()
+            self._prepare_xslt_extractor()
+            self._prepare_block_delimiter()
+            self._prepare_extraction_cache()
             
             self.logger.info(f"Archivo de mapeo cargado exitosamente: {self.mapping_file}")
             self.logger.info(f"Número de mapeos válidos cargados: {len(valid_mappings)}")
             
+            self.mapping_load_seconds = time.perf_counter() - load_start
             return True
         except Exception as e:
             self.logger.error(f"Error al cargar el archivo de mapeo: {str(e)}")
             return False
 
-    def _build_filtered_query(self, table_name, column_name, record_identifiers=None):
-        """Construir query SQL con filtros específicos para cada tabla usando configuración y identificadores del XML."""
-        try:
-            # Normalizar nombres de columnas reemplazando espacios con guiones bajos
-            normalized_column = column_name.replace(' ', '_') if column_name else column_name
-            
-            # Obtener filtros de la configuración
-            filters = self.config.get('filters', {}) if self.config else {}
-            batt_dept_filter = filters.get('batt_dept_id', {})
-            datetime_filter = filters.get('datetime', {})
-            
-            # Obtener valores de filtros
-            batt_dept_values = batt_dept_filter.get('values', [4611])  # Valor por defecto para Obion TN
-            batt_dept_ids = ','.join(str(val) for val in batt_dept_values)
-            
-            start_datetime = datetime_filter.get('start_datetime', '2025-09-22 00:00:00')  # Valor por defecto
+    def _resolve_mapping_workbook(self):
+        """Leer el Excel de mapeo y resolver sus filas en mapeos (xpath, tabla, columna y query)."""
+        # Leer el archivo Excel
+        self.mapping_data = pd.read_excel(self.mapping_file)
+        
+        self.logger.info(f"Columnas encontradas en el Excel: {list(self.mapping_data.columns)}")
+        
+        # Definir columnas específicas basándose en la estructura real del Excel
+        xpath_col = 'Data Source Mappings'
+        
+        # Columnas para CAD Dispatch (columnas 5 y 6)
+        dispatch_table_col = 'CAD Dispatch '  # Columna 5: nombres de tabla
+        dispatch_field_col = 'Unnamed: 6'    # Columna 6: nombres de campo
+        
+        # Columnas para CAD Incident (columnas 7 y 8)
+        incident_table_col = 'CAD Incident'   # Columna 7: nombres de tabla
+        incident_field_col = 'Unnamed: 8'    # Columna 8: nombres de campo
+        
+        self.logger.info(f"Usando columnas definidas - XPath: {xpath_col}")
+        self.logger.info(f"Dispatch - Tabla: {dispatch_table_col} (col 5), Campo: {dispatch_field_col} (col 6)")
+        self.logger.info(f"Incident - Tabla: {incident_table_col} (col 7), Campo: {incident_field_col} (col 8)")
+        
+        # Crear mapeos válidos leyendo directamente del Excel
+        valid_mappings = []
+        
+        for idx, row in self.mapping_data.iterrows():
+            # Saltar fila de headers (fila 0)
+            if idx == 0:
+                continue
+                
+            # Obtener ruta XPath
+            xpath_raw = row.get(xpath_col, '') if xpath_col in self.mapping_data.columns else ''
+            if pd.isna(xpath_raw) or not str(xpath_raw).strip():
+                continue
+            
+            # Procesar XPath
+            xpath = self._process_xpath(xpath_raw)
+            if not xpath:
+                if self._is_when_clause(xpath_raw):
+                    self.rejected_mappings.append({
+                        'row_index': idx,
+                        'table_name': 'N/A',
+                        'column_name': 'N/A',
+                        'xpath_raw': xpath_raw,
+                        'motivo': "No se pudo compilar la cláusula WHEN"
+                    })
+                continue
             
-            # Construir la query base con alias para evitar ambigüedades
-            table_alias = table_name[0]  # Usar primera letra como alias (d para dispatch, n para nfirs_notification)
-            query = f"SELECT {table_alias}.{normalized_column} FROM {table_name} {table_alias} WHERE 1=1"
+            # Procesar AMBAS columnas (CAD Dispatch y CAD Incident) por separado
+            mappings_found = []
+            
+            # 1. Verificar CAD Dispatch (columnas 5 y 6)
+            if dispatch_table_col in self.mapping_data.columns and dispatch_field_col in self.mapping_data.columns:
+                dispatch_table_val = row.get(dispatch_table_col, '')
+                dispatch_field_val = row.get(dispatch_field_col, '')
+                
+                if (not pd.isna(dispatch_table_val) and str(dispatch_table_val).strip() and 
+                    str(dispatch_table_val).strip() not in ['CAD Table'] and
+                    not pd.isna(dispatch_field_val) and str(dispatch_field_val).strip() and
+                    str(dispatch_field_val).strip() not in ['CAD Column']):
+                    
+                    table_name = str(dispatch_table_val).strip()
+                    field_original = str(dispatch_field_val).strip()
+                    field_normalized = self._normalize_field_name(field_original)
+                    
+                    mappings_found.append({
+                        'table_name': table_name,
+                        'field_original': field_original,
+                        'field_normalized': field_normalized,
+                        'source': 'CAD_Dispatch'
+                    })
+            
+            # 2. Verificar CAD Incident (columnas 7 y 8)
+            if incident_table_col in self.mapping_data.columns and incident_field_col in self.mapping_data.columns:
+                incident_table_val = row.get(incident_table_col, '')
+                incident_field_val = row.get(incident_field_col, '')
+                
+                if (not pd.isna(incident_table_val) and str(incident_table_val).strip() and 
+                    str(incident_table_val).strip() not in ['CAD Table'] and
+                    not pd.isna(incident_field_val) and str(incident_field_val).strip() and
+                    str(incident_field_val).strip() not in ['CAD Column']):
+                    
+                    table_name = str(incident_table_val).strip()
+                    field_original = str(incident_field_val).strip()
+                    field_normalized = self._normalize_field_name(field_original)
+                    
+                    mappings_found.append({
+                        'table_name': table_name,
+                        'field_original': field_original,
+                        'field_normalized': field_normalized,
+                        'source': 'CAD_Incident'
+                    })
+            
+            # 3. Crear mapeos válidos para cada tabla/campo encontrado
+            for mapping_info in mappings_found:
+                # Crear query SQL con filtros específicos
+                query = self._build_filtered_query(mapping_info['table_name'], mapping_info['field_normalized'])
+                
+                valid_mappings.append({
+                    'xpath': xpath,
+                    'query': query,
+                    'xpath_raw': xpath_raw,
+                    'table_name': mapping_info['table_name'],
+                    'column_name': mapping_info['field_normalized'],
+                    'column_original': mapping_info['field_original'],
+                    'source': mapping_info['source'],
+                    'row_index': idx
+                })
+        
+        if not valid_mappings:
+            self.logger.warning("No se encontraron mapeos válidos. Usando mapeo de ejemplo.")
+            # Crear un mapeo de ejemplo para probar
+            valid_mappings = [{
+                'xpath': '//Incident/IncidentNumber',
+                'query': self._build_filtered_query('nfirs_notification', 'incident_number'),
+                'xpath_raw': '<Incident> <IncidentNumber>',
+                'table_name': 'nfirs_notification',
+                'column_name': 'incident_number',
+                'column_original': 'incident_number',
+                'source': 'Example'
+            }]
+        
+        return valid_mappings
+
+    def _mapping_plan_hashes(self):
+        """
+        Hash del contenido del Excel de mapeo y hash de los filtros de la configuración (usados en las queries de
+        cada mapeo). Identifican el plan en la caché del plan de mapeos y en el checkpoint de una ejecución.
+        """
+        import hashlib
+        
+        with open(self.mapping_file, 'rb') as f:
+            workbook_hash = hashlib.sha256(f.read()).hexdigest()
+        
+        filters = self.config.get('filters', {}) if self.config else {}
+        filters_hash = hashlib.sha256(json.dumps(filters, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        return workbook_hash, filters_hash
+
+    def _mapping_plan_cache_location(self):
+        """
+        Ruta y clave de la caché del plan de mapeos. La clave combina el hash del contenido del Excel,
+        la versión del comparador y los filtros de la configuración (ver _mapping_plan_hashes).
+        """
+        workbook_hash, filters_hash = self._mapping_plan_hashes()
+        cache_key = f"{self.COMPARATOR_VERSION}:{workbook_hash}:{filters_hash}"
+        
+        cache_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'cache', 'mapping_plans')
+        workbook_name = os.path.splitext(os.path.basename(self.mapping_file))[0]
+        cache_path = os.path.join(cache_dir, f"{workbook_name}_{workbook_hash[:16]}.json")
+        
+        return cache_path, cache_key
+
+    def _prepare_path_trie(self):
+        """
+        Compilar en un trie las rutas simples del mapeo (sin predicados ni concatenaciones, en columnas sin
+        lógica especial) y de los identificadores, para extraerlas en una sola pasada por documento. Si todas
+        las expresiones son rutas simples, el documento se recorre sin conservar el árbol.
+        """
+        self._identifier_mappings = []
+        for row in self.valid_mappings:
+            xpath = row.get('xpath')
+            if not xpath or pd.isna(row.get('table_name')) or pd.isna(row.get('column_name')):
+                continue
+            column_lower = str(row['column_name']).lower()
+            if 'xref' in column_lower:
+                self._identifier_mappings.append(('xref_id', xpath))
+            elif 'dispatch_number' in column_lower:
+                self._identifier_mappings.append(('dispatch_number', xpath))
+            elif 'incident_number' in column_lower:
+                self._identifier_mappings.append(('incident_number', xpath))
+        
+        self.path_trie = None
+        self._trie_mappings = [False] * len(self.valid_mappings)
+        self._streaming_extraction = False
+        if self.config and not self.config.get('processing', {}).get('trie_extraction', True):
+            return
+        if self._extraction_engine() == 'xslt':
+            # La hoja XSLT ya resuelve las rutas simples junto con el resto de las expresiones
+            return
+        
+        self._trie_mappings = [
+            bool(row['xpath']) and not self._uses_special_logic(row['column_name']) and parse_simple_path(row['xpath']) is not None
+            for row in self.valid_mappings
+        ]
+        identifier_xpaths = [xpath for _, xpath in self._identifier_mappings]
+        common_xpaths = [xpath for xpaths in self.COMMON_IDENTIFIER_XPATHS.values() for xpath in xpaths]
+        trie_xpaths = [row['xpath'] for row, in_trie in zip(self.valid_mappings, self._trie_mappings) if in_trie]
+        self.path_trie = PathTrie(trie_xpaths + identifier_xpaths + common_xpaths)
+        
+        self._streaming_extraction = (
+            all(in_trie or not row['xpath'] for row, in_trie in zip(self.valid_mappings, self._trie_mappings))
+            and all(xpath in self.path_trie.paths for xpath in identifier_xpaths)
+        )
+        self.logger.info(f"🌲 Rutas simples en una sola pasada: {sum(self._trie_mappings)} de {len(self.valid_mappings)} mapeos "
+                         f"({len(self.path_trie)} rutas); {'sin conservar el árbol XML' if self._streaming_extraction else 'el resto con XPath sobre el árbol'}")
+
+    def _extraction_engine(self):
+        """Motor de extracción de processing.extraction_engine: 'xpath' (una evaluación por mapeo) o 'xslt'."""
+        engine = str(((self.config or {}).get('processing') or {}).get('extraction_engine', 'xpath')).lower()
+        if engine not in ('xpath', 'xslt'):
+            self.logger.warning("Motor de extracción desconocido '%s', se usa 'xpath' (opciones: xpath, xslt)", engine)
+            engine = 'xpath'
+        return engine
+
+    def _prepare_xslt_extractor(self):
+        """
+        Con processing.extraction_engine = 'xslt', compilar en una hoja de estilos todas las expresiones que
+        evalúa la extracción: cada parte de los mapeos (concatenaciones, narrativas y cross_street), las
+        condiciones de las reglas WHEN y las rutas de los identificadores. Cada documento se transforma una sola
+        vez; las expresiones que la hoja no cubre se siguen evaluando con XPath.
+        """
+        self.xslt_extractor = None
+        if self._extraction_engine() != 'xslt':
+            return
+        
+        expressions = []
+        for row in self.valid_mappings:
+            xpath = row['xpath']
+            if not xpath:
+                continue
+            if xpath.upper().startswith('WHEN '):
+                when_rule = self._get_when_rule(xpath)
+                if when_rule:
+                    expressions.append(when_rule['condition_xpath'])
+                continue
+            expressions.extend(self._mapping_xpath_parts(xpath))
+        expressions.extend(xpath for _, xpath in self._identifier_mappings)
+        expressions.extend(xpath for xpaths in self.COMMON_IDENTIFIER_XPATHS.values() for xpath in xpaths)
+        
+        try:
+            self.xslt_extractor = XsltExtractor(expressions)
+        except (etree.XSLTParseError, etree.XPathError) as e:
+            self.logger.error("❌ No se pudo compilar la hoja XSLT del mapeo, se usa la extracción por XPath: %s", e)
+            return
+        self.logger.info(f"🧩 Hoja XSLT del mapeo: {len(self.xslt_extractor)} expresiones en una transformación por documento"
+                         f"{f', {len(self.xslt_extractor.skipped)} se evalúan con XPath' if self.xslt_extractor.skipped else ''}")
+
+    def _prepare_block_delimiter(self):
+        """
+        Con processing.is_multiple_blocks_file, compilar processing.multiple_blocks_delimiter_xpath (los mismos
+        campos que parser_options en las plantillas de integración JSON): cada elemento que la cumple es un registro.
+        """
+        self._block_delimiter = None
+        processing = (self.config or {}).get('processing') or {}
+        if not processing.get('is_multiple_blocks_file', False):
+            return
+        
+        delimiter_xpath = processing.get('multiple_blocks_delimiter_xpath') or ''
+        self._block_delimiter = parse_simple_path(delimiter_xpath)
+        if self._block_delimiter is None:
+            self.logger.error(f"❌ multiple_blocks_delimiter_xpath debe ser una ruta simple (por ejemplo //Incidents/Incident), "
+                              f"no '{delimiter_xpath}': cada archivo se procesa como un solo registro")
+            return
+        if self._streaming_extraction:
+            # Cada bloque se copia a su propio árbol, así que el trie lo recorre sobre ese árbol
+            self._streaming_extraction = False
+        self.logger.info(f"📦 Archivos con varios bloques: un registro por cada elemento {delimiter_xpath}")
+
+    def _prepare_extraction_cache(self):
+        """
+        Con processing.extraction_cache, abrir la caché de registros extraídos en cache/extraction/. La clave del
+        plan combina la versión del comparador, la expresión, tabla y columna de cada mapeo (de las que dependen la
+        lógica especial y los identificadores), el motor de extracción y el delimitador de bloques; los filtros de la
+        BD no intervienen, así que cambiarlos no invalida la caché.
+        """
+        import hashlib
+        
+        self.extraction_cache = None
+        if not ((self.config or {}).get('processing') or {}).get('extraction_cache', False):
+            return
+        
+        plan = {
+            'version': self.COMPARATOR_VERSION,
+            'mapeos': [[row['xpath'], str(row['table_name']), str(row['column_name'])] for row in self.valid_mappings],
+            'identificadores_comunes': self.COMMON_IDENTIFIER_XPATHS,
+            'narrativas': sorted(self.NARRATIVE_COLUMNS),
+            'motor': self._extraction_engine() if self.xslt_extractor is not None else 'xpath',
+            'bloques': self._block_delimiter,
+        }
+        plan_hash = hashlib.sha256(json.dumps(plan, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+        cache_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'cache', 'extraction', 'extracciones.sqlite')
+        self.extraction_cache = ExtractionCache(cache_path, plan_hash)
+        self.logger.info(f"♻️ Caché de extracción activa: {cache_path} (plan {plan_hash[:12]})")
+
+    def _apply_xslt_extractor(self, root, xml_file):
+        """Transformar el documento con la hoja XSLT del mapeo; si falla, sus expresiones se evalúan con XPath."""
+        self._xslt_root = None
+        self._xslt_values = None
+        try:
+            self._xslt_values = self.xslt_extractor.extract(root)
+            self._xslt_root = root
+        except etree.XSLTApplyError as e:
+            self.logger.warning("Error aplicando la hoja XSLT a %s, se evalúa cada XPath: %s", xml_file, e)
+
+    def _uses_special_logic(self, column_name):
+        """La columna tiene lógica propia en _extract_xml_value_with_special_logic (no es una ruta directa)."""
+        column_lower = str(column_name).lower()
+        return column_lower == 'status_code' or column_lower in self.NARRATIVE_COLUMNS or 'cross_street' in column_lower
+
+    def _mapping_cache_enabled(self):
+        """La caché del plan de mapeos está activa salvo que processing.mapping_cache sea false."""
+        return bool(self.config.get('processing', {}).get('mapping_cache', True)) if self.config else True
+
+    def _load_mapping_plan_cache(self, cache_path, cache_key):
+        """Cargar el plan de mapeos desde la caché. Retorna None si no existe, es de otra versión o está dañado."""
+        if not self._mapping_cache_enabled() or not os.path.exists(cache_path):
+            return None
+        
+        try:
+            with open(cache_path, 'r', encoding='utf-8') as f:
+                mapping_plan = json.load(f)
+            
+            if mapping_plan.get('cache_key') != cache_key:
+                self.logger.info(f"Caché de mapeo desactualizada, se vuelve a leer el Excel: {cache_path}")
+                return None
+            
+            self.logger.info(f"Plan de mapeos cargado desde caché: {cache_path}")
+            return mapping_plan
+            
+        except Exception as e:
+            self.logger.warning(f"No se pudo leer la caché de mapeo {cache_path}: {e}")
+            return None
+
+    def _save_mapping_plan_cache(self, cache_path, cache_key, valid_mappings):
+        """Guardar el plan de mapeos resuelto y eliminar las cachés anteriores del mismo Excel."""
+        if not self._mapping_cache_enabled():
+            return
+        
+        try:
+            cache_dir = os.path.dirname(cache_path)
+            os.makedirs(cache_dir, exist_ok=True)
+            
+            # Las cachés de versiones anteriores del mismo Excel ya no sirven
+            workbook_prefix = os.path.basename(cache_path).rsplit('_', 1)[0] + '_'
+            for cache_file in os.listdir(cache_dir):
+                if cache_file.rsplit('_', 1)[0] + '_' == workbook_prefix:
+                    os.remove(os.path.join(cache_dir, cache_file))
+            
+            mapping_plan = {
+                'cache_key': cache_key,
+                'mapping_file': os.path.basename(self.mapping_file),
+                'valid_mappings': valid_mappings,
+                'rejected_mappings': self.rejected_mappings
+            }
+            
+            # Escribir en un archivo temporal y reemplazar, para no dejar cachés a medio escribir
+            temp_path = cache_path + '.tmp'
+            with open(temp_path, 'w', encoding='utf-8') as f:
+                json.dump(mapping_plan, f, ensure_ascii=False, separators=(',', ':'), default=str)
+            os.replace(temp_path, cache_path)
+            
+            self.logger.info(f"Plan de mapeos guardado en caché: {cache_path}")
+            
+        except Exception as e:
+            self.logger.warning(f"No se pudo guardar la caché de mapeo {cache_path}: {e}")
+
+    def _configured_filters(self):
+        """batt_dept_id (valores) y fecha de inicio de los filtros de la configuración, con sus valores por defecto."""
+        filters = self.config.get('filters', {}) if self.config else {}
+        batt_dept_ids = [int(val) for val in filters.get('batt_dept_id', {}).get('values', [4611])]  # Valor por defecto para Obion TN
+        start_datetime = filters.get('datetime', {}).get('start_datetime', '2025-09-22 00:00:00')  # Valor por defecto
+        return batt_dept_ids, start_datetime
+
+    def _build_filtered_query(self, table_name, column_name, record_identifiers=None):
+        """
+        Construir la consulta SQL con filtros específicos para cada tabla usando configuración e identificadores del XML.
+        column_name puede ser un nombre de columna o una lista de columnas para traerlas todas en un solo SELECT.
+        Retorna (query, params): la consulta es una plantilla fija por tabla, columnas y tipo de búsqueda
+        (se arma una vez y el backend la prepara una vez por conexión) y los valores van como parámetros.
+        """
+        try:
+            # Normalizar nombres de columnas reemplazando espacios con guiones bajos
+            column_names = list(column_name) if isinstance(column_name, (list, tuple)) else [column_name]
+            normalized_columns = tuple(col.replace(' ', '_') if col else col for col in column_names)
+            
+            batt_dept_ids, start_datetime = self._configured_filters()
+            table = table_name.lower()
             
             # PRIORIDAD: Si tenemos identificadores del XML, buscar el registro específico
-            specific_record_found = False
+            lookup = None
             if record_identifiers:
-                self.logger.debug(f"Intentando buscar registro específico con identificadores: {record_identifiers}")
+                self.logger.debug("Intentando buscar registro específico con identificadores: %s", record_identifiers)
                 
                 # Extraer el valor principal del XML
-                xml_value = None
-                if record_identifiers.get('xref_id'):
-                    xml_value = record_identifiers['xref_id']
-                elif record_identifiers.get('dispatch_number'):
-                    xml_value = record_identifiers['dispatch_number']
+                xml_value = self._get_primary_identifier(record_identifiers)
                 
                 if xml_value:
-                    # NUEVA LÓGICA: Buscar en los campos correctos según la tabla
-                    if table_name.lower() == 'dispatch':
+                    # Buscar en los campos correctos según la tabla
+                    if table == 'dispatch':
                         # En tabla dispatch buscar en campo xref_id
-                        query += f" AND {table_alias}.xref_id = '{xml_value}'"
-                        specific_record_found = True
-                        self.logger.info(f"Buscando dispatch por xref_id: {xml_value}")
-                    
-                    elif table_name.lower() == 'nfirs_notification':
+                        lookup = 'xref_id'
+                        params = (xml_value,)
+                        self.logger.info("Buscando dispatch por xref_id: %s", xml_value)
+                    elif table == 'nfirs_notification':
                         # En tabla nfirs_notification buscar en campo dispatch_number
-                        query += f" AND {table_alias}.dispatch_number = '{xml_value}'"
-                        specific_record_found = True
-                        self.logger.info(f"Buscando nfirs_notification por dispatch_number: {xml_value}")
+                        lookup = 'dispatch_number'
+                        params = (xml_value,)
+                        self.logger.info("Buscando nfirs_notification por dispatch_number: %s", xml_value)
                 
-                # También buscar por incident_number si está disponible (solo para nfirs_notification)
-                if not specific_record_found and table_name.lower() == 'nfirs_notification' and record_identifiers.get('incident_number'):
-                    query += f" AND {table_alias}.incident_number = '{record_identifiers['incident_number']}'"
-                    specific_record_found = True
-                    self.logger.info(f"Buscando nfirs_notification por incident_number: {record_identifiers['incident_number']}")
+                # También buscar por incident_number si está disponible (nfirs_notification y sus tablas hijas)
+                if lookup is None and record_identifiers.get('incident_number') and table in (
+                        'nfirs_notification', 'nfirs_notification_apparatus', 'nfirs_notification_personnel'):
+                    lookup = 'incident_number'
+                    params = (record_identifiers['incident_number'],)
+                    self.logger.info("Buscando %s por incident_number: %s", table_name, record_identifiers['incident_number'])
             
             # Si NO encontramos un registro específico, usar filtros generales (registro más reciente)
-            if not specific_record_found:
-                self.logger.debug(f"No se encontró identificador específico, usando filtros generales para {table_name}")
-                
-                # Aplicar filtros específicos según la tabla
-                if table_name.lower() == 'dispatch':
-                    # Para tabla dispatch: filtrar por batt_dept_id y created_at
-                    query += f" AND {table_alias}.batt_dept_id IN ({batt_dept_ids})"
-                    query += f" AND {table_alias}.created_at >= '{start_datetime}'"
-                    
-                elif table_name.lower() == 'nfirs_notification':
-                    # Para tabla nfirs_notification: filtrar por batt_dept_id y created_at
-                    query += f" AND {table_alias}.batt_dept_id IN ({batt_dept_ids})"
-                    query += f" AND {table_alias}.created_at >= '{start_datetime}'"
-                    
-                elif table_name.lower() == 'nfirs_notification_apparatus':
-                    # Para nfirs_notification_apparatus: necesita JOIN con nfirs_notification
-                    if record_identifiers and record_identifiers.get('incident_number'):
-                        query = f"""SELECT nna.{normalized_column} 
-                                   FROM nfirs_notification_apparatus nna
-                                   INNER JOIN nfirs_notification nn ON nna.nfirs_notification_id = nn.id
-                                   WHERE nn.incident_number = '{record_identifiers['incident_number']}'"""
-                        specific_record_found = True
-                    else:
-                        query = f"""SELECT nna.{normalized_column} 
-                                   FROM nfirs_notification_apparatus nna
-                                   INNER JOIN nfirs_notification nn ON nna.nfirs_notification_id = nn.id
-                                   WHERE nn.batt_dept_id IN ({batt_dept_ids})
-                                   AND nn.created_at >= '{start_datetime}'
-                                   ORDER BY nn.id DESC LIMIT 1"""
-                               
-                elif table_name.lower() == 'nfirs_notification_personnel':
-                    # Para nfirs_notification_personnel: necesita JOIN con nfirs_notification
-                    if record_identifiers and record_identifiers.get('incident_number'):
-                        query = f"""SELECT nnp.{normalized_column} 
-                                   FROM nfirs_notification_personnel nnp
-                                   INNER JOIN nfirs_notification nn ON nnp.nfirs_notification_id = nn.id
-                                   WHERE nn.incident_number = '{record_identifiers['incident_number']}'"""
-                        specific_record_found = True
-                    else:
-                        query = f"""SELECT nnp.{normalized_column} 
-                                   FROM nfirs_notification_personnel nnp
-                                   INNER JOIN nfirs_notification nn ON nnp.nfirs_notification_id = nn.id
-                                   WHERE nn.batt_dept_id IN ({batt_dept_ids})
-                                   AND nn.created_at >= '{start_datetime}'
-                                   ORDER BY nn.id DESC LIMIT 1"""
-                               
-                elif table_name.lower() == 'batt_dept':
-                    # Para batt_dept, solo filtrar por ID (no tiene created_at)
-                    query += f" AND {table_alias}.id IN ({batt_dept_ids})"
-                    
-                else:
-                    # Para otras tablas, usar filtros generales
-                    self.logger.warning(f"Tabla desconocida: {table_name}, usando filtros generales")
-                    query += f" AND {table_alias}.batt_dept_id IN ({batt_dept_ids})"
-                    query += f" AND {table_alias}.created_at >= '{start_datetime}'"
+            if lookup is None:
+                self.logger.debug("No se encontró identificador específico, usando filtros generales para %s", table_name)
+                params = (batt_dept_ids,) if table == 'batt_dept' else (batt_dept_ids, start_datetime)
             
-            # Limitar resultados (solo si no encontramos registro específico y no es JOIN con ORDER BY)
-            if not specific_record_found and not ('JOIN' in query and 'ORDER BY' in query):
-                query += f" ORDER BY {table_alias}.id DESC LIMIT 1"
+            template_key = (table_name, normalized_columns, lookup)
+            query = self._query_templates.get(template_key)
+            if query is None:
+                query = self._filtered_query_template(table_name, normalized_columns, lookup)
+                self._query_templates[template_key] = query
             
             # Log del tipo de query generada
-            if specific_record_found:
-                self.logger.info(f"Query específica generada para {table_name}.{column_name}: {query}")
+            if lookup is not None:
+                self.logger.info("Query específica para %s.%s: %s %s", table_name, ','.join(normalized_columns), query, params)
             else:
-                self.logger.info(f"Query general (más reciente) generada para {table_name}.{column_name}: {query}")
+                self.logger.info("Query general (más reciente) para %s.%s: %s %s", table_name, ','.join(normalized_columns), query, params)
             
-            return query
+            return query, params
             
         except Exception as e:
-            self.logger.error(f"Error construyendo query filtrada: {str(e)}")
+            self.logger.error("Error construyendo query filtrada: %s", str(e))
             # Query simple sin filtros como fallback
-            escaped_column = f'"{column_name}"' if ' ' in column_name else column_name
-            return f"SELECT {escaped_column} FROM {table_name} LIMIT 1"
+            column_names = list(column_name) if isinstance(column_name, (list, tuple)) else [column_name]
+            escaped_columns = ', '.join(f'"{col}"' if ' ' in col else col for col in column_names)
+            return f"SELECT {escaped_columns} FROM {table_name} LIMIT 1", None
+
+    def _filtered_query_template(self, table_name, normalized_columns, lookup):
+        """
+        Plantilla SQL de _build_filtered_query para una tabla, sus columnas y el tipo de búsqueda
+        (lookup: columna del identificador del XML, o None para el registro más reciente de los filtros).
+        """
+        def select_list(alias):
+            return ', '.join(f"{alias}.{col}" for col in normalized_columns)
+        
+        table = table_name.lower()
+        # Usar primera letra como alias (d para dispatch, n para nfirs_notification)
+        table_alias = table_name[0]
+        
+        if table in ('nfirs_notification_apparatus', 'nfirs_notification_personnel'):
+            # Las tablas hijas necesitan JOIN con nfirs_notification
+            child_alias = 'nna' if table == 'nfirs_notification_apparatus' else 'nnp'
+            query = f"""SELECT {select_list(child_alias)} 
+                       FROM {table_name} {child_alias}
+                       INNER JOIN nfirs_notification nn ON {child_alias}.nfirs_notification_id = nn.id"""
+            if lookup == 'incident_number':
+                return query + """
+                       WHERE nn.incident_number = %s"""
+            return query + """
+                       WHERE nn.batt_dept_id = ANY(%s)
+                       AND nn.created_at >= %s
+                       ORDER BY nn.id DESC LIMIT 1"""
+        
+        query = f"SELECT {select_list(table_alias)} FROM {table_name} {table_alias} WHERE 1=1"
+        
+        if lookup is not None:
+            return query + f" AND {table_alias}.{lookup} = %s"
+        
+        if table == 'batt_dept':
+            # Para batt_dept, solo filtrar por ID (no tiene created_at)
+            query += f" AND {table_alias}.id = ANY(%s)"
+        else:
+            if table not in ('dispatch', 'nfirs_notification'):
+                # Para otras tablas, usar filtros generales
+                self.logger.warning("Tabla desconocida: %s, usando filtros generales", table_name)
+            # Filtrar por batt_dept_id y created_at
+            query += f" AND {table_alias}.batt_dept_id = ANY(%s)"
+            query += f" AND {table_alias}.created_at >= %s"
+        
+        # Registro más reciente
+        return query + f" ORDER BY {table_alias}.id DESC LIMIT 1"
+
+    def _group_columns_by_table(self):
+        """Agrupar las columnas de valid_mappings por tabla, sin duplicados y en el orden del mapeo."""
+        columns_by_table = {}
+        for row in self.valid_mappings:
+            columns = columns_by_table.setdefault(row['table_name'], [])
+            if row['column_name'] not in columns:
+                columns.append(row['column_name'])
+        return columns_by_table
+
+    def _format_db_value(self, value):
+        """Convertir un valor leído de la BD al texto usado en la comparación."""
+        if value is None:
+            return None
+        return str(value).strip()
+
+    def _fetch_single_db_value(self, table_name, column_name, record_identifiers, db=None):
+        """Consultar una sola columna de la BD para el registro del XML (camino por campo)."""
+        if db is None:
+            db = self.db
+        query, params = self._build_filtered_query(table_name, column_name, record_identifiers)
+        
+        if not query:
+            self.logger.warning("No se pudo construir query para %s.%s", table_name, column_name)
+            return "ERROR_QUERY"
+        
+        try:
+            query_start = time.perf_counter()
+            result = db.fetchone(query, params, prepare=True)
+            self._record_query_time(table_name, query, time.perf_counter() - query_start)
+            return self._format_db_value(result[0]) if result else None
+        except Exception as db_error:
+            error_msg = str(db_error)
+            self.logger.error("Error SQL: %s", error_msg)
+            if "does not exist" in error_msg or "column" in error_msg.lower():
+                return "CAMPO_NO_EXISTE"
+            return "ERROR_QUERY"
+
+    def _fetch_record_values(self, record_identifiers, columns_by_table, db=None):
+        """
+        Traer de la BD todas las columnas mapeadas de cada tabla con un solo SELECT por tabla.
+        Retorna {tabla: {columna: valor}}. Si la consulta agrupada falla (por ejemplo una columna
+        inexistente), se consulta esa tabla columna por columna para conservar los errores por campo.
+        Las columnas que según el esquema no existen en la BD (ver _load_db_schema) no se consultan.
+        db: backend a usar (una conexión del pool), por defecto self.db.
+        """
+        if db is None:
+            db = self.db
+        record_values = {}
+        
+        for table_name, columns in columns_by_table.items():
+            missing_columns = self.missing_columns.get(table_name, [])
+            record_values[table_name] = {column: "CAMPO_NO_EXISTE" for column in missing_columns}
+            columns = [column for column in columns if column not in missing_columns]
+            if not columns:
+                continue
+            
+            query, params = self._build_filtered_query(table_name, columns, record_identifiers)
+            
+            try:
+                query_start = time.perf_counter()
+                result = db.fetchone(query, params, prepare=True)
+                self._record_query_time(table_name, query, time.perf_counter() - query_start)
+                record_values[table_name].update({
+                    column: self._format_db_value(result[i]) if result else None
+                    for i, column in enumerate(columns)
+                })
+            except Exception as db_error:
+                self.logger.warning("Consulta agrupada para %s falló, consultando columna por columna: %s", table_name, db_error)
+                record_values[table_name].update({
+                    column: self._fetch_single_db_value(table_name, column, record_identifiers, db)
+                    for column in columns
+                })
+        
+        return record_values
+
+    def _load_db_schema(self, columns_by_table):
+        """
+        Leer una vez por ejecución las columnas y sus tipos de cada tabla del mapeo (information_schema.columns
+        en PostgreSQL). Las columnas del mapeo que no existen se informan al inicio y quedan en missing_columns
+        para no consultarlas en cada archivo. Si el esquema no se puede leer, se consultan todas como antes.
+        """
+        self.db_schema = None
+        self.missing_columns = {}
+        if self.db is None:
+            return
+        
+        schema_start = time.perf_counter()
+        try:
+            schema = {}
+            for table_name in columns_by_table:
+                # Las consultas no citan los nombres: la BD los compara en minúsculas
+                columns = self.db.table_columns(table_name) or {}
+                schema[table_name] = {column.lower(): data_type for column, data_type in columns.items()}
+        except Exception as e:
+            self.logger.warning(f"No se pudo leer el esquema de la BD, se consultarán todas las columnas del mapeo: {e}")
+            return
+        finally:
+            self._record_stage('esquema_bd', time.perf_counter() - schema_start)
+        
+        self.db_schema = schema
+        for table_name, columns in columns_by_table.items():
+            if not schema[table_name]:
+                self.logger.warning(f"⚠️ La tabla {table_name} no existe en la BD: sus {len(columns)} columnas del mapeo no se consultarán")
+                self.missing_columns[table_name] = list(columns)
+                continue
+            missing_columns = [column for column in columns if column.replace(' ', '_').lower() not in schema[table_name]]
+            if missing_columns:
+                self.logger.warning(f"⚠️ Columnas del mapeo que no existen en {table_name} y no se consultarán: {', '.join(missing_columns)}")
+                self.missing_columns[table_name] = missing_columns
+
+    def db_column_type(self, table_name, column_name):
+        """
+        Tipo de una columna según el esquema leído al inicio de la ejecución, o None si no se conoce. La comparación
+        lo usa para normalizar los valores de columnas numéricas, booleanas y de fecha (_normalize_typed_value).
+        """
+        if not self.db_schema:
+            return None
+        return self.db_schema.get(table_name, {}).get(column_name.replace(' ', '_').lower())
 
     def connect_to_db(self):
-        """Conectar a la base de datos PostgreSQL usando la configuración cargada."""
+        """
+        Conectar a la base de datos usando la configuración cargada. database.backend elige el motor:
+        'postgresql' (por defecto) o 'sqlite' (database.path), ver db_backend.
+        """
         try:
             self.logger.info("Iniciando conexión a BD...")
             
@@ -1436,19 +2185,11 @@ class XPathMapper:
                 self.logger.error("No se encuentra sección 'database' en configuración")
                 return False
                 
-            db_config = self.config['database']
-            self.logger.info(f"Intentando conectar a BD: {db_config.get('host', 'N/A')}:{db_config.get('port', 'N/A')} DB: {db_config.get('dbname', 'N/A')}")
-            
-            self.conn = psycopg2.connect(
-                host=db_config['host'],
-                port=db_config['port'], 
-                database=db_config['dbname'],
-                user=db_config['user'],
-                password=db_config['password']
-            )
-            # Configurar autocommit para evitar errores de transacción
-            self.conn.autocommit = True
-            self.cursor = self.conn.cursor()
+            backend = create_backend(self.config['database'])
+            self.logger.info(f"Intentando conectar a BD ({backend.name}): {backend.describe()}")
+            
+            backend.connect()
+            self.db = backend
             self.logger.info("✅ Conexión a la base de datos establecida exitosamente")
             return True
         except Exception as e:
@@ -1457,265 +2198,1446 @@ class XPathMapper:
 
     def close_db_connection(self):
         """Cerrar la conexión a la base de datos."""
-        if self.cursor:
-            self.cursor.close()
-        if self.conn:
-            self.conn.close()
+        if self.db is not None:
+            self.db.close()
             self.logger.info("Conexión a la base de datos cerrada")
 
-    def compare_xml_with_db(self, xml_folder_path):
-        """Comparar archivos XML con la base de datos."""
-        if self.mapping_data is None or self.conn is None:
+    def create_db_snapshot(self, snapshot_path, snapshot_format='sqlite'):
+        """
+        Exportar desde la BD conectada los registros de los batt_dept_id y la fecha de inicio configurados
+        (dispatch, nfirs_notification y sus tablas hijas, batt_dept y las demás tablas del mapeo) a un
+        snapshot local: un archivo SQLite o una carpeta Parquet. Retorna la ruta o None si falló.
+        """
+        if self.db is None:
+            self.logger.error("No hay conexión a la BD para crear el snapshot")
+            return None
+        
+        batt_dept_ids, start_datetime = self._configured_filters()
+        tables = snapshot_tables(self._group_columns_by_table() if self.mapping_data is not None else {})
+        
+        self.logger.log(SUMMARY_LEVEL, f"📦 Creando snapshot {snapshot_format} de la BD en {snapshot_path} (batt_dept_id {batt_dept_ids}, desde {start_datetime})")
+        start = time.perf_counter()
+        try:
+            manifest = create_snapshot(self.db, snapshot_path, tables, batt_dept_ids, start_datetime, snapshot_format, logger=self.logger)
+        except Exception as e:
+            self.logger.error(f"❌ Error creando el snapshot de la BD: {e}")
+            return None
+        
+        self.logger.log(SUMMARY_LEVEL, f"✅ Snapshot creado: {sum(manifest['tablas'].values())} registros de {len(manifest['tablas'])} tablas en {time.perf_counter() - start:.1f}s")
+        return snapshot_path
+
+    def connect_to_snapshot(self, snapshot_path):
+        """
+        Usar un snapshot local de la BD (ver create_db_snapshot) en lugar de PostgreSQL: todas las consultas
+        de la comparación se ejecutan contra la copia indexada, sin carga sobre el servidor.
+        """
+        try:
+            self.db, manifest = connect_snapshot(snapshot_path)
+        except Exception as e:
+            self.logger.error(f"❌ Error abriendo el snapshot de la BD {snapshot_path}: {e}")
+            return False
+        
+        self.db_snapshot = snapshot_path
+        self.logger.log(SUMMARY_LEVEL, f"📦 Usando snapshot de la BD {snapshot_path} (creado {manifest.get('creado')} desde {manifest.get('origen')})")
+        
+        # Los registros fuera de los filtros del snapshot no están en la copia
+        batt_dept_ids, start_datetime = self._configured_filters()
+        missing_ids = set(batt_dept_ids) - set(manifest.get('batt_dept_ids', []))
+        if missing_ids or str(start_datetime) < str(manifest.get('start_datetime', '')):
+            self.logger.warning(
+                f"⚠️ Los filtros configurados (batt_dept_id {batt_dept_ids}, desde {start_datetime}) exceden los del snapshot "
+                f"(batt_dept_id {manifest.get('batt_dept_ids')}, desde {manifest.get('start_datetime')}); "
+                "los registros fuera del snapshot se informarán como no encontrados"
+            )
+        return True
+
+    def _get_xml_input(self, xml_folder_path):
+        """
+        Entrada de los XML (ver xml_input): una carpeta, un .zip o un .tar.gz, filtrando los nombres con
+        processing.input_pattern si está configurado. Se reutiliza mientras no cambie la ruta.
+        """
+        if self._xml_input is None or self._xml_input.path != xml_folder_path:
+            pattern = ((self.config or {}).get('processing') or {}).get('input_pattern')
+            self._xml_input = open_xml_input(xml_folder_path, pattern)
+        return self._xml_input
+
+    def _close_xml_input(self):
+        """Cerrar el archivo comprimido de la entrada, si hay uno abierto (se vuelve a abrir al leerlo)."""
+        if self._xml_input is not None:
+            self._xml_input.close()
+
+    def _scan_xml_file(self, xml_input, xml_file):
+        """
+        Parsear un archivo XML y, en la misma pasada, juntar los valores de las rutas simples del trie.
+        Retorna (raíz, coincidencias del trie); sin trie, (raíz, None). Si no se conserva el árbol la raíz
+        queda vacía. Si el XML tiene errores de formato, se reintenta con recuperación de errores.
+        """
+        if self.path_trie is None:
+            return self._parse_xml_file(xml_input, xml_file), None
+        
+        keep_tree = not self._streaming_extraction
+        
+        def scan(recover):
+            with xml_input.open(xml_file) as source:
+                events = iterparse_events(source, recover)
+                root, trie_matches = self.path_trie.scan(events, self._extract_element_value, keep_tree)
+            return (root, trie_matches), root is not None, events.error_log
+        
+        return self._parse_with_recovery(xml_file, scan)
+
+    def _trie_mapping_value(self, trie_matches, xpath_str):
+        """
+        Valor de un mapeo de ruta simple desde las coincidencias del trie, con el mismo resultado que
+        _extract_xml_value_with_special_logic: el primer elemento de la ruta y, si no existe, el de la primera
+        variante de mayúsculas/minúsculas del documento con valor (la corrección recordada primero).
+        """
+        variants = trie_matches[xpath_str]
+        value = variants.get(path_variant(*parse_simple_path(xpath_str)))
+        if value is not None:
+            return value
+        
+        self.logger.debug("XPath '%s' no encontró elementos, intentando con variaciones case-insensitive", xpath_str)
+        absolute = xpath_str.strip().startswith('/') and not xpath_str.strip().startswith('//')
+        correction = self._xpath_corrections.get(xpath_str)
+        candidates = sorted(variants, key=lambda variant: (variant if absolute else '//' + variant) != correction)
+        for variant in candidates:
+            if variants[variant]:
+                variation = variant if absolute else '//' + variant
+                if correction != variation:
+                    self.logger.info("✅ XPath corregido funciona: '%s' -> '%s'", xpath_str, variation)
+                    self._xpath_corrections[xpath_str] = variation
+                return variants[variant]
+        
+        self.logger.warning("❌ Ninguna de las %s variaciones case-insensitive funcionó para: %s", len(candidates), xpath_str)
+        return None
+
+    def _parse_xml_file(self, xml_input, xml_file):
+        """Parsear un archivo XML de la entrada; si tiene errores de formato, reintentar con un parser tolerante."""
+        def parse(recover):
+            parser = etree.XMLParser(recover=recover)
+            with xml_input.open(xml_file) as source:
+                root = etree.parse(source, parser).getroot()
+            return root, root is not None, parser.error_log
+        
+        return self._parse_with_recovery(xml_file, parse)
+
+    def _parse_with_recovery(self, xml_file, parse):
+        """
+        Lectura de un XML con el respaldo para errores de formato, común a _parse_xml_file, _scan_xml_file y
+        _extract_xml_blocks. parse(recover) lee el archivo y retorna (resultado, se leyó algo, error_log del
+        parser). Si falla por un error de formato se reintenta con el parser tolerante (recover=True) y se
+        informa cuántos errores se recuperaron; si tampoco así se puede leer, el error se propaga.
+        """
+        try:
+            return parse(False)[0]
+        except etree.XMLSyntaxError as xml_error:
+            # Error de formato XML - intentar parsearlo de manera más tolerante
+            self.logger.warning("Error de formato XML en %s: %s", xml_file, xml_error)
+            self.logger.info("Intentando parseo más tolerante para %s", xml_file)
+        
+        result, parsed, error_log = parse(True)
+        if error_log:
+            self.logger.warning("Errores recuperados en %s: %s", xml_file, len(error_log.filter_from_level(etree.ErrorLevels.WARNING)))
+        if parsed:
+            self.logger.info("XML parseado exitosamente con recuperación de errores: %s", xml_file)
+        return result
+
+    def _report_dir(self):
+        """Directorio reportes/ del proyecto, donde se escriben los reportes y los checkpoints."""
+        return os.path.join(os.path.dirname(os.path.dirname(__file__)), 'reportes')
+
+    def _configured_output_format(self):
+        """Formato del reporte de la configuración (processing.output_format), o 'xlsx'."""
+        return self.config.get('processing', {}).get('output_format', 'xlsx') if self.config else 'xlsx'
+
+    def compare_xml_with_db(self, xml_folder_path, workers=None, output_format=None, resume=False, db_workers=None):
+        """
+        Comparar archivos XML con la base de datos.
+        workers: número de procesos para la extracción XML (por defecto processing.workers de la configuración, o 1).
+        db_workers: conexiones del pool e hilos que consultan la BD en paralelo, un archivo por hilo
+        (por defecto database.pool_size de la configuración, o 1: todas las consultas por la conexión principal).
+        output_format: formato del reporte, 'xlsx', 'csv', 'jsonl' o 'parquet' (por defecto processing.output_format, o 'xlsx').
+        resume: retomar una ejecución interrumpida desde su checkpoint en reportes/, sin volver a procesar
+        los archivos ya terminados y generando el mismo reporte.
+        """
+        if self.mapping_data is None or self.db is None:
             self.logger.error("Debe cargar el archivo de mapeo y conectarse a la BD primero")
             return None
 
-        results = []
+        # El reporte se escribe por streaming a medida que termina cada archivo
+        report_writer = None
+        if output_format is None:
+            output_format = self._configured_output_format()
+        try:
+            writer_class = get_report_writer_class(output_format)
+        except (ValueError, ImportError) as e:
+            self.logger.error(f"❌ {e}")
+            return None
         
         # Crear directorio de reportes si no existe
-        report_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'reportes')
+        report_dir = self._report_dir()
         os.makedirs(report_dir, exist_ok=True)
+        
+        checkpoint_path = self._checkpoint_path(xml_folder_path, report_dir)
+        checkpoint = None
+        compare_tasks = None
+        db_executor = None
 
         try:
-            # Obtener lista de archivos XML (tanto .xml como .XML)
-            xml_files = [f for f in os.listdir(xml_folder_path) if f.lower().endswith('.xml')]
+            run_start = time.perf_counter()
+            self._reset_performance_stats()
+            self._record_stage('carga_mapeo', self.mapping_load_seconds)
+            
+            # Obtener lista de archivos XML (tanto .xml como .XML) de la carpeta o del archivo comprimido
+            xml_files = self._get_xml_input(xml_folder_path).list_files()
             
             if not xml_files:
                 self.logger.warning(f"No se encontraron archivos XML en: {xml_folder_path}")
                 return None
             
-            self.logger.info(f"Se encontraron {len(xml_files)} archivos XML para procesar")
-
-            # Procesar cada archivo XML en la carpeta
-            for xml_file in xml_files:
-                xml_path = os.path.join(xml_folder_path, xml_file)
-                self.logger.info(f"Procesando archivo: {xml_file}")
+            self.logger.log(SUMMARY_LEVEL, f"Se encontraron {len(xml_files)} archivos XML para procesar")
+            
+            # Checkpoint: retomar una ejecución interrumpida o empezar uno nuevo
+            header, completed_files = (None, {})
+            mapping_hash, filters_hash = self._mapping_plan_hashes()
+            if resume:
+                header, completed_files = self._load_checkpoint(checkpoint_path)
+                if header is None:
+                    self.logger.warning(f"No hay checkpoint para reanudar en {checkpoint_path}, se inicia una ejecución nueva")
+                else:
+                    # Las filas del checkpoint se generaron con el plan de entonces: no mezclarlas con las de otro plan
+                    changes = []
+                    if header.get('mapping_hash') != mapping_hash:
+                        changes.append("el contenido del archivo de mapeo")
+                    if header.get('filters_hash') != filters_hash:
+                        changes.append("los filtros de la configuración (filters)")
+                    if changes:
+                        self.logger.warning(f"⚠️ Cambiaron {' y '.join(changes)} desde la ejecución interrumpida: "
+                                            f"se descarta el checkpoint {checkpoint_path} y se inicia una ejecución nueva")
+                        # El reporte parcial de la ejecución interrumpida no se va a completar
+                        if os.path.exists(header['report_path']):
+                            os.remove(header['report_path'])
+                        header, completed_files = None, {}
+            
+            if header is not None:
+                report_path = header['report_path']
+                writer_class = get_report_writer_class(os.path.splitext(report_path)[1])
+                report_writer = writer_class(report_path)
+                
+                # Volver a escribir en el reporte las filas de los archivos ya terminados
+                for rows in completed_files.values():
+                    report_writer.write_rows(rows)
+                
+                xml_files = [f for f in xml_files if f not in completed_files]
+                self.logger.log(SUMMARY_LEVEL, f"♻️ Reanudando ejecución: {len(completed_files)} archivos ya procesados, {len(xml_files)} pendientes")
+                checkpoint = open(checkpoint_path, 'a', encoding='utf-8')
+                if checkpoint.tell() and not self._checkpoint_ends_with_newline(checkpoint_path):
+                    checkpoint.write('\n')
+            else:
+                report_path = os.path.join(report_dir, f'reporte_comparacion_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{writer_class.extension}')
+                checkpoint = open(checkpoint_path, 'w', encoding='utf-8')
+                checkpoint.write(json.dumps({
+                    'xml_folder': os.path.abspath(xml_folder_path),
+                    'mapping_file': self.mapping_file,
+                    'mapping_hash': mapping_hash,
+                    'filters': self.config.get('filters', {}) if self.config else {},
+                    'filters_hash': filters_hash,
+                    'report_path': report_path,
+                    'started_at': datetime.now().isoformat(),
+                }, ensure_ascii=False, default=str) + '\n')
+                checkpoint.flush()
+            
+            # Columnas a traer por tabla en cada consulta agrupada, sin las que no existen en la BD
+            columns_by_table = self._group_columns_by_table()
+            self._load_db_schema(columns_by_table)
+            
+            # Extracción (en procesos si se configuró workers) y consultas a la BD (en hilos del pool si se
+            # configuró db_workers) por bloques de archivos: un bloque se consulta mientras se extrae el siguiente
+            if workers is None:
+                workers = self.config.get('processing', {}).get('workers', 1) if self.config else 1
+            if db_workers is None:
+                db_workers = self.config.get('database', {}).get('pool_size', 1) if self.config else 1
+            self.db_pool = self._open_db_pool(db_workers)
+            if self.db_pool is not None:
+                db_executor = ThreadPoolExecutor(max_workers=self.db_pool.size, thread_name_prefix='consultas_bd')
+            compare_tasks = self._iter_compare_tasks(xml_folder_path, xml_files, workers, columns_by_table, db_executor, completed_files)
 
+            # Etapa de comparación: escribir cada archivo en el orden original
+            for extracted, existing_records, compare_future in compare_tasks:
+                xml_file, _, _, extraction_error = extracted
+                results = []
+                
                 try:
-                    # Parsear el archivo XML con manejo robusto de errores
-                    try:
-                        tree = etree.parse(xml_path)
-                        root = tree.getroot()
-                    except etree.XMLSyntaxError as xml_error:
-                        # Error de formato XML - intentar parsearlo de manera más tolerante
-                        self.logger.warning(f"Error de formato XML en {xml_file}: {xml_error}")
-                        self.logger.info(f"Intentando parseo más tolerante para {xml_file}")
-                        
-                        # Leer el archivo y intentar parsear con recuperación de errores
-                        parser = etree.XMLParser(recover=True)
-                        tree = etree.parse(xml_path, parser)
-                        root = tree.getroot()
-                        
-                        if parser.error_log:
-                            self.logger.warning(f"Errores recuperados en {xml_file}: {len(parser.error_log.filter_from_level(etree.ErrorLevels.WARNING))}")
-                        
-                        self.logger.info(f"XML parseado exitosamente con recuperación de errores: {xml_file}")
-                    
-                    if root is None:
-                        raise Exception(f"No se pudo parsear el XML: {xml_file}")
-
-                    # EXTRAER IDENTIFICADORES ÚNICOS DEL XML PARA BUSCAR REGISTRO ESPECÍFICO
-                    record_identifiers = self._extract_record_identifiers(root, xml_file)
+                    if extraction_error is not None:
+                        raise Exception(extraction_error)
                     
-                    self.logger.info(f"📄 PROCESANDO {xml_file}")
-                    self.logger.info(f"🔍 Identificadores extraídos: {record_identifiers}")
+                    if compare_future is not None:
+                        results = compare_future.result()
+                    else:
+                        self._compare_extracted_file(extracted, existing_records, columns_by_table, results)
                     
-                    # Inicializar variables
-                    matching_record_found = False
-                    found_table = None
+                    # Si se perdió la conexión los valores de BD de este archivo no son válidos: cortar la ejecución
+                    # dejando el checkpoint para reanudarla
+                    if self.db.closed:
+                        raise ConnectionError(f"Se perdió la conexión a la BD procesando {xml_file}")
                     
-                    if record_identifiers and any(record_identifiers.values()):
-                        self.logger.info(f"Identificadores extraídos de {xml_file}: {record_identifiers}")
-                        
-                        # VERIFICAR SI EXISTE UN REGISTRO EN LA BD CON ESTOS IDENTIFICADORES
-                        matching_record_found, found_table = self._verify_record_exists_in_db(record_identifiers)
-                        
-                        if not matching_record_found:
-                            # No existe registro coincidente - crear entrada de "no encontrado"
-                            # Extraer el valor principal del XML para el mensaje
-                            xml_value = None
-                            if record_identifiers.get('xref_id'):
-                                xml_value = record_identifiers['xref_id']
-                            elif record_identifiers.get('dispatch_number'):
-                                xml_value = record_identifiers['dispatch_number']
-                            
-                            if xml_value:
-                                error_message = f"No existe registro en la BD con xref_id/dispatch_number: '{xml_value}'"
-                            else:
-                                identifier_info = []
-                                for key, value in record_identifiers.items():
-                                    if value:
-                                        identifier_info.append(f"{key}: {value}")
-                                identifier_text = ", ".join(identifier_info) if identifier_info else "Sin identificadores válidos"
-                                error_message = f"No existe registro en la BD con {identifier_text}"
-                            
-                            self.logger.warning(f"No se encontró registro en BD para {xml_file} - {error_message}")
-                            
-                            results.append({
-                                'archivo': xml_file,
-                                'tabla': 'N/A',
-                                'campo': 'verificacion_registro',
-                                'xpath': 'N/A',
-                                'valor_xml': xml_value or "Sin identificadores válidos",
-                                'valor_bd': 'N/A',
-                                'coincide': False,
-                                'observaciones': error_message
-                            })
-                            
-                            # Saltar este XML y continuar con el siguiente
-                            continue
-                    else:
-                        self.logger.warning(f"No se pudieron extraer identificadores de {xml_file}, usando registro más reciente")
-                        found_table = None
-
-                    # Si se encontró el registro, log de información sobre qué tabla se usará
-                    if matching_record_found and found_table:
-                        self.logger.info(f"Procesando comparación para {xml_file} usando registros de tabla: {found_table}")
-
-                    # Procesar cada mapeo válido generado
-                    for row in self.valid_mappings:
-                        xpath = row['xpath']
-                        
-                        if not xpath:
-                            self.logger.warning(f"XPath vacío en mapeo: {row}")
-                            continue
-                        
-                        # Obtener valor del XML con soporte para XPath concatenados y condicionales
-                        xml_value = None
-                        try:
-                            # Usar el método especializado que maneja lógicas especiales por campo
-                            xml_value = self._extract_xml_value_with_special_logic(root, xpath, row['column_name'], row['table_name'])
-                            
-                            if xml_value is None:
-                                self.logger.debug(f"No se encontró valor para XPath '{xpath}' en {xml_file}")
-                                
-                        except Exception as e:
-                            self.logger.error(f"Error al procesar XPath '{xpath}' en {xml_file}: {str(e)}")
-                            xml_value = "ERROR_XPATH"
-
-                        # Obtener valor de la BD usando identificadores específicos del XML
-                        db_value = None
-                        try:
-                            # VERIFICAR CURSOR ANTES DE USAR
-                            if self.cursor is None:
-                                self.logger.error("❌ CURSOR ES NONE - La conexión a BD no se estableció correctamente")
-                                db_value = "ERROR_CONEXION"
-                                continue
-                                
-                            # Construir query específica usando identificadores del XML
-                            query = self._build_filtered_query(row['table_name'], row['column_name'], record_identifiers)
-                            
-                            if not query:
-                                self.logger.warning(f"No se pudo construir query para {row['table_name']}.{row['column_name']}")
-                                db_value = "ERROR_QUERY"
-                            else:
-                                # Ejecutar query
-                                try:
-                                    self.cursor.execute(query)
-                                    result = self.cursor.fetchone()
-                                    if result and result[0] is not None:
-                                        db_value = str(result[0]).strip()
-                                    else:
-                                        db_value = None
-                                except Exception as db_error:
-                                    error_msg = str(db_error)
-                                    self.logger.error(f"Error SQL: {error_msg}")
-                                    if "does not exist" in error_msg or "column" in error_msg.lower():
-                                        db_value = "CAMPO_NO_EXISTE"
-                                    else:
-                                        db_value = "ERROR_QUERY"
-                        
-                        except Exception as e:
-                            self.logger.error(f"Error general: {str(e)}")
-                            db_value = "ERROR_QUERY"
-
-                        # Comparar valores con tratamiento especial para coordenadas
-                        xml_str = str(xml_value) if xml_value is not None else ""
-                        db_str = str(db_value) if db_value is not None else ""
-                        
-                        # Variables para almacenar valores para comparación (pueden ser diferentes a los originales)
-                        xml_comparison_value = xml_str
-                        db_comparison_value = db_str
-                        
-                        # Tratamiento especial para latitude y longitude
-                        if row['column_name'].lower() in ['latitude', 'longitude']:
-                            self.logger.info(f"🗺️ Procesando coordenada {row['column_name']}: XML='{xml_str}', DB='{db_str}'")
-                            # Normalizar SOLO si ambos valores son válidos y numéricos
-                            if xml_str and xml_str not in ["ERROR_XPATH", "ERROR_CONEXION", "ERROR_QUERY", "CAMPO_NO_EXISTE", ""]:
-                                xml_comparison_value = self._normalize_coordinate(xml_str)
-                                self.logger.info(f"🗺️ XML normalizado: '{xml_str}' -> '{xml_comparison_value}'")
-                            
-                            if db_str and db_str not in ["ERROR_XPATH", "ERROR_CONEXION", "ERROR_QUERY", "CAMPO_NO_EXISTE", "", "None"]:
-                                db_comparison_value = self._normalize_coordinate(db_str)
-                                self.logger.info(f"🗺️ BD normalizado: '{db_str}' -> '{db_comparison_value}'")
-                            
-                            match = (xml_comparison_value == db_comparison_value) and xml_comparison_value != "" and db_comparison_value != ""
-                        else:
-                            # Comparación normal para otros campos
-                            match = (xml_comparison_value == db_comparison_value) and xml_comparison_value != "" and db_comparison_value != ""
-                        
-                        # Log detallado para debugging
-                        self.logger.debug(f"Comparación - XPath: {xpath}, XML: '{xml_str}', DB: '{db_str}', Match: {match}")
-                        
-                        results.append({
-                            'archivo': xml_file,
-                            'tabla': row['table_name'],
-                            'campo': row.get('column_original', row['column_name']), 
-                            'xpath': xpath,
-                            'valor_xml': xml_value,
-                            'valor_bd': db_value,
-                            'coincide': match,
-                            'observaciones': self._get_comparison_notes(xml_value, db_value, row['column_name'])
-                        })
+                    # Registrar el archivo como terminado en el checkpoint
+                    stage_start = time.perf_counter()
+                    checkpoint.write(json.dumps({'archivo': xml_file, 'rows': results}, ensure_ascii=False, default=str) + '\n')
+                    checkpoint.flush()
+                    self._record_stage('checkpoint', time.perf_counter() - stage_start)
 
+                except ConnectionError:
+                    raise
                 except Exception as e:
                     self.logger.error(f"Error al procesar el archivo {xml_file}: {str(e)}")
                     # Agregar entrada de error para este archivo
-                    results.append({
-                        'archivo': xml_file,
-                        'tabla': 'ERROR',
-                        'campo': 'ERROR',
-                        'xpath': 'ERROR',
-                        'valor_xml': f"Error al procesar archivo: {str(e)}",
-                        'valor_bd': None,
-                        'coincide': False,
-                        'observaciones': 'Error de procesamiento'
-                    })
-
-            # Crear reporte Excel
-            if results:
-                report_path = os.path.join(report_dir, f'reporte_comparacion_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx')
-                df = pd.DataFrame(results)
+                    results.append(self._processing_error_row(xml_file, e))
                 
-                # Crear resumen
-                total_comparaciones = len(results)
-                coincidencias = len([r for r in results if r['coincide']])
-                errores = len([r for r in results if 'ERROR' in str(r['valor_xml']) or 'ERROR' in str(r['valor_bd'])])
+                # Volcar las filas de este archivo al reporte
+                if results:
+                    stage_start = time.perf_counter()
+                    if report_writer is None:
+                        report_writer = writer_class(report_path)
+                    report_writer.write_rows(results)
+                    self._record_stage('escritura_reporte', time.perf_counter() - stage_start)
+
+            # Cerrar el reporte
+            if report_writer is not None:
+                # Ejecución completa: el checkpoint ya no hace falta
+                checkpoint.close()
+                os.remove(checkpoint_path)
+                return self._close_report(report_writer, run_start)
+            else:
+                checkpoint.close()
+                os.remove(checkpoint_path)
+                self.logger.warning("No se generó ningún resultado para el reporte")
+                return None
+
+        except Exception as e:
+            self.logger.error(f"Error durante la comparación: {str(e)}")
+            if report_writer is not None:
+                report_writer.discard()
+            if checkpoint is not None and os.path.exists(checkpoint_path):
+                self.logger.info(f"💾 Checkpoint guardado en {checkpoint_path}; se puede reanudar con resume=True (--resume)")
+            return None
+        
+        finally:
+            if checkpoint is not None:
+                checkpoint.close()
+            # Ejecución cortada: detener la extracción y las consultas pendientes
+            if compare_tasks is not None:
+                compare_tasks.close()
+            if db_executor is not None:
+                db_executor.shutdown()
+            if self.db_pool is not None:
+                self.db_pool.close()
+            self._close_xml_input()
+
+    def _close_report(self, report_writer, run_start):
+        """
+        Cerrar el reporte de una ejecución terminada (en Excel: reglas de color, hoja de resumen y hoja de
+        rendimiento; en los demás formatos: <reporte>_resumen.json y <reporte>_rendimiento.json), registrar
+        el resumen en el log y retornar la ruta del reporte.
+        """
+        stage_start = time.perf_counter()
+        report_path = report_writer.close(performance=self.performance_summary())
+        self._record_stage('cierre_reporte', time.perf_counter() - stage_start)
+        self._record_stage('total', time.perf_counter() - run_start)
+        
+        total_comparaciones = report_writer.total_comparaciones
+        coincidencias = report_writer.coincidencias
+        
+        self.logger.info(f"Caché XPath: {len(self._xpath_cache)} expresiones, {self.xpath_cache_hits} hits, {self.xpath_cache_misses} misses")
+        self._log_performance_summary()
+        self.logger.log(SUMMARY_LEVEL, f"Reporte generado: {report_path}")
+        self.logger.log(SUMMARY_LEVEL, f"Resumen: {coincidencias}/{total_comparaciones} coincidencias ({(coincidencias/total_comparaciones*100):.2f}%)")
+        return report_path
+
+    def _open_db_pool(self, size):
+        """
+        Pool de size conexiones para consultar varios archivos en paralelo, o None si size <= 1 o si la BD
+        no admite más conexiones (snapshot Parquet en memoria): en ese caso se consulta por self.db.
+        """
+        if size is None or size <= 1:
+            return None
+        if not self.db.supports_clone:
+            self.logger.warning(f"⚠️ La BD {self.db.describe()} no admite más conexiones: las consultas se harán por una sola conexión")
+            return None
+        self.logger.info(f"Consultas a la BD en paralelo con un pool de {size} conexiones")
+        return ConnectionPool(self.db.clone, size)
+
+    def _iter_compare_tasks(self, xml_folder_path, xml_files, workers, columns_by_table, db_executor=None, completed=()):
+        """
+        Extraer los archivos por bloques de COMPARE_CHUNK_SIZE, verificar en bloque los identificadores de cada
+        bloque y generar (extraído, registros_existentes, futuro) en el orden de xml_files. Con db_executor cada
+        archivo se consulta y compara en un hilo del pool (futuro con sus filas) mientras se extrae el bloque
+        siguiente; sin él, el futuro es None y la comparación queda a cargo del llamador. Los registros en
+        completed (bloques ya terminados de un archivo con varios bloques, al reanudar) se saltean.
+        """
+        extracted_files = self._iter_extracted_files(xml_folder_path, xml_files, workers)
+        pending = deque()
+        try:
+            while True:
+                stage_start = time.perf_counter()
+                chunk = list(itertools.islice(extracted_files, self.COMPARE_CHUNK_SIZE))
+                self._record_stage('extraccion', time.perf_counter() - stage_start)
+                if not chunk:
+                    break
+                if completed:
+                    chunk = [extracted for extracted in chunk if extracted[0] not in completed]
                 
-                with pd.ExcelWriter(report_path) as writer:
-                    # Hoja principal con los resultados
-                    df.to_excel(writer, sheet_name='Resultados', index=False)
-                    
-                    # Hoja de resumen
-                    resumen = pd.DataFrame({
-                        'Métrica': ['Total de comparaciones', 'Coincidencias', 'Diferencias', 'Errores', 'Porcentaje de coincidencias'],
-                        'Valor': [total_comparaciones, coincidencias, total_comparaciones - coincidencias - errores, errores, f"{(coincidencias/total_comparaciones*100):.2f}%" if total_comparaciones > 0 else "0%"]
-                    })
-                    resumen.to_excel(writer, sheet_name='Resumen', index=False)
+                # Verificar en bloque la existencia de los identificadores extraídos
+                identifiers_by_file = {xml_file: ids for xml_file, ids, _, error in chunk if error is None}
+                existing_records = self._bulk_verify_records_exist_in_db(identifiers_by_file, self.COMPARE_CHUNK_SIZE)
                 
-                # Aplicar formato de colores
-                self._apply_color_formatting(report_path, df)
+                for extracted in chunk:
+                    compare_future = None
+                    if db_executor is not None and extracted[3] is None:
+                        compare_future = db_executor.submit(self._compare_pooled_file, extracted, existing_records, columns_by_table)
+                    pending.append((extracted, existing_records, compare_future))
                 
-                self.logger.info(f"Reporte generado: {report_path}")
-                self.logger.info(f"Resumen: {coincidencias}/{total_comparaciones} coincidencias ({(coincidencias/total_comparaciones*100):.2f}%)")
-                return report_path
+                # Con hilos, el bloque recién enviado sigue consultándose mientras se extrae el siguiente
+                while len(pending) > (len(chunk) if db_executor is not None else 0):
+                    yield pending.popleft()
+            
+            while pending:
+                yield pending.popleft()
+        finally:
+            # Ejecución cortada: no consultar los archivos que todavía no empezaron
+            for _, _, compare_future in pending:
+                if compare_future is not None:
+                    compare_future.cancel()
+            extracted_files.close()
+
+    def _compare_pooled_file(self, extracted, existing_records, columns_by_table):
+        """
+        Comparar un archivo en un hilo con una conexión del pool y retornar sus filas. Si la conexión se pierde
+        durante las consultas, el archivo se vuelve a consultar una vez con una conexión nueva.
+        """
+        xml_file = extracted[0]
+        for attempt in range(2):
+            results = []
+            with self.db_pool.connection() as db:
+                self._compare_extracted_file(extracted, existing_records, columns_by_table, results, db)
+                if not db.closed:
+                    return results
+            self.logger.warning(f"⚠️ Se perdió una conexión del pool procesando {xml_file}, reconectando")
+        raise ConnectionError(f"Se perdió la conexión a la BD procesando {xml_file}")
+
+    async def compare_xml_with_db_async(self, xml_folder_path, workers=None, output_format=None, db_workers=None):
+        """
+        Variante async de compare_xml_with_db, con la misma extracción, las mismas consultas y el mismo reporte
+        (mismas filas en el mismo orden). Las etapas corren a la vez unidas por colas acotadas, que frenan a una
+        etapa cuando la siguiente se atrasa: descubrir los XML, parsearlos y extraerlos en un executor (procesos
+        si workers > 1), verificarlos y consultarlos con un pool async (db_backend.create_async_pool: psycopg 3
+        si está instalado, o los backends en hilos), compararlos y escribir el reporte. Así la latencia de la BD
+        se solapa con el trabajo sobre los XML. No guarda checkpoint: una ejecución cortada no se puede reanudar.
+        workers, output_format y db_workers: como en compare_xml_with_db.
+        Uso: asyncio.run(mapper.compare_xml_with_db_async(carpeta))
+        """
+        if self.mapping_data is None or self.db is None:
+            self.logger.error("Debe cargar el archivo de mapeo y conectarse a la BD primero")
+            return None
+
+        if output_format is None:
+            output_format = self._configured_output_format()
+        try:
+            writer_class = get_report_writer_class(output_format)
+        except (ValueError, ImportError) as e:
+            self.logger.error(f"❌ {e}")
+            return None
+        if workers is None:
+            workers = self.config.get('processing', {}).get('workers', 1) if self.config else 1
+        if db_workers is None:
+            db_workers = self.config.get('database', {}).get('pool_size', 1) if self.config else 1
+        
+        report_dir = self._report_dir()
+        os.makedirs(report_dir, exist_ok=True)
+        report_path = os.path.join(report_dir, f'reporte_comparacion_{datetime.now().strftime("%Y%m%d_%H%M%S")}.{writer_class.extension}')
+        
+        loop = asyncio.get_running_loop()
+        run_start = time.perf_counter()
+        self._reset_performance_stats()
+        self._record_stage('carga_mapeo', self.mapping_load_seconds)
+        columns_by_table = self._group_columns_by_table()
+        self._load_db_schema(columns_by_table)
+        
+        # Colas entre etapas: nombres de archivo, archivos extraídos y comparaciones en curso (en el orden original)
+        file_queue = asyncio.Queue(maxsize=self.COMPARE_CHUNK_SIZE)
+        extracted_queue = asyncio.Queue(maxsize=self.COMPARE_CHUNK_SIZE)
+        compared_queue = asyncio.Queue(maxsize=self.COMPARE_CHUNK_SIZE)
+        file_tasks = set()
+        report_writer = None
+        
+        if workers > 1:
+            extraction_executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_extraction_worker, initargs=(self,))
+        else:
+            extraction_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='extraccion')
+        async_db = create_async_pool(self.db, db_workers)
+        self.db_pool = async_db
+        self.logger.info(f"Comparación async: extracción con {workers} {'procesos' if workers > 1 else 'hilo'}, consultas a la BD con {async_db.size} conexiones ({async_db.name})")
+
+        async def discover_files():
+            # Listar la carpeta o el archivo comprimido fuera del loop (puede estar en una carpeta de red)
+            xml_files = await loop.run_in_executor(None, lambda: self._get_xml_input(xml_folder_path).list_files())
+            if xml_files:
+                self.logger.log(SUMMARY_LEVEL, f"Se encontraron {len(xml_files)} archivos XML para procesar")
             else:
+                self.logger.warning(f"No se encontraron archivos XML en: {xml_folder_path}")
+            for xml_file in xml_files:
+                await file_queue.put(xml_file)
+            await file_queue.put(None)
+
+        async def extract_files():
+            # Hasta 2 archivos por worker en el executor a la vez; los resultados se pasan en el orden de la carpeta
+            stage_start = time.perf_counter()
+            in_flight = deque()
+            while True:
+                xml_file = await file_queue.get()
+                if xml_file is not None:
+                    if workers > 1:
+                        task = (xml_folder_path, xml_file)
+                        xml_input = self._get_xml_input(xml_folder_path)
+                        if xml_input.sequential:
+                            # Los workers no abren el .tar: el contenido se lee aquí, en el orden del archivo
+                            task += (await loop.run_in_executor(None, xml_input.read, xml_file),)
+                        in_flight.append(loop.run_in_executor(extraction_executor, _extract_xml_file_worker, task))
+                    else:
+                        in_flight.append(loop.run_in_executor(extraction_executor, self._extract_xml_records, xml_folder_path, xml_file))
+                while in_flight and (xml_file is None or len(in_flight) >= 2 * workers):
+                    records = await in_flight.popleft()
+                    if workers > 1:
+                        records, performance_stats = records
+                        self._merge_performance_stats(performance_stats)
+                    for extracted in records:
+                        await extracted_queue.put(extracted)
+                if xml_file is None:
+                    break
+            self._record_stage('extraccion', time.perf_counter() - stage_start)
+            await extracted_queue.put(None)
+
+        async def compare_files():
+            # Verificar en bloque lo que ya esté extraído (hasta COMPARE_CHUNK_SIZE archivos): si la BD se atrasa
+            # los bloques crecen y se hacen menos consultas
+            finished = False
+            while not finished:
+                chunk = [await extracted_queue.get()]
+                while not extracted_queue.empty() and len(chunk) < self.COMPARE_CHUNK_SIZE:
+                    chunk.append(extracted_queue.get_nowait())
+                if chunk[-1] is None:
+                    chunk.pop()
+                    finished = True
+                
+                identifiers_by_file = {xml_file: ids for xml_file, ids, _, error in chunk if error is None}
+                existing_records = await self._bulk_verify_records_exist_in_db_async(identifiers_by_file, async_db) if identifiers_by_file else {}
+                
+                for extracted in chunk:
+                    file_task = None
+                    if extracted[3] is None:
+                        file_task = asyncio.ensure_future(self._compare_extracted_file_async(extracted, existing_records, columns_by_table, async_db))
+                        file_tasks.add(file_task)
+                        file_task.add_done_callback(file_tasks.discard)
+                    await compared_queue.put((extracted, file_task))
+            await compared_queue.put(None)
+
+        async def write_report():
+            nonlocal report_writer
+            while True:
+                item = await compared_queue.get()
+                if item is None:
+                    break
+                extracted, file_task = item
+                xml_file, _, _, extraction_error = extracted
+                results = []
+                try:
+                    if extraction_error is not None:
+                        raise Exception(extraction_error)
+                    results = await file_task
+                except ConnectionError:
+                    raise
+                except Exception as e:
+                    self.logger.error(f"Error al procesar el archivo {xml_file}: {str(e)}")
+                    results.append(self._processing_error_row(xml_file, e))
+                
+                if results:
+                    stage_start = time.perf_counter()
+                    if report_writer is None:
+                        report_writer = writer_class(report_path)
+                    report_writer.write_rows(results)
+                    self._record_stage('escritura_reporte', time.perf_counter() - stage_start)
+
+        stages = [asyncio.ensure_future(stage()) for stage in (discover_files, extract_files, compare_files, write_report)]
+        try:
+            await asyncio.gather(*stages)
+            
+            if report_writer is None:
                 self.logger.warning("No se generó ningún resultado para el reporte")
                 return None
-
+            return self._close_report(report_writer, run_start)
+        
         except Exception as e:
             self.logger.error(f"Error durante la comparación: {str(e)}")
+            if report_writer is not None:
+                report_writer.discard()
+            return None
+        
+        finally:
+            # Ejecución cortada: detener las etapas y las comparaciones que quedaron en curso
+            for task in stages + list(file_tasks):
+                task.cancel()
+            await asyncio.gather(*stages, *file_tasks, return_exceptions=True)
+            extraction_executor.shutdown()
+            await async_db.close()
+            self._close_xml_input()
+
+    async def _compare_extracted_file_async(self, extracted, existing_records, columns_by_table, async_db):
+        """Versión async de _compare_extracted_file: retorna las filas del archivo."""
+        xml_file, record_identifiers, _, _ = extracted
+        results = []
+        
+        verified, matching_record_found, found_table = self._start_file_comparison(extracted, existing_records)
+        if not verified:
+            matching_record_found, found_table = await self._verify_record_exists_in_db_async(record_identifiers, async_db)
+        if not matching_record_found:
+            results.append(self._record_not_found_row(xml_file, record_identifiers))
+            return results
+        
+        record_db_values = await self._fetch_record_values_async(record_identifiers, columns_by_table, async_db)
+        self._append_comparison_rows(extracted, found_table, record_db_values, results)
+        return results
+
+    async def _bulk_verify_records_exist_in_db_async(self, identifiers_by_file, async_db):
+        """Versión async de _bulk_verify_records_exist_in_db para un bloque de archivos (una sola consulta)."""
+        try:
+            batt_dept_ids, start_datetime = self._configured_filters()
+            xml_values = sorted({
+                str(value) for value in (self._get_primary_identifier(ids) for ids in identifiers_by_file.values()) if value
+            })
+            self.logger.info(f"🔍 Verificando en bloque {len(xml_values)} identificadores en dispatch y nfirs_notification")
+            
+            query_start = time.perf_counter()
+            rows = await async_db.fetchall(self.BULK_VERIFY_QUERY, (batt_dept_ids, start_datetime, xml_values, batt_dept_ids, start_datetime, xml_values), prepare=True)
+            self._record_query_time('dispatch/nfirs_notification', self.BULK_VERIFY_QUERY, time.perf_counter() - query_start, 'verificacion_bd')
+            
+            found_records = {}
+            self._merge_found_records(found_records, rows)
+            self.logger.info(f"✅ {len(found_records)}/{len(xml_values)} identificadores encontrados en la BD")
+            return found_records
+        
+        except ConnectionError:
+            raise
+        except Exception as e:
+            self.logger.warning(f"Verificación en bloque falló, se verificará archivo por archivo: {e}")
             return None
 
+    async def _verify_record_exists_in_db_async(self, record_identifiers, async_db):
+        """Versión async de _verify_record_exists_in_db (cuando falla la verificación en bloque)."""
+        xml_value = self._get_primary_identifier(record_identifiers)
+        if not xml_value:
+            self.logger.warning("No se encontró xref_id ni dispatch_number en los identificadores")
+            return False, None
+        
+        try:
+            batt_dept_ids, start_datetime = self._configured_filters()
+            params = (batt_dept_ids, start_datetime, xml_value, batt_dept_ids, start_datetime, xml_value)
+            query_start = time.perf_counter()
+            results = await async_db.fetchall(self.VERIFY_RECORD_QUERY, params, prepare=True)
+            self._record_query_time('dispatch/nfirs_notification', self.VERIFY_RECORD_QUERY, time.perf_counter() - query_start, 'verificacion_bd')
+        except ConnectionError:
+            raise
+        except Exception as e:
+            self.logger.error("Error verificando existencia de registro: %s", e)
+            return False, None
+        
+        if results:
+            self.logger.info("✅ Registro encontrado en %s: %s", results[0][0], results[0][1])
+            return True, results[0][0]
+        self.logger.warning("❌ Valor '%s' NO encontrado en dispatch.xref_id ni en nfirs_notification.dispatch_number", xml_value)
+        return False, None
+
+    async def _fetch_record_values_async(self, record_identifiers, columns_by_table, async_db):
+        """Versión async de _fetch_record_values: las consultas de las tablas del registro se hacen a la vez."""
+        async def fetch_table(table_name, columns):
+            missing_columns = self.missing_columns.get(table_name, [])
+            table_values = {column: "CAMPO_NO_EXISTE" for column in missing_columns}
+            columns = [column for column in columns if column not in missing_columns]
+            if not columns:
+                return table_values
+            
+            query, params = self._build_filtered_query(table_name, columns, record_identifiers)
+            try:
+                query_start = time.perf_counter()
+                result = await async_db.fetchone(query, params, prepare=True)
+                self._record_query_time(table_name, query, time.perf_counter() - query_start)
+                table_values.update({
+                    column: self._format_db_value(result[i]) if result else None
+                    for i, column in enumerate(columns)
+                })
+            except ConnectionError:
+                raise
+            except Exception as db_error:
+                self.logger.warning("Consulta agrupada para %s falló, consultando columna por columna: %s", table_name, db_error)
+                for column in columns:
+                    table_values[column] = await self._fetch_single_db_value_async(table_name, column, record_identifiers, async_db)
+            return table_values
+        
+        tables = list(columns_by_table)
+        values = await asyncio.gather(*(fetch_table(table_name, columns_by_table[table_name]) for table_name in tables))
+        return dict(zip(tables, values))
+
+    async def _fetch_single_db_value_async(self, table_name, column_name, record_identifiers, async_db):
+        """Versión async de _fetch_single_db_value."""
+        query, params = self._build_filtered_query(table_name, column_name, record_identifiers)
+        if not query:
+            self.logger.warning("No se pudo construir query para %s.%s", table_name, column_name)
+            return "ERROR_QUERY"
+        
+        try:
+            query_start = time.perf_counter()
+            result = await async_db.fetchone(query, params, prepare=True)
+            self._record_query_time(table_name, query, time.perf_counter() - query_start)
+            return self._format_db_value(result[0]) if result else None
+        except ConnectionError:
+            raise
+        except Exception as db_error:
+            error_msg = str(db_error)
+            self.logger.error("Error SQL: %s", error_msg)
+            if "does not exist" in error_msg or "column" in error_msg.lower():
+                return "CAMPO_NO_EXISTE"
+            return "ERROR_QUERY"
+
+    def _processing_error_row(self, xml_file, error):
+        """Fila del reporte para un archivo que no se pudo procesar."""
+        return {
+            'archivo': xml_file,
+            'tabla': 'ERROR',
+            'campo': 'ERROR',
+            'xpath': 'ERROR',
+            'valor_xml': f"Error al procesar archivo: {str(error)}",
+            'valor_bd': None,
+            'coincide': False,
+            'observaciones': 'Error de procesamiento'
+        }
+
+    def _reset_performance_stats(self):
+        """Reiniciar los tiempos: por etapa [segundos, veces], por mapeo [segundos, veces, máximo] y consultas más lentas."""
+        self.performance_stats = {'stages': {}, 'mappings': {}, 'queries': []}
+
+    def _record_stage(self, stage, seconds):
+        with self._stats_lock:
+            entry = self.performance_stats['stages'].setdefault(stage, [0.0, 0])
+            entry[0] += seconds
+            entry[1] += 1
+
+    def _record_mapping_time(self, index, seconds):
+        """Sumar el tiempo de evaluación de un mapeo (índice en valid_mappings)."""
+        entry = self.performance_stats['mappings'].setdefault(index, [0.0, 0, 0.0])
+        entry[0] += seconds
+        entry[1] += 1
+        if seconds > entry[2]:
+            entry[2] = seconds
+
+    def _record_query_time(self, table_name, query, seconds, stage='consultas_bd'):
+        """Sumar el tiempo de una consulta a su etapa y conservarla si está entre las más lentas."""
+        self._record_stage(stage, seconds)
+        self._keep_slowest_query((seconds, table_name, query))
+
+    def _keep_slowest_query(self, entry):
+        """Conservar (segundos, tabla, consulta) en el heap de las SLOWEST_ENTRIES consultas más lentas."""
+        with self._stats_lock:
+            queries = self.performance_stats['queries']
+            if len(queries) < self.SLOWEST_ENTRIES:
+                heapq.heappush(queries, entry)
+            elif entry[0] > queries[0][0]:
+                heapq.heapreplace(queries, entry)
+
+    def _take_performance_stats(self):
+        """Devolver los tiempos acumulados y empezar de cero (usado por los procesos worker)."""
+        stats = self.performance_stats
+        self._reset_performance_stats()
+        return stats
+
+    def _merge_performance_stats(self, stats):
+        """Sumar los tiempos medidos en otro proceso."""
+        with self._stats_lock:
+            for stage, (seconds, count) in stats['stages'].items():
+                entry = self.performance_stats['stages'].setdefault(stage, [0.0, 0])
+                entry[0] += seconds
+                entry[1] += count
+        
+        for index, (seconds, count, max_seconds) in stats['mappings'].items():
+            entry = self.performance_stats['mappings'].setdefault(index, [0.0, 0, 0.0])
+            entry[0] += seconds
+            entry[1] += count
+            entry[2] = max(entry[2], max_seconds)
+        
+        for entry in stats['queries']:
+            self._keep_slowest_query(tuple(entry))
+
+    def performance_summary(self):
+        """
+        Resumen de rendimiento de la ejecución: tiempo por etapa, mapeos más costosos y consultas más lentas.
+        Las etapas se solapan: extraccion incluye cache_extraccion, parseo_xml, identificadores y xpath_mapeos (sumados entre
+        los workers) y total incluye todas.
+        """
+        stages = self.performance_stats['stages']
+        stage_rows = [
+            {
+                'etapa': stage,
+                'segundos': round(stages[stage][0], 3),
+                'veces': stages[stage][1],
+                'promedio_ms': round(stages[stage][0] / stages[stage][1] * 1000, 3) if stages[stage][1] else 0,
+            }
+            for stage in self.PERFORMANCE_STAGES + sorted(set(stages) - set(self.PERFORMANCE_STAGES))
+            if stage in stages
+        ]
+        
+        slowest_mappings = sorted(self.performance_stats['mappings'].items(), key=lambda item: item[1][0], reverse=True)
+        mapping_rows = []
+        for index, (seconds, count, max_seconds) in slowest_mappings[:self.SLOWEST_ENTRIES]:
+            row = self.valid_mappings[index] if index < len(self.valid_mappings) else {}
+            mapping_rows.append({
+                'tabla': row.get('table_name'),
+                'campo': row.get('column_original', row.get('column_name')),
+                'xpath': row.get('xpath'),
+                'segundos': round(seconds, 3),
+                'veces': count,
+                'promedio_ms': round(seconds / count * 1000, 3) if count else 0,
+                'max_ms': round(max_seconds * 1000, 3),
+            })
+        
+        query_rows = [
+            {'tabla': table_name, 'segundos': round(seconds, 4), 'consulta': ' '.join(query.split())}
+            for seconds, table_name, query in sorted(self.performance_stats['queries'], key=lambda entry: entry[0], reverse=True)
+        ]
+        
+        return {'etapas': stage_rows, 'mapeos_mas_lentos': mapping_rows, 'consultas_mas_lentas': query_rows}
+
+    def _log_performance_summary(self):
+        summary = self.performance_summary()
+        self.logger.log(SUMMARY_LEVEL, "⏱️ Rendimiento por etapa: " + ", ".join(f"{row['etapa']}={row['segundos']:.2f}s" for row in summary['etapas']))
+        for row in summary['mapeos_mas_lentos'][:3]:
+            self.logger.info(f"⏱️ Mapeo costoso: {row['tabla']}.{row['campo']} {row['segundos']:.3f}s en {row['veces']} archivos (máx {row['max_ms']:.1f} ms) - {row['xpath']}")
+        if summary['consultas_mas_lentas']:
+            slowest = summary['consultas_mas_lentas'][0]
+            self.logger.info(f"⏱️ Consulta más lenta: {slowest['segundos']:.3f}s ({slowest['tabla']}) {slowest['consulta'][:200]}")
+
+    def watch_folder(self, xml_folder_path, poll_interval=None, bucket_minutes=None, settle_seconds=None,
+                     process_existing=True, output_format=None, stop_event=None):
+        """
+        Modo vigilancia: procesar los XML a medida que llegan a la carpeta, manteniendo cargados el mapeo,
+        las expresiones XPath compiladas y la conexión a la BD.
+        Los resultados se agrupan en un reporte por intervalo de tiempo (bucket_minutes), que se cierra
+        al pasar al intervalo siguiente o al detener la vigilancia (Ctrl+C o stop_event).
+        Con watchdog instalado los archivos nuevos se detectan por eventos del sistema (inotify en Linux);
+        sin él, la carpeta se revisa cada poll_interval segundos.
+        Un archivo se procesa cuando su tamaño y fecha no cambian durante settle_seconds (escritura terminada).
+        """
+        if self.mapping_data is None or self.db is None:
+            self.logger.error("Debe cargar el archivo de mapeo y conectarse a la BD primero")
+            return
+        if not os.path.isdir(xml_folder_path):
+            self.logger.error(f"❌ El modo vigilancia requiere una carpeta: {xml_folder_path}")
+            return
+        
+        watch_config = self.config.get('watch', {}) if self.config else {}
+        poll_interval = poll_interval or watch_config.get('poll_interval_seconds', 5)
+        bucket_minutes = bucket_minutes or watch_config.get('bucket_minutes', 60)
+        settle_seconds = settle_seconds if settle_seconds is not None else watch_config.get('settle_seconds', 2)
+        if output_format is None:
+            output_format = self._configured_output_format()
+        
+        try:
+            writer_class = get_report_writer_class(output_format)
+        except (ValueError, ImportError) as e:
+            self.logger.error(f"❌ {e}")
+            return
+        
+        report_dir = self._report_dir()
+        os.makedirs(report_dir, exist_ok=True)
+        columns_by_table = self._group_columns_by_table()
+        self._reset_performance_stats()
+        self._load_db_schema(columns_by_table)
+        
+        # Estado de los archivos: ya procesados y pendientes de terminar de escribirse, con su (tamaño, fecha)
+        processed = {}
+        pending = {}
+        if not process_existing:
+            processed = self._scan_watch_folder(xml_folder_path)
+        
+        observer, events = self._start_folder_observer(xml_folder_path)
+        # Con eventos, revisar igual la carpeta completa de vez en cuando por si se perdió alguno
+        full_scan_interval = poll_interval if observer is None else max(60, poll_interval)
+        last_full_scan = 0
+        
+        bucket_key = None
+        report_writer = None
+        
+        self.logger.log(SUMMARY_LEVEL, f"👀 Vigilando {xml_folder_path} ({'eventos del sistema' if observer else f'sondeo cada {poll_interval}s'}, reportes cada {bucket_minutes} min)")
+        
+        try:
+            while not (stop_event is not None and stop_event.is_set()):
+                # Cerrar el reporte del intervalo anterior
+                current_bucket = int(time.time() // (bucket_minutes * 60))
+                if report_writer is not None and current_bucket != bucket_key:
+                    self._close_watch_report(report_writer)
+                    report_writer = None
+                
+                # Archivos candidatos: los avisados por eventos, los pendientes y, cada tanto, toda la carpeta
+                candidates = set(pending)
+                if events is not None:
+                    while True:
+                        try:
+                            candidates.add(events.get_nowait())
+                        except queue.Empty:
+                            break
+                if time.time() - last_full_scan >= full_scan_interval:
+                    candidates.update(self._scan_watch_folder(xml_folder_path))
+                    last_full_scan = time.time()
+                
+                ready = self._ready_watch_files(xml_folder_path, candidates, processed, pending, settle_seconds)
+                
+                # Reconectar si se perdió la conexión; los archivos quedan pendientes hasta lograrlo
+                if ready and self.db.closed:
+                    self.logger.warning("Conexión a la BD perdida, reconectando...")
+                    if not self.connect_to_db():
+                        ready = []
+                
+                for xml_file, stat in ready:
+                    rows = self._compare_watched_file(xml_folder_path, xml_file, columns_by_table)
+                    
+                    if report_writer is None:
+                        bucket_key = current_bucket
+                        report_writer = writer_class(self._watch_report_path(report_dir, bucket_key * bucket_minutes * 60, writer_class.extension))
+                    report_writer.write_rows(rows)
+                    
+                    processed[xml_file] = stat
+                    pending.pop(xml_file, None)
+                
+                # Esperar eventos nuevos o el próximo sondeo
+                wait_seconds = 1 if (events is not None or pending) else poll_interval
+                if stop_event is not None:
+                    stop_event.wait(wait_seconds)
+                else:
+                    time.sleep(wait_seconds)
+        
+        except KeyboardInterrupt:
+            self.logger.info("Vigilancia detenida por el usuario")
+        
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
+            if report_writer is not None:
+                self._close_watch_report(report_writer)
+
+    def _scan_watch_folder(self, xml_folder_path):
+        """Archivos XML de la carpeta con su (tamaño, fecha de modificación)."""
+        files = {}
+        xml_input = self._get_xml_input(xml_folder_path)
+        with os.scandir(xml_folder_path) as entries:
+            for entry in entries:
+                if entry.is_file() and xml_input.matches(entry.name):
+                    stat = entry.stat()
+                    files[entry.name] = (stat.st_size, stat.st_mtime)
+        return files
+
+    def _ready_watch_files(self, xml_folder_path, candidates, processed, pending, settle_seconds):
+        """
+        De los archivos candidatos, devolver [(archivo, (tamaño, fecha))] listos para procesar: nuevos o
+        modificados respecto de la última vez que se procesaron, y sin cambios durante settle_seconds.
+        """
+        ready = []
+        now = time.time()
+        
+        for xml_file in sorted(candidates):
+            try:
+                stat = os.stat(os.path.join(xml_folder_path, xml_file))
+            except OSError:
+                # El archivo se borró o se movió antes de procesarlo
+                pending.pop(xml_file, None)
+                continue
+            
+            file_stat = (stat.st_size, stat.st_mtime)
+            if processed.get(xml_file) == file_stat:
+                continue
+            
+            previous = pending.get(xml_file)
+            if previous is None or previous[0] != file_stat:
+                # Primera vez que se ve o todavía se está escribiendo
+                pending[xml_file] = (file_stat, now)
+            elif now - previous[1] >= settle_seconds:
+                ready.append((xml_file, file_stat))
+        
+        return ready
+
+    def _start_folder_observer(self, xml_folder_path):
+        """
+        Iniciar la vigilancia por eventos con watchdog (inotify en Linux, ReadDirectoryChangesW en Windows).
+        Retorna (observer, cola de nombres de archivo) o (None, None) si watchdog no está instalado.
+        """
+        try:
+            from watchdog.observers import Observer
+            from watchdog.events import FileSystemEventHandler
+        except ImportError:
+            self.logger.info("watchdog no está instalado: la carpeta se vigilará por sondeo")
+            return None, None
+        
+        events = queue.Queue()
+        # El mismo filtro que la ejecución única (processing.input_pattern)
+        matches = self._get_xml_input(xml_folder_path).matches
+        
+        class XmlEventHandler(FileSystemEventHandler):
+            def _queue(self, path):
+                if matches(os.path.basename(path)):
+                    events.put(os.path.basename(path))
+            
+            def on_created(self, event):
+                if not event.is_directory:
+                    self._queue(event.src_path)
+            
+            def on_modified(self, event):
+                if not event.is_directory:
+                    self._queue(event.src_path)
+            
+            def on_moved(self, event):
+                if not event.is_directory:
+                    self._queue(event.dest_path)
+        
+        observer = Observer()
+        observer.schedule(XmlEventHandler(), xml_folder_path, recursive=False)
+        observer.start()
+        return observer, events
+
+    def _compare_watched_file(self, xml_folder_path, xml_file, columns_by_table):
+        """Extraer y comparar un archivo recibido en modo vigilancia (cada bloque, si tiene varios); retorna sus filas del reporte."""
+        rows = []
+        try:
+            records = self._extract_xml_records(xml_folder_path, xml_file)
+            identifiers_by_record = {record_name: ids for record_name, ids, _, error in records if error is None}
+            existing_records = self._bulk_verify_records_exist_in_db(identifiers_by_record) if identifiers_by_record else {}
+        except Exception as e:
+            self.logger.error("Error al procesar el archivo %s: %s", xml_file, str(e))
+            return [self._processing_error_row(xml_file, e)]
+        
+        for extracted in records:
+            record_rows = []
+            try:
+                if extracted[3] is not None:
+                    raise Exception(extracted[3])
+                self._compare_extracted_file(extracted, existing_records, columns_by_table, record_rows)
+            except Exception as e:
+                self.logger.error("Error al procesar el archivo %s: %s", extracted[0], str(e))
+                record_rows = [self._processing_error_row(extracted[0], e)]
+            rows.extend(record_rows)
+        
+        return rows
+
+    def _watch_report_path(self, report_dir, bucket_start, extension):
+        """Ruta del reporte de un intervalo; si ya existe (reinicio en el mismo intervalo) se agrega la hora actual."""
+        name = f"reporte_vigilancia_{datetime.fromtimestamp(bucket_start).strftime('%Y%m%d_%H%M')}"
+        report_path = os.path.join(report_dir, f"{name}.{extension}")
+        if os.path.exists(report_path):
+            report_path = os.path.join(report_dir, f"{name}_{datetime.now().strftime('%H%M%S')}.{extension}")
+        return report_path
+
+    def _close_watch_report(self, report_writer):
+        report_path = report_writer.close(performance=self.performance_summary())
+        self._reset_performance_stats()
+        self.logger.log(SUMMARY_LEVEL, f"Reporte generado: {report_path} ({report_writer.coincidencias}/{report_writer.total_comparaciones} coincidencias)")
+
+    def _checkpoint_path(self, xml_folder_path, report_dir):
+        """Archivo de checkpoint de la ejecución, identificado por la carpeta de XML y el archivo de mapeo."""
+        import hashlib
+        
+        key = f"{os.path.abspath(xml_folder_path)}|{os.path.abspath(self.mapping_file) if self.mapping_file else ''}"
+        return os.path.join(report_dir, f"checkpoint_{hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]}.jsonl")
+
+    def _checkpoint_ends_with_newline(self, checkpoint_path):
+        with open(checkpoint_path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+    def has_checkpoint(self, xml_folder_path):
+        """Indica si hay una ejecución interrumpida para esta carpeta que se puede reanudar."""
+        return os.path.exists(self._checkpoint_path(xml_folder_path, self._report_dir()))
+
+    def _load_checkpoint(self, checkpoint_path):
+        """
+        Leer un checkpoint: primera línea con los datos de la ejecución (incluidos los hashes del Excel de mapeo y
+        de los filtros con que se generaron las filas) y luego una línea por archivo terminado con sus filas del
+        reporte. Retorna (cabecera, {archivo: filas}) o (None, {}) si no existe.
+        Las líneas incompletas (corte durante la escritura) se descartan.
+        """
+        if not os.path.exists(checkpoint_path):
+            return None, {}
+        
+        header = None
+        completed_files = {}
+        with open(checkpoint_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    self.logger.warning(f"Línea incompleta descartada en el checkpoint {checkpoint_path}")
+                    continue
+                if header is None:
+                    header = entry
+                else:
+                    completed_files[entry['archivo']] = entry['rows']
+        
+        return header, completed_files
+
+    def _extract_xml_file(self, xml_folder_path, xml_file):
+        """
+        Etapa de extracción de un archivo: parsear el XML, extraer sus identificadores y evaluar el
+        XPath de cada mapeo. No usa la BD, por lo que puede ejecutarse en un proceso worker.
+        Retorna la tupla (archivo, identificadores, valores_xml, error), con valores_xml alineado
+        con valid_mappings y error con el mensaje si el archivo no se pudo procesar.
+        """
+        xml_input = self._get_xml_input(xml_folder_path)
+        self.logger.info("Procesando archivo: %s", xml_file)
+
+        try:
+            # Parsear el archivo XML con manejo robusto de errores
+            # Las rutas simples del mapeo se resuelven en la misma pasada (ver path_trie)
+            stage_start = time.perf_counter()
+            root, trie_matches = self._scan_xml_file(xml_input, xml_file)
+            self._record_stage('parseo_xml', time.perf_counter() - stage_start)
+            
+            if root is None:
+                raise Exception(f"No se pudo parsear el XML: {xml_file}")
+            
+            return self._extract_xml_record(xml_file, root, trie_matches)
+            
+        except Exception as e:
+            self.logger.error("Error al procesar el archivo %s: %s", xml_file, str(e))
+            return (xml_file, None, None, str(e))
+
+    def _extract_xml_records(self, xml_folder_path, xml_file):
+        """
+        Registros de un archivo: uno por bloque si es un archivo con varios bloques, o el archivo completo.
+        Con la caché de extracción activa, un archivo cuyo contenido ya se extrajo con el mismo plan no se parsea.
+        """
+        if self.extraction_cache is None:
+            return self._extract_file_records(xml_folder_path, xml_file)
+        
+        xml_input = self._get_xml_input(xml_folder_path)
+        stage_start = time.perf_counter()
+        try:
+            xml_hash = xml_input.content_hash(xml_file)
+            records = self.extraction_cache.get(xml_hash, xml_file)
+        except Exception as e:
+            self.logger.warning("No se pudo usar la caché de extracción para %s: %s", xml_file, e)
+            xml_hash, records = None, None
+        self._record_stage('cache_extraccion', time.perf_counter() - stage_start)
+        
+        if records is not None:
+            xml_input.release(xml_file)
+            self.logger.info("♻️ %s: %s registros desde la caché de extracción", xml_file, len(records))
+            return records
+        
+        try:
+            records = self._extract_file_records(xml_folder_path, xml_file)
+        finally:
+            xml_input.release(xml_file)
+        
+        # Los archivos con errores se vuelven a procesar en la próxima ejecución
+        if xml_hash is not None and all(error is None for _, _, _, error in records):
+            try:
+                self.extraction_cache.put(xml_hash, xml_file, records)
+            except Exception as e:
+                self.logger.warning("No se pudo guardar %s en la caché de extracción: %s", xml_file, e)
+        return records
+
+    def _extract_file_records(self, xml_folder_path, xml_file):
+        if self._block_delimiter is not None:
+            return self._extract_xml_blocks(xml_folder_path, xml_file)
+        return [self._extract_xml_file(xml_folder_path, xml_file)]
+
+    def _extract_xml_blocks(self, xml_folder_path, xml_file):
+        """
+        Extraer un archivo con varios bloques: un registro por bloque, llamado 'archivo[n]'. El archivo se lee
+        por streaming (ver xml_blocks) y cada bloque se libera después de extraerlo; si no tiene ningún bloque
+        es un solo registro. Si el XML tiene errores de formato, se vuelve a leer con recuperación de errores.
+        """
+        xml_input = self._get_xml_input(xml_folder_path)
+        self.logger.info("Procesando archivo con varios bloques: %s", xml_file)
+        
+        def read_blocks(recover):
+            # Los registros de un intento cortado por un error de formato se descartan
+            records = []
+            stage_start = time.perf_counter()
+            with xml_input.open(xml_file) as source:
+                events = iterparse_events(source, recover)
+                for number, root in iter_blocks(events, self._block_delimiter):
+                    trie_matches = self.path_trie.scan(root, self._extract_element_value)[1] if self.path_trie is not None else None
+                    self._record_stage('parseo_xml', time.perf_counter() - stage_start)
+                    records.append(self._extract_xml_record(f"{xml_file}[{number}]" if number else xml_file, root, trie_matches))
+                    stage_start = time.perf_counter()
+            return records, bool(records), events.error_log
+        
+        try:
+            records = self._parse_with_recovery(xml_file, read_blocks)
+            if not records:
+                raise Exception(f"No se pudo parsear el XML: {xml_file}")
+            self.logger.info("%s: %s bloques", xml_file, len(records))
+            return records
+        except Exception as e:
+            self.logger.error("Error al procesar el archivo %s: %s", xml_file, str(e))
+            return [(xml_file, None, None, str(e))]
+
+    def _extract_xml_record(self, xml_file, root, trie_matches=None):
+        """
+        Extraer los identificadores y el valor de cada mapeo de un documento ya parseado (un archivo o un bloque).
+        Retorna la tupla (registro, identificadores, valores_xml, None) de _extract_xml_file.
+        """
+        if self.xslt_extractor is not None:
+            stage_start = time.perf_counter()
+            self._apply_xslt_extractor(root, xml_file)
+            self._record_stage('transformacion_xslt', time.perf_counter() - stage_start)
+
+        # EXTRAER IDENTIFICADORES ÚNICOS DEL XML PARA BUSCAR REGISTRO ESPECÍFICO
+        stage_start = time.perf_counter()
+        record_identifiers = self._extract_record_identifiers(root, xml_file, trie_matches)
+        self._record_stage('identificadores', time.perf_counter() - stage_start)
+        
+        xml_values = []
+        stage_start = time.perf_counter()
+        for index, row in enumerate(self.valid_mappings):
+            xpath = row['xpath']
+            
+            if not xpath:
+                xml_values.append(None)
+                continue
+            
+            # Obtener valor del XML con soporte para XPath concatenados y condicionales
+            mapping_start = time.perf_counter()
+            xml_value = None
+            try:
+                if trie_matches is not None and self._trie_mappings[index]:
+                    xml_value = self._trie_mapping_value(trie_matches, xpath)
+                else:
+                    # Usar el método especializado que maneja lógicas especiales por campo
+                    xml_value = self._extract_xml_value_with_special_logic(root, xpath, row['column_name'], row['table_name'])
+                
+                if xml_value is None:
+                    self.logger.debug("No se encontró valor para XPath '%s' en %s", xpath, xml_file)
+                    
+            except Exception as e:
+                self.logger.error("Error al procesar XPath '%s' en %s: %s", xpath, xml_file, str(e))
+                xml_value = "ERROR_XPATH"
+            
+            xml_values.append(xml_value)
+            self._record_mapping_time(index, time.perf_counter() - mapping_start)
+        
+        self._record_stage('xpath_mapeos', time.perf_counter() - stage_start)
+        return (xml_file, record_identifiers, tuple(xml_values), None)
+
+    def _iter_extracted_files(self, xml_folder_path, xml_files, workers=1):
+        """
+        Ejecutar la etapa de extracción para todos los archivos y generar los resultados en el mismo
+        orden de xml_files, a medida que están listos (uno por bloque en los archivos con varios bloques).
+        Con workers > 1 los archivos se reparten en un pool de procesos; la BD y el reporte siguen en el
+        proceso principal.
+        """
+        if workers <= 1 or len(xml_files) < 2:
+            for xml_file in xml_files:
+                yield from self._extract_xml_records(xml_folder_path, xml_file)
+            return
+        
+        self.logger.info(f"Extracción paralela de {len(xml_files)} archivos con {workers} procesos")
+        chunksize = max(1, min(64, len(xml_files) // (workers * 4)))
+        
+        with multiprocessing.Pool(processes=workers, initializer=_init_extraction_worker, initargs=(self,)) as pool:
+            worker_results = pool.imap(_extract_xml_file_worker, self._extraction_tasks(xml_folder_path, xml_files), chunksize)
+            
+            # Sumar los tiempos medidos en cada worker
+            for records, performance_stats in worker_results:
+                self._merge_performance_stats(performance_stats)
+                yield from records
+
+    def _extraction_tasks(self, xml_folder_path, xml_files):
+        """
+        Argumentos de _extract_xml_file_worker para cada archivo. De un .tar el proceso principal lee cada miembro
+        en orden y envía su contenido, para que los workers no descompriman el archivo cada uno. El pool toma las
+        tareas a medida que los workers las piden, así que no se lee todo el archivo de una vez.
+        """
+        xml_input = self._get_xml_input(xml_folder_path)
+        for xml_file in xml_files:
+            if xml_input.sequential:
+                yield (xml_folder_path, xml_file, xml_input.read(xml_file))
+            else:
+                yield (xml_folder_path, xml_file)
+
+    def _compare_extracted_file(self, extracted, existing_records, columns_by_table, results, db=None):
+        """
+        Etapa de comparación de un archivo ya extraído (proceso principal): verificar que el registro
+        exista en la BD, traer sus columnas mapeadas y agregar a results una fila por mapeo.
+        db: backend a usar (una conexión del pool en las consultas en paralelo), por defecto self.db.
+        """
+        if db is None:
+            db = self.db
+        xml_file, record_identifiers, _, _ = extracted
+        
+        # VERIFICAR SI EXISTE UN REGISTRO EN LA BD CON ESTOS IDENTIFICADORES
+        verified, matching_record_found, found_table = self._start_file_comparison(extracted, existing_records)
+        if not verified:
+            matching_record_found, found_table = self._verify_record_exists_in_db(record_identifiers, db)
+        if not matching_record_found:
+            # Saltar este XML y continuar con el siguiente
+            results.append(self._record_not_found_row(xml_file, record_identifiers))
+            return
+
+        # Traer de una sola vez todas las columnas mapeadas de cada tabla para este registro
+        record_db_values = {}
+        if db is not None:
+            record_db_values = self._fetch_record_values(record_identifiers, columns_by_table, db)
+        
+        self._append_comparison_rows(extracted, found_table, record_db_values, results, connected=db is not None)
+
+    def _start_file_comparison(self, extracted, existing_records):
+        """
+        Inicio de la comparación de un archivo, común a _compare_extracted_file y su versión async: registrar el
+        archivo y sus identificadores y tomar el resultado de la verificación en bloque (existing_records).
+        Retorna (verificado, encontrado, tabla); verificado es False si no hubo verificación en bloque y el
+        registro se debe verificar con su propia consulta. Sin identificadores se compara el registro más
+        reciente (encontrado, sin tabla).
+        """
+        xml_file, record_identifiers, _, _ = extracted
+        self.logger.info("📄 PROCESANDO %s", xml_file)
+        
+        if not (record_identifiers and any(record_identifiers.values())):
+            self.logger.warning("No se pudieron extraer identificadores de %s, usando registro más reciente", xml_file)
+            return True, True, None
+        
+        self.logger.info("🔍 Identificadores extraídos de %s: %s", xml_file, record_identifiers)
+        if existing_records is None:
+            return False, False, None
+        
+        # Resultado ya resuelto en la verificación en bloque
+        found_table = existing_records.get(str(self._get_primary_identifier(record_identifiers)))
+        return True, found_table is not None, found_table
+
+    def _record_not_found_row(self, xml_file, record_identifiers):
+        """Fila de "no encontrado" para un XML cuyo registro no existe en la BD."""
+        # Extraer el valor principal del XML para el mensaje
+        xml_value = None
+        if record_identifiers.get('xref_id'):
+            xml_value = record_identifiers['xref_id']
+        elif record_identifiers.get('dispatch_number'):
+            xml_value = record_identifiers['dispatch_number']
+        
+        if xml_value:
+            error_message = f"No existe registro en la BD con xref_id/dispatch_number: '{xml_value}'"
+        else:
+            identifier_info = []
+            for key, value in record_identifiers.items():
+                if value:
+                    identifier_info.append(f"{key}: {value}")
+            identifier_text = ", ".join(identifier_info) if identifier_info else "Sin identificadores válidos"
+            error_message = f"No existe registro en la BD con {identifier_text}"
+        
+        self.logger.warning("No se encontró registro en BD para %s - %s", xml_file, error_message)
+        self.logger.log(SUMMARY_LEVEL, "📄 %s: sin registro en la BD", xml_file)
+        
+        return {
+            'archivo': xml_file,
+            'tabla': 'N/A',
+            'campo': 'verificacion_registro',
+            'xpath': 'N/A',
+            'valor_xml': xml_value or "Sin identificadores válidos",
+            'valor_bd': 'N/A',
+            'coincide': False,
+            'observaciones': error_message
+        }
+
+    def _append_comparison_rows(self, extracted, found_table, record_db_values, results, connected=True):
+        """
+        Comparar los valores XML de un archivo con los valores ya traídos de la BD (record_db_values,
+        {tabla: {columna: valor}}) y agregar a results una fila por mapeo. connected: hay conexión a la BD.
+        """
+        xml_file, _, xml_values, _ = extracted
+        first_row = len(results)
+
+        # Si se encontró el registro, log de información sobre qué tabla se usará
+        if found_table:
+            self.logger.info("Procesando comparación para %s usando registros de tabla: %s", xml_file, found_table)
+
+        # Procesar cada mapeo válido generado
+        comparison_start = time.perf_counter()
+        for row, xml_value in zip(self.valid_mappings, xml_values):
+            xpath = row['xpath']
+            
+            if not xpath:
+                self.logger.warning("XPath vacío en mapeo: %s", row)
+                continue
+
+            # Obtener valor de la BD desde la fila ya consultada para este registro
+            db_value = None
+            try:
+                # VERIFICAR CURSOR ANTES DE USAR
+                if not connected:
+                    self.logger.error("❌ SIN CONEXIÓN A BD - La conexión a BD no se estableció correctamente")
+                    db_value = "ERROR_CONEXION"
+                    continue
+                
+                db_value = record_db_values.get(row['table_name'], {}).get(row['column_name'])
+            
+            except Exception as e:
+                self.logger.error("Error general: %s", str(e))
+                db_value = "ERROR_QUERY"
+
+            # Comparar valores con tratamiento especial para coordenadas
+            xml_str = str(xml_value) if xml_value is not None else ""
+            db_str = str(db_value) if db_value is not None else ""
+            
+            # Variables para almacenar valores para comparación (pueden ser diferentes a los originales)
+            xml_comparison_value = xml_str
+            db_comparison_value = db_str
+            
+            # Tratamiento especial para latitude y longitude
+            if row['column_name'].lower() in ['latitude', 'longitude']:
+                self.logger.debug("🗺️ Procesando coordenada %s: XML='%s', DB='%s'", row['column_name'], xml_str, db_str)
+                # Normalizar SOLO si ambos valores son válidos y numéricos
+                if xml_str and xml_str not in ["ERROR_XPATH", "ERROR_CONEXION", "ERROR_QUERY", "CAMPO_NO_EXISTE", ""]:
+                    xml_comparison_value = self._normalize_coordinate(xml_str)
+                    self.logger.debug("🗺️ XML normalizado: '%s' -> '%s'", xml_str, xml_comparison_value)
+                
+                if db_str and db_str not in ["ERROR_XPATH", "ERROR_CONEXION", "ERROR_QUERY", "CAMPO_NO_EXISTE", "", "None"]:
+                    db_comparison_value = self._normalize_coordinate(db_str)
+                    self.logger.debug("🗺️ BD normalizado: '%s' -> '%s'", db_str, db_comparison_value)
+                
+                match = (xml_comparison_value == db_comparison_value) and xml_comparison_value != "" and db_comparison_value != ""
+            else:
+                # Columnas numéricas, booleanas o de fecha según el esquema de la BD: comparar el valor y no su texto
+                type_category = self._column_type_category(self.db_column_type(row['table_name'], row['column_name']))
+                if type_category:
+                    xml_comparison_value = self._normalize_typed_value(xml_str, type_category)
+                    db_comparison_value = self._normalize_typed_value(db_str, type_category)
+                match = (xml_comparison_value == db_comparison_value) and xml_comparison_value != "" and db_comparison_value != ""
+            
+            # Log detallado para debugging
+            self.logger.debug("Comparación - XPath: %s, XML: '%s', DB: '%s', Match: %s", xpath, xml_str, db_str, match)
+            
+            results.append({
+                'archivo': xml_file,
+                'tabla': row['table_name'],
+                'campo': row.get('column_original', row['column_name']), 
+                'xpath': xpath,
+                'valor_xml': xml_value,
+                'valor_bd': db_value,
+                'coincide': match,
+                'observaciones': self._get_comparison_notes(xml_value, db_value, row['column_name'], row['table_name'])
+            })
+        
+        self._record_stage('comparacion', time.perf_counter() - comparison_start)
+        
+        file_rows = results[first_row:]
+        self.logger.log(SUMMARY_LEVEL, "📄 %s: %d comparaciones, %d coincidencias",
+                        xml_file, len(file_rows), sum(1 for result in file_rows if result['coincide']))
+
     def _normalize_coordinate(self, coord_str):
         """
         Normalizar coordenadas (latitude/longitude) a 7 decimales.
@@ -1735,8 +3657,62 @@ class XPathMapper:
             # Si no se puede convertir a float, devolver el valor original
             return coord_str
 
-    def _get_comparison_notes(self, xml_value, db_value, column_name=None):
-        """Generar notas sobre la comparación."""
+    def _column_type_category(self, data_type):
+        """Categoría de un tipo de columna del esquema (ver COLUMN_TYPE_CATEGORIES), o None si se compara como texto."""
+        import re
+        if not data_type:
+            return None
+        data_type = data_type.strip().lower()
+        for category, pattern in self.COLUMN_TYPE_CATEGORIES:
+            if re.match(pattern, data_type):
+                return category
+        return None
+
+    def _normalize_typed_value(self, value_str, type_category):
+        """
+        Normalizar un valor del XML o de la BD según la categoría del tipo de su columna: '5', '5.0' y '5.00' en
+        columnas numéricas; 'Y', 't' y 'true' en booleanas; '2025-03-12T09:59:34' y '2025-03-12 09:59:34' en
+        fechas. Si el texto no se puede interpretar con ese tipo se devuelve sin cambios.
+        """
+        if not value_str or value_str in ["ERROR_XPATH", "ERROR_CONEXION", "ERROR_QUERY", "CAMPO_NO_EXISTE"]:
+            return value_str
+        text = value_str.strip()
+        
+        if type_category == 'numerico':
+            try:
+                number = Decimal(text)
+            except InvalidOperation:
+                return value_str
+            # '+ 0' convierte '-0' en '0'; normalize() quita los ceros finales
+            return format((number + 0).normalize(), 'f') if number.is_finite() else value_str
+        
+        if type_category == 'booleano':
+            return self.BOOLEAN_TEXT_VALUES.get(text.lower(), value_str)
+        
+        parsed = self._parse_datetime_text(text)
+        if parsed is None:
+            return value_str
+        if type_category == 'fecha':
+            return parsed.date().isoformat()
+        if parsed.tzinfo is not None:
+            parsed = parsed.astimezone(timezone.utc)
+        return parsed.isoformat(sep=' ')
+
+    def _parse_datetime_text(self, text):
+        """Interpretar una fecha u hora del XML o de la BD (ISO 8601 o DATETIME_TEXT_FORMATS), o None si no es una fecha."""
+        try:
+            return datetime.fromisoformat(text[:-1] + '+00:00' if text.endswith('Z') else text)
+        except ValueError:
+            pass
+        for date_format in self.DATETIME_TEXT_FORMATS:
+            try:
+                return datetime.strptime(text, date_format)
+            except ValueError:
+                continue
+        return None
+
+    def _get_comparison_notes(self, xml_value, db_value, column_name=None, table_name=None):
+        """Generar notas sobre la comparación (table_name: tabla de la columna, para su tipo en el esquema de la BD)."""
         # Verificar si hay errores
         if "ERROR" in str(xml_value):
             return "Error al obtener valor XML"
@@ -1772,66 +3748,72 @@ class XPathMapper:
             # Comparación normal para otros campos
             if xml_str == db_str:
                 return "Valores coinciden"
+            type_category = self._column_type_category(self.db_column_type(table_name, column_name)) if table_name else None
+            if type_category and self._normalize_typed_value(xml_str, type_category) == self._normalize_typed_value(db_str, type_category):
+                return f"Valores coinciden (normalizados como {type_category})"
             else:
                 return f"Valores diferentes: XML='{xml_str}' vs BD='{db_str}'"
 
-    def _apply_color_formatting(self, report_path, df):
-        """Aplicar formato de colores al reporte Excel."""
-        try:
-            # Cargar el archivo Excel generado
-            workbook = openpyxl.load_workbook(report_path)
-            worksheet = workbook['Resultados']
-            
-            # Definir colores
-            green_fill = PatternFill(start_color="C6EFCE", end_color="C6EFCE", fill_type="solid")  # Verde claro
-            red_fill = PatternFill(start_color="FFC7CE", end_color="FFC7CE", fill_type="solid")    # Rojo claro
-            yellow_fill = PatternFill(start_color="FFEB9C", end_color="FFEB9C", fill_type="solid") # Amarillo claro
-            blue_fill = PatternFill(start_color="BDD7EE", end_color="BDD7EE", fill_type="solid")   # Azul claro
-            
-            # Buscar la columna de "observaciones"
-            observaciones_col = None
-            for col_idx, cell in enumerate(worksheet[1], 1):  # Primera fila (encabezados)
-                if cell.value and 'observacion' in str(cell.value).lower():
-                    observaciones_col = col_idx
-                    break
-            
-            if not observaciones_col:
-                self.logger.warning("No se encontró la columna 'observaciones' para aplicar colores")
-                return
-            
-            # Aplicar colores según el contenido de observaciones
-            for row_idx in range(2, len(df) + 2):  # Empezar desde la fila 2 (datos, no encabezados)
-                cell = worksheet.cell(row=row_idx, column=observaciones_col)
-                if cell.value:
-                    observacion = str(cell.value).lower()
-                    
-                    if "coinciden" in observacion:
-                        # Verde para coincidencias - solo la celda de observaciones
-                        cell.fill = green_fill
-                    elif "error" in observacion:
-                        # Amarillo para errores - solo la celda de observaciones
-                        cell.fill = yellow_fill
-                    elif "diferentes" in observacion:
-                        # Rojo para diferencias - solo la celda de observaciones
-                        cell.fill = red_fill
-                    elif "nulo" in observacion or "nulos" in observacion:
-                        # Azul para valores nulos - solo la celda de observaciones
-                        cell.fill = blue_fill
-            
-            # Guardar cambios
-            workbook.save(report_path)
-            self.logger.info("Formato de colores aplicado al reporte Excel")
-            
-        except Exception as e:
-            self.logger.error(f"Error aplicando formato de colores: {str(e)}")
-            # El reporte se genera sin colores si hay error
+
+# Mapper del proceso worker para la extracción paralela (se inicializa una vez por proceso)
+_worker_mapper = None
+
+
+def _init_extraction_worker(mapper):
+    """Inicializar un proceso worker con el mapper ya cargado (mapeos y configuración)."""
+    global _worker_mapper
+    _worker_mapper = mapper
+    _worker_mapper._reset_performance_stats()
+    
+    # Escribir directamente en el archivo de log del proceso principal: el worker no tiene el hilo que vacía
+    # la cola (con fork hereda el QueueHandler sin su listener) y el pool puede terminarlo sin vaciarla
+    logger = logging.getLogger('XPathMapper')
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    if getattr(mapper, 'log_file', None):
+        file_handler = logging.FileHandler(mapper.log_file, encoding='utf-8')
+        file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        logger.addHandler(file_handler)
+    logger.setLevel(LOG_PROFILES.get(getattr(mapper, 'log_profile', 'normal'), logging.INFO))
+
+
+def _extract_xml_file_worker(args):
+    """
+    Extraer los registros de un archivo XML en el proceso worker; devuelve también los tiempos medidos para ese archivo.
+    args: (carpeta, archivo) o (carpeta, archivo, contenido) si el proceso principal ya leyó el archivo (.tar).
+    """
+    xml_folder_path, xml_file = args[:2]
+    xml_input = _worker_mapper._get_xml_input(xml_folder_path)
+    if len(args) > 2:
+        xml_input.preload(xml_file, args[2])
+    try:
+        records = _worker_mapper._extract_xml_records(xml_folder_path, xml_file)
+    finally:
+        xml_input.release(xml_file)
+    return records, _worker_mapper._take_performance_stats()
 
 
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Comparar archivos XML con la base de datos")
+    parser.add_argument('--resume', action='store_true', help="Reanudar la ejecución interrumpida de la carpeta desde su checkpoint en reportes/")
+    parser.add_argument('--async', dest='async_mode', action='store_true', help="Usar el comparador async (etapas solapadas; sin checkpoint, no admite --resume)")
+    parser.add_argument('--watch', action='store_true', help="Vigilar la carpeta y comparar cada XML nuevo a medida que llega (Ctrl+C para detener)")
+    parser.add_argument('--create-snapshot', metavar='RUTA', help="Exportar de la BD los registros de los filtros configurados a un snapshot local y terminar")
+    parser.add_argument('--snapshot-format', choices=['sqlite', 'parquet'], default='sqlite', help="Formato del snapshot de --create-snapshot (parquet: carpeta, requiere pyarrow)")
+    parser.add_argument('--db-snapshot', metavar='RUTA', help="Comparar contra un snapshot local de la BD en lugar del servidor")
+    parser.add_argument('--entrada', metavar='RUTA', help="Carpeta, .zip o .tar.gz con los XML a comparar (los comprimidos se leen sin descomprimirlos a disco)")
+    parser.add_argument('--patron', metavar='GLOB', help="Comparar solo los XML cuyo nombre cumple el patrón (processing.input_pattern), por ejemplo 'Incident_*.xml'")
+    args = parser.parse_args()
+    if args.async_mode and args.resume:
+        # El comparador async no guarda checkpoint: no hay nada que reanudar
+        parser.error("--async no admite --resume (el checkpoint solo lo guarda el comparador sincrónico)")
+    
     # Configuración para ejecución directa
     config_path = r"C:\FDSU\Automatizacion\Yatary_Pruebas\XML_BD_Comparator\config\config.json"
     mapping_path = r"C:\FDSU\Automatizacion\Yatary_Pruebas\XML_BD_Comparator\mappings\Humphreys_Co_TN_GeoConex_XML_Mappings_20250508.xlsx"
-    xml_folder_path = r"C:\FDSU\Clients\Obion TN\example"
+    xml_folder_path = args.entrada or r"C:\FDSU\Clients\Obion TN\example"
     
     # Crear instancia del comparador con archivos de configuración
     comparador = XPathMapper(config_file=config_path, mapping_file=mapping_path)
@@ -1848,21 +3830,48 @@ if __name__ == "__main__":
         exit(1)
     print("✅ Mapeo cargado exitosamente")
     
-    # Conectar a base de datos
-    if comparador.connect_to_db():
+    if args.patron:
+        comparador.config.setdefault('processing', {})['input_pattern'] = args.patron
+    
+    # Conectar a base de datos (o a su snapshot local)
+    if args.db_snapshot:
+        if comparador.connect_to_snapshot(args.db_snapshot):
+            print(f"✅ Usando snapshot de la BD: {args.db_snapshot}")
+        else:
+            print("❌ Error abriendo el snapshot de la BD")
+            exit(1)
+    elif comparador.connect_to_db():
         print("✅ Conexión a base de datos establecida")
     else:
         print("❌ Error conectando a base de datos")
         exit(1)
     
-    # Ejecutar comparación
-    print(f"🔍 Iniciando comparación de XMLs en: {xml_folder_path}")
-    results = comparador.compare_xml_with_db(xml_folder_path)
+    if args.create_snapshot:
+        # Exportar los registros de los filtros configurados y terminar
+        snapshot_path = comparador.create_db_snapshot(args.create_snapshot, args.snapshot_format)
+        comparador.close_db_connection()
+        if not snapshot_path:
+            print("❌ Error creando el snapshot de la BD (ver el log)")
+            exit(1)
+        print(f"✅ Snapshot creado: {snapshot_path}")
+        exit(0)
     
-    if results:
-        print(f"✅ Comparación completada. {len(results)} comparaciones realizadas")
+    if args.watch:
+        # Modo vigilancia: procesar los XML a medida que llegan
+        print(f"👀 Vigilando la carpeta: {xml_folder_path} (Ctrl+C para detener)")
+        comparador.watch_folder(xml_folder_path)
     else:
-        print("❌ No se obtuvieron resultados de la comparación")
+        # Ejecutar comparación
+        print(f"🔍 Iniciando comparación de XMLs en: {xml_folder_path}")
+        if args.async_mode:
+            results = asyncio.run(comparador.compare_xml_with_db_async(xml_folder_path))
+        else:
+            results = comparador.compare_xml_with_db(xml_folder_path, resume=args.resume)
+        
+        if results:
+            print(f"✅ Comparación completada. {len(results)} comparaciones realizadas")
+        else:
+            print("❌ No se obtuvieron resultados de la comparación")
     
     # Cerrar conexión
     comparador.close_db_connection()
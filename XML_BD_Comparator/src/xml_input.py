@@ -0,0 +1,211 @@
+"""
+Entrada de los XML a comparar: una carpeta, un .zip o un .tar (.tar.gz, .tgz, .tar.bz2).
+
+Los archivos comprimidos se leen sin descomprimirlos a disco: cada miembro se entrega al parser de lxml
+como un stream leído directamente del archivo. Los miembros se pueden filtrar con un patrón glob
+(processing.input_pattern); sin patrón se toman los que terminan en .xml. Los objetos se pueden enviar a
+procesos worker: cada proceso abre su propio manejador del archivo comprimido la primera vez que lee un
+miembro (con fork, compartir el heredado mezclaría las lecturas de los procesos). Un .tar (sequential) no se
+abre en los workers: descomprimirlo en cada uno repetiría todo el archivo por worker, así que el proceso
+principal lee cada miembro una vez con read y se lo envía al worker, que lo carga con preload.
+"""
+import fnmatch
+import hashlib
+import io
+import os
+import tarfile
+import zipfile
+from contextlib import contextmanager
+
+
+def open_xml_input(path, pattern=None):
+    """Entrada para path según sea una carpeta, un .zip o un .tar; ValueError si no es ninguno de ellos."""
+    if os.path.isdir(path):
+        return DirectoryInput(path, pattern)
+    if os.path.isfile(path):
+        if zipfile.is_zipfile(path):
+            return ZipInput(path, pattern)
+        if tarfile.is_tarfile(path):
+            return TarInput(path, pattern)
+    raise ValueError(f"La entrada {path} no es una carpeta, un .zip ni un .tar/.tar.gz")
+
+
+class XmlInput:
+    """Base de las entradas: lista los XML (list_files) y abre cada uno para el parser (open)."""
+
+    kind = None
+    # Los miembros solo se leen bien en el orden del archivo (ver TarInput)
+    sequential = False
+
+    def __init__(self, path, pattern=None):
+        self.path = path
+        self.pattern = pattern.lower() if pattern else None
+        # Último miembro leído por content_hash o recibido con preload (nombre, bytes): el parser lo toma de
+        # memoria en lugar de releerlo
+        self._loaded = None
+
+    def list_files(self):
+        """Nombres de los XML de la entrada que cumplen el patrón, en el orden de la carpeta o del archivo."""
+        return [name for name in self._names() if self.matches(name)]
+
+    def matches(self, name):
+        """El nombre (o ruta dentro del archivo) cumple processing.input_pattern, o termina en .xml si no hay patrón."""
+        name = name.lower()
+        if self.pattern is None:
+            return name.endswith('.xml')
+        return fnmatch.fnmatchcase(name, self.pattern) or fnmatch.fnmatchcase(name.rsplit('/', 1)[-1], self.pattern)
+
+    def _names(self):
+        raise NotImplementedError
+
+    @contextmanager
+    def open(self, name):
+        """Ruta o stream binario del XML name, para etree.parse/iterparse."""
+        if self._loaded is not None and self._loaded[0] == name:
+            yield io.BytesIO(self._loaded[1])
+            return
+        with self._open(name) as source:
+            yield source
+
+    @contextmanager
+    def _open(self, name):
+        raise NotImplementedError
+        yield
+
+    def read(self, name):
+        """Contenido completo del XML name."""
+        if self._loaded is not None and self._loaded[0] == name:
+            return self._loaded[1]
+        with self._open(name) as stream:
+            return stream.read()
+
+    def preload(self, name, data):
+        """Usar data como contenido de name en el siguiente open (contenido leído por otro proceso)."""
+        self._loaded = (name, data)
+
+    def content_hash(self, name):
+        """
+        SHA-256 del contenido del XML name. El contenido queda en memoria para el siguiente open(name): en un
+        .tar.gz volver a abrir un miembro ya leído obligaría a descomprimir el archivo desde el principio.
+        """
+        data = self.read(name)
+        self._loaded = (name, data)
+        return hashlib.sha256(data).hexdigest()
+
+    def release(self, name):
+        """Liberar el contenido de name que guardó content_hash."""
+        if self._loaded is not None and self._loaded[0] == name:
+            self._loaded = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_loaded'] = None
+        return state
+
+    def close(self):
+        self._loaded = None
+
+    def describe(self):
+        return f"{self.kind} {self.path}"
+
+
+class DirectoryInput(XmlInput):
+    kind = 'carpeta'
+
+    def _names(self):
+        return os.listdir(self.path)
+
+    @contextmanager
+    def _open(self, name):
+        # lxml lee la ruta directamente, sin pasar por un objeto de Python
+        yield os.path.join(self.path, name)
+
+    def read(self, name):
+        with open(os.path.join(self.path, name), 'rb') as f:
+            return f.read()
+
+    def content_hash(self, name):
+        # El parser vuelve a leer la ruta (desde la caché del sistema operativo); no hace falta guardar el contenido
+        digest = hashlib.sha256()
+        with open(os.path.join(self.path, name), 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+
+class ZipInput(XmlInput):
+    kind = 'zip'
+
+    def __init__(self, path, pattern=None):
+        super().__init__(path, pattern)
+        self._zip = None
+        self._pid = None
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state['_zip'] = None
+        return state
+
+    def _archive(self):
+        if self._zip is None or self._pid != os.getpid():
+            self._zip = zipfile.ZipFile(self.path)
+            self._pid = os.getpid()
+        return self._zip
+
+    def _names(self):
+        return [info.filename for info in self._archive().infolist() if not info.is_dir()]
+
+    @contextmanager
+    def _open(self, name):
+        with self._archive().open(name) as stream:
+            yield stream
+
+    def close(self):
+        super().close()
+        if self._zip is not None:
+            self._zip.close()
+            self._zip = None
+
+
+class TarInput(XmlInput):
+    """
+    .tar comprimido o no. Los miembros se leen por su posición en el archivo: en el orden de la lista el
+    stream solo avanza, sin volver a descomprimir desde el principio.
+    """
+    kind = 'tar'
+    sequential = True
+
+    def __init__(self, path, pattern=None):
+        super().__init__(path, pattern)
+        self._tar = None
+        self._pid = None
+        self._members = None
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        state['_tar'] = None
+        return state
+
+    def _archive(self):
+        if self._tar is None or self._pid != os.getpid():
+            self._tar = tarfile.open(self.path, 'r:*')
+            self._pid = os.getpid()
+        return self._tar
+
+    def _names(self):
+        if self._members is None:
+            self._members = {member.name: member for member in self._archive().getmembers() if member.isfile()}
+        return list(self._members)
+
+    @contextmanager
+    def _open(self, name):
+        if self._members is None:
+            self._names()
+        with self._archive().extractfile(self._members[name]) as stream:
+            yield stream
+
+    def close(self):
+        super().close()
+        if self._tar is not None:
+            self._tar.close()
+            self._tar = None
@@ -0,0 +1,73 @@
+"""
+Extracción con una sola transformación XSLT por documento.
+
+Las expresiones XPath del mapeo (cada parte de las concatenaciones con '+' o AND, las de narrativas y
+cross_street, las condiciones de las reglas WHEN y las rutas de los identificadores) se compilan al cargar
+el mapeo en una única hoja de estilos. libxslt la aplica a cada documento y produce un registro plano con,
+por expresión, el valor de cada nodo que selecciona, en orden del documento y sin recortar: el texto
+inicial del elemento si lo tiene, o todo su texto interno (como _extract_element_value). Las uniones de
+valores y el respaldo case-insensitive los sigue haciendo el comparador sobre ese registro.
+"""
+from lxml import etree
+
+XSL_NAMESPACE = 'http://www.w3.org/1999/XSL/Transform'
+
+# Valor de cada nodo seleccionado: elementos como _extract_element_value, atributos y texto tal cual
+VALUE_TEMPLATES = f"""<xsl:stylesheet version="1.0" xmlns:xsl="{XSL_NAMESPACE}">
+  <xsl:template match="*" mode="valor" priority="1">
+    <v><xsl:choose>
+      <xsl:when test="node()[1][self::text()]"><xsl:value-of select="node()[1]"/></xsl:when>
+      <xsl:otherwise><xsl:value-of select="."/></xsl:otherwise>
+    </xsl:choose></v>
+  </xsl:template>
+  <xsl:template match="@*|node()" mode="valor"><v><xsl:value-of select="."/></v></xsl:template>
+</xsl:stylesheet>"""
+
+
+def _xsl(parent, name, **attributes):
+    return etree.SubElement(parent, f"{{{XSL_NAMESPACE}}}{name}", attributes)
+
+
+class XsltExtractor:
+    """
+    Hoja de estilos con todas las expresiones del mapeo que seleccionan nodos. Las expresiones que no
+    compilan o que devuelven otro tipo (número, texto, booleano) quedan en skipped y se evalúan con XPath.
+    Se puede enviar a procesos worker: la transformación compilada se vuelve a crear la primera vez que se usa.
+    """
+
+    def __init__(self, expressions):
+        self.expressions = []
+        self.skipped = []
+        probe = etree.fromstring('<probe/>')
+        for expression in expressions:
+            if not expression or expression in self.expressions or expression in self.skipped:
+                continue
+            try:
+                selects_nodes = isinstance(etree.XPath(expression)(probe), list)
+            except etree.XPathError:
+                selects_nodes = False
+            (self.expressions if selects_nodes else self.skipped).append(expression)
+
+        stylesheet = etree.fromstring(VALUE_TEMPLATES)
+        template = _xsl(stylesheet, 'template', match='/')
+        record = etree.SubElement(template, 'registro')
+        for expression in self.expressions:
+            _xsl(etree.SubElement(record, 'e'), 'apply-templates', select=expression, mode='valor')
+        self.stylesheet = etree.tostring(stylesheet)
+        self._transform = None
+
+    def __len__(self):
+        return len(self.expressions)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_transform'] = None
+        return state
+
+    def extract(self, root):
+        """Aplicar la transformación al documento de root. Retorna {expresión: [valores sin recortar]}."""
+        if self._transform is None:
+            self._transform = etree.XSLT(etree.fromstring(self.stylesheet))
+        record = self._transform(root.getroottree()).getroot()
+        return {expression: [value.text or '' for value in element]
+                for expression, element in zip(self.expressions, record)}
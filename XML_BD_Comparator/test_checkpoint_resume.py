@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""
+Prueba del checkpoint y de la reanudación (resume=True / --resume): una comparación cortada después de N
+archivos deja el checkpoint, y al reanudarla (incluso después de un segundo corte) el reporte tiene las mismas
+filas que una ejecución sin cortes, sin archivos repetidos ni faltantes.
+
+Uso: python test_checkpoint_resume.py  (o python -m pytest test_checkpoint_resume.py)
+"""
+import glob
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+
+import openpyxl
+
+from testing_helpers import BASE_DIR, SAMPLE_ID, SAMPLE_XML, WORKBOOK, load_mapper, run_tests  # primero: agrega src/ al sys.path
+from db_backend import SQLiteBackend
+
+FILE_COUNT = 7
+FILTERS = {'batt_dept_id': {'values': [4611]}, 'datetime': {'start_datetime': '2025-01-01 00:00:00'}}
+
+
+def incident_id(i):
+    return f"{SAMPLE_ID[:-2]}{39 + i}"
+
+
+def write_xmls(folder):
+    """FILE_COUNT XML de incidentes; uno de cada tres no está en la BD."""
+    with open(SAMPLE_XML, 'rb') as f:
+        data = f.read()
+    for i in range(FILE_COUNT):
+        number = incident_id(i) if i % 3 != 2 else f"NOEXISTE{i}"
+        with open(os.path.join(folder, f"incidente_{i:02d}.xml"), 'wb') as f:
+            f.write(data.replace(SAMPLE_ID.encode(), number.encode()))
+
+
+def create_database(db_path, mappings):
+    """BD SQLite con las tablas de los mapeos y un registro por incidente (salvo los que no existen)."""
+    columns = {}
+    for mapping in mappings:
+        columns.setdefault(mapping['table_name'], set()).add(mapping['column_name'])
+    conn = sqlite3.connect(db_path)
+    for table, table_columns in columns.items():
+        table_columns = table_columns | {'id', 'batt_dept_id', 'created_at', 'nfirs_notification_id', 'xref_id', 'dispatch_number', 'incident_number'}
+        conn.execute(f"CREATE TABLE {table} ({', '.join(sorted(table_columns))})")
+    for i in range(FILE_COUNT):
+        if i % 3 == 2:
+            continue
+        conn.execute("INSERT INTO dispatch (id, batt_dept_id, created_at, xref_id, city) VALUES (?, 4611, '2025-03-12', ?, 'HOMER GLEN')", (i + 1, incident_id(i)))
+        conn.execute("INSERT INTO nfirs_notification (id, batt_dept_id, created_at, dispatch_number) VALUES (?, 4611, '2025-03-12', ?)", (i + 1, incident_id(i)))
+    conn.commit()
+    conn.close()
+
+
+def sqlite_mapper(db_path, workbook=WORKBOOK, filters=FILTERS):
+    """Mapper del Excel workbook conectado a la BD SQLite db_path (creada la primera vez)."""
+    mapper = load_mapper(workbook, filters=filters)
+    if not os.path.exists(db_path):
+        create_database(db_path, mapper.valid_mappings)
+    mapper.db = SQLiteBackend(db_path, sqlite3.connect(db_path))
+    return mapper
+
+
+def interrupt_after(mapper, file_count):
+    """Perder la conexión a la BD al comparar el archivo file_count + 1 (los anteriores quedan en el checkpoint)."""
+    compare = mapper._compare_extracted_file
+    compared = []
+
+    def compare_until_interrupted(*args):
+        if len(compared) == file_count:
+            mapper.db._closed = True
+        compared.append(args[0][0])
+        return compare(*args)
+
+    mapper._compare_extracted_file = compare_until_interrupted
+
+
+def read_report(report_path):
+    with open(report_path, encoding='utf-8') as f:
+        rows = [json.loads(line) for line in f]
+    with open(os.path.splitext(report_path)[0] + '_resumen.json', encoding='utf-8') as f:
+        return rows, json.load(f)
+
+
+def remove_report(report_path):
+    base_path = os.path.splitext(report_path)[0]
+    for path in (report_path, base_path + '_resumen.json', base_path + '_rendimiento.json'):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def test_resume_after_interruptions():
+    """Dos cortes y una reanudación final: mismas filas que sin cortes, cada archivo una sola vez."""
+    with tempfile.TemporaryDirectory() as work:
+        folder = os.path.join(work, 'xmls')
+        os.makedirs(folder)
+        write_xmls(folder)
+        db_path = os.path.join(work, 'bd.sqlite')
+
+        expected_path = sqlite_mapper(db_path).compare_xml_with_db(folder, output_format='jsonl')
+        assert expected_path
+        try:
+            expected_rows, expected_summary = read_report(expected_path)
+        finally:
+            remove_report(expected_path)
+        files = sorted({row['archivo'] for row in expected_rows})
+        assert len(files) == FILE_COUNT
+
+        # Primer corte: quedan 2 archivos en el checkpoint
+        mapper = sqlite_mapper(db_path)
+        interrupt_after(mapper, 2)
+        checkpoint_path = mapper._checkpoint_path(folder, os.path.join(BASE_DIR, 'reportes'))
+        report_path = None
+        try:
+            assert mapper.compare_xml_with_db(folder, output_format='jsonl') is None
+            assert mapper.has_checkpoint(folder)
+            header, completed = mapper._load_checkpoint(checkpoint_path)
+            report_path = header['report_path']
+            first_files = list(completed)
+            assert len(first_files) == 2 and set(first_files) < set(files)
+
+            # Segundo corte durante la reanudación: el checkpoint suma los archivos nuevos sin repetir los anteriores
+            mapper = sqlite_mapper(db_path)
+            interrupt_after(mapper, 3)
+            assert mapper.compare_xml_with_db(folder, resume=True) is None
+            _, completed = mapper._load_checkpoint(checkpoint_path)
+            assert list(completed)[:2] == first_files and len(completed) == 5 and set(completed) < set(files)
+
+            # Reanudación final: el reporte de la ejecución original, completo
+            mapper = sqlite_mapper(db_path)
+            assert mapper.compare_xml_with_db(folder, resume=True) == report_path
+            assert not mapper.has_checkpoint(folder)
+
+            rows, summary = read_report(report_path)
+            assert rows == expected_rows
+            assert summary == expected_summary
+            rows_per_file = {name: sum(1 for row in rows if row['archivo'] == name) for name in files}
+            assert rows_per_file == {name: sum(1 for row in expected_rows if row['archivo'] == name) for name in files}
+        finally:
+            if report_path is not None:
+                remove_report(report_path)
+            if os.path.exists(checkpoint_path):
+                os.remove(checkpoint_path)
+
+
+def test_resume_with_changed_plan_starts_over():
+    """Si cambió el contenido del Excel de mapeo o los filtros, --resume descarta el checkpoint y empieza de nuevo."""
+    later_start = dict(FILTERS, datetime={'start_datetime': '2025-03-01 00:00:00'})
+    for change in ('mapping', 'filters'):
+        with tempfile.TemporaryDirectory() as work:
+            folder = os.path.join(work, 'xmls')
+            os.makedirs(folder)
+            write_xmls(folder)
+            db_path = os.path.join(work, 'bd.sqlite')
+            workbook = os.path.join(work, 'mapeo.xlsx')
+            shutil.copy(WORKBOOK, workbook)
+
+            mapper = sqlite_mapper(db_path, workbook)
+            interrupt_after(mapper, 2)
+            checkpoint_path = mapper._checkpoint_path(folder, os.path.join(BASE_DIR, 'reportes'))
+            report_path = None
+            try:
+                assert mapper.compare_xml_with_db(folder, output_format='jsonl') is None
+                header, completed = mapper._load_checkpoint(checkpoint_path)
+                assert header['mapping_hash'] and header['filters'] == FILTERS and len(completed) == 2
+
+                if change == 'mapping':
+                    # Mismo archivo, otro contenido (una celda fuera de los mapeos)
+                    book = openpyxl.load_workbook(workbook)
+                    book.worksheets[0].cell(row=1, column=30, value='editado')
+                    book.save(workbook)
+                    mapper = sqlite_mapper(db_path, workbook)
+                else:
+                    mapper = sqlite_mapper(db_path, workbook, filters=later_start)
+                assert mapper.has_checkpoint(folder)
+                report_path = mapper.compare_xml_with_db(folder, resume=True)
+
+                # Ejecución nueva y completa, en el reporte de la configuración (no en el .jsonl del checkpoint)
+                assert report_path and report_path != header['report_path'], change
+                assert os.path.splitext(report_path)[1] == '.xlsx'
+                assert not mapper.has_checkpoint(folder)
+                assert not os.path.exists(header['report_path'])
+            finally:
+                if report_path is not None:
+                    remove_report(report_path)
+                if os.path.exists(checkpoint_path):
+                    os.remove(checkpoint_path)
+
+
+def test_interrupted_excel_report_is_discarded():
+    """Un reporte Excel cortado no queda en reportes/ ni deja la hoja temporal de openpyxl; al reanudar se genera."""
+    with tempfile.TemporaryDirectory() as work:
+        folder = os.path.join(work, 'xmls')
+        os.makedirs(folder)
+        write_xmls(folder)
+        db_path = os.path.join(work, 'bd.sqlite')
+        mapper = sqlite_mapper(db_path)
+        interrupt_after(mapper, 2)
+        checkpoint_path = mapper._checkpoint_path(folder, os.path.join(BASE_DIR, 'reportes'))
+        temporary_sheets = set(glob.glob(os.path.join(tempfile.gettempdir(), 'openpyxl.*')))
+        report_path = None
+        try:
+            assert mapper.compare_xml_with_db(folder, output_format='xlsx') is None
+            header, _ = mapper._load_checkpoint(checkpoint_path)
+            assert not os.path.exists(header['report_path'])
+            assert set(glob.glob(os.path.join(tempfile.gettempdir(), 'openpyxl.*'))) <= temporary_sheets
+
+            report_path = sqlite_mapper(db_path).compare_xml_with_db(folder, resume=True)
+            assert report_path == header['report_path'] and os.path.exists(report_path)
+        finally:
+            if report_path is not None:
+                remove_report(report_path)
+            if os.path.exists(checkpoint_path):
+                os.remove(checkpoint_path)
+
+
+def test_resume_without_checkpoint_starts_over():
+    """resume=True sin checkpoint hace una ejecución nueva y completa."""
+    with tempfile.TemporaryDirectory() as work:
+        folder = os.path.join(work, 'xmls')
+        os.makedirs(folder)
+        write_xmls(folder)
+        mapper = sqlite_mapper(os.path.join(work, 'bd.sqlite'))
+        assert not mapper.has_checkpoint(folder)
+        report_path = mapper.compare_xml_with_db(folder, output_format='jsonl', resume=True)
+        try:
+            rows, _ = read_report(report_path)
+            assert len({row['archivo'] for row in rows}) == FILE_COUNT
+        finally:
+            remove_report(report_path)
+
+
+if __name__ == '__main__':
+    run_tests("💾 Prueba del checkpoint y la reanudación:", globals())
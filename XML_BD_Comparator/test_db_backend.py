@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Prueba de la traducción de las consultas del comparador (dialecto de psycopg2: parámetros %s, '%%' literal,
+arreglos '= ANY(%s)'): el PREPARE/EXECUTE de PostgresBackend y adapt_query de SQLiteBackend, con las
+plantillas que arma _filtered_query_template y la verificación de registros; y qué backends admiten otra
+conexión para el pool (supports_clone).
+
+Uso: python test_db_backend.py  (o python -m pytest test_db_backend.py)
+"""
+import os
+import sqlite3
+import tempfile
+
+from testing_helpers import load_mapper, run_tests  # primero: agrega src/ al sys.path
+from db_backend import PostgresBackend, SQLiteBackend
+from xml_compare import XPathMapper
+
+
+class RecordingCursor:
+    """Cursor que solo guarda las sentencias ejecutadas (sin servidor PostgreSQL)."""
+
+    def __init__(self):
+        self.statements = []
+
+    def execute(self, query, params=None):
+        self.statements.append((query, params))
+
+
+def postgres_backend():
+    backend = PostgresBackend({})
+    backend.cursor = RecordingCursor()
+    return backend
+
+
+def filtered_templates():
+    """Plantillas de _filtered_query_template: por identificador, registro más reciente y tablas hijas."""
+    mapper = load_mapper(None)
+    return {
+        'por_identificador': (mapper._filtered_query_template('dispatch', ['city', 'latitude'], 'xref_id'), 1),
+        'mas_reciente': (mapper._filtered_query_template('dispatch', ['city'], None), 2),
+        'batt_dept': (mapper._filtered_query_template('batt_dept', ['name'], None), 1),
+        'hija_por_incidente': (mapper._filtered_query_template('nfirs_notification_apparatus', ['unit_code'], 'incident_number'), 1),
+        'hija_mas_reciente': (mapper._filtered_query_template('nfirs_notification_apparatus', ['unit_code'], None), 2),
+    }
+
+
+def test_prepared_literal_percent():
+    """'%%' es un '%' literal en el PREPARE (que se ejecuta sin parámetros) y no desplaza la numeración."""
+    backend = postgres_backend()
+    query = "SELECT d.city FROM dispatch d WHERE d.city LIKE 'HOMER%%' AND d.note LIKE '%%s' AND d.xref_id = %s"
+    execute = backend._prepared_statement(query, 1)
+    assert backend.cursor.statements == [
+        ("PREPARE comparador_1 AS SELECT d.city FROM dispatch d WHERE d.city LIKE 'HOMER%' AND d.note LIKE '%s' AND d.xref_id = $1", None)
+    ]
+    assert execute == "EXECUTE comparador_1 (%s)"
+
+
+def test_prepared_quoted_placeholder():
+    """Un %s dentro de un literal entre comillas es texto: no se numera, y si sobra un parámetro no se prepara."""
+    backend = postgres_backend()
+    query = "SELECT '%s' AS etiqueta, \"col%s\" FROM dispatch d WHERE d.xref_id = %s AND d.note = 'it''s %s'"
+    assert backend._prepared_statement(query, 1) == "EXECUTE comparador_1 (%s)"
+    assert backend.cursor.statements[0][0] == (
+        "PREPARE comparador_1 AS SELECT '%s' AS etiqueta, \"col%s\" FROM dispatch d WHERE d.xref_id = $1 AND d.note = 'it''s %s'"
+    )
+
+    # Con la cantidad de parámetros de psycopg2 (que también cuenta el %s entre comillas) no se prepara
+    backend = postgres_backend()
+    assert backend._prepared_statement(query, 4) == query
+    unmatched = "SELECT d.city FROM dispatch d WHERE d.note = '%s' AND d.xref_id = %s"
+    assert backend._prepared_statement(unmatched, 2) == unmatched
+    assert backend._prepared_statement(unmatched, 2) == unmatched
+    assert backend.cursor.statements == []
+
+
+def test_prepared_filtered_templates():
+    """Las plantillas de _filtered_query_template se preparan una vez por conexión, con '= ANY($n)' y $n en orden."""
+    backend = postgres_backend()
+    for number, (name, (template, param_count)) in enumerate(filtered_templates().items(), 1):
+        execute = backend._prepared_statement(template, param_count)
+        assert execute == f"EXECUTE comparador_{number} ({', '.join(['%s'] * param_count)})", name
+
+        prepared = backend.cursor.statements[-1][0]
+        assert prepared.startswith(f"PREPARE comparador_{number} AS SELECT"), name
+        assert '%s' not in prepared, name
+        expected = template
+        for position in range(1, param_count + 1):
+            expected = expected.replace('%s', f"${position}", 1)
+        assert prepared == f"PREPARE comparador_{number} AS {expected}", name
+        if 'ANY' in template:
+            assert '= ANY($1)' in prepared, name
+
+        # La segunda vez se reutiliza la sentencia preparada
+        statements = len(backend.cursor.statements)
+        assert backend._prepared_statement(template, param_count) == execute, name
+        assert len(backend.cursor.statements) == statements, name
+
+
+def sqlite_backend():
+    conn = sqlite3.connect(':memory:')
+    conn.executescript("""
+        CREATE TABLE dispatch (id, batt_dept_id, created_at, xref_id, city, latitude, note);
+        CREATE TABLE batt_dept (id, name);
+        CREATE TABLE nfirs_notification (id, batt_dept_id, created_at, dispatch_number, incident_number);
+        CREATE TABLE nfirs_notification_apparatus (id, nfirs_notification_id, unit_code);
+        INSERT INTO dispatch VALUES (1, 4611, '2025-03-12', 'A1', 'HOMER GLEN', 41.62, '100% listo');
+        INSERT INTO dispatch VALUES (2, 4611, '2025-03-13', 'A2', 'HOMEWOOD', 41.55, '%s');
+        INSERT INTO dispatch VALUES (3, 9999, '2025-03-14', 'A3', 'JOLIET', 41.52, NULL);
+        INSERT INTO batt_dept VALUES (4611, 'WILL COUNTY');
+        INSERT INTO nfirs_notification VALUES (10, 4611, '2025-03-12', 'A1', '17-25-0001');
+        INSERT INTO nfirs_notification_apparatus VALUES (100, 10, 'E17');
+    """)
+    return SQLiteBackend(':memory:', conn)
+
+
+def test_sqlite_adapt_query():
+    """adapt_query traduce %s a '?', '%%' a '%' y deja el texto entre comillas sin tocar."""
+    backend = sqlite_backend()
+    query, params = backend.adapt_query("SELECT city FROM dispatch WHERE note LIKE '100%%' AND xref_id = %s", ('A1',))
+    assert (query, params) == ("SELECT city FROM dispatch WHERE note LIKE '100%' AND xref_id = ?", ['A1'])
+    assert backend.fetchall("SELECT city FROM dispatch WHERE note LIKE '100%%' AND xref_id = %s", ('A1',)) == [('HOMER GLEN',)]
+
+    quoted = "SELECT xref_id, '%s' FROM dispatch WHERE note = '%s' AND batt_dept_id = %s"
+    assert backend.adapt_query(quoted, (4611,)) == ("SELECT xref_id, '%s' FROM dispatch WHERE note = '%s' AND batt_dept_id = ?", [4611])
+    assert backend.fetchall(quoted, (4611,)) == [('A2', '%s')]
+
+    # Sin parámetros la consulta no se traduce (como en psycopg2)
+    assert backend.adapt_query("SELECT 1 WHERE 'a' LIKE '%%'", None) == ("SELECT 1 WHERE 'a' LIKE '%%'", None)
+
+
+def test_sqlite_filtered_templates():
+    """Las plantillas de _filtered_query_template se ejecutan en SQLite con '= ANY(%s)' como IN (...)."""
+    backend = sqlite_backend()
+    templates = filtered_templates()
+    query, params = backend.adapt_query(templates['mas_reciente'][0], ([4611, 7], '2025-01-01'))
+    assert 'IN (?, ?)' in query and 'ANY' not in query and params == [4611, 7, '2025-01-01']
+
+    assert backend.fetchone(templates['por_identificador'][0], ('A1',)) == ('HOMER GLEN', 41.62)
+    assert backend.fetchone(templates['mas_reciente'][0], ([4611], '2025-01-01')) == ('HOMEWOOD',)
+    assert backend.fetchone(templates['mas_reciente'][0], ([], '2025-01-01')) is None
+    assert backend.fetchone(templates['batt_dept'][0], ([4611],)) == ('WILL COUNTY',)
+    assert backend.fetchone(templates['hija_por_incidente'][0], ('17-25-0001',)) == ('E17',)
+    assert backend.fetchone(templates['hija_mas_reciente'][0], ([4611], '2025-01-01'), prepare=True) == ('E17',)
+
+
+def test_sqlite_verify_union_query():
+    """La verificación de registros ('(SELECT ...) UNION (SELECT ...)') se traduce a una unión válida en SQLite."""
+    backend = sqlite_backend()
+    params = ([4611], '2025-01-01', 'A1', [4611], '2025-01-01', 'A1')
+    assert sorted(backend.fetchall(XPathMapper.VERIFY_RECORD_QUERY, params)) == [('dispatch', 'A1'), ('nfirs_notification', 'A1')]
+
+
+def test_supports_clone():
+    """El pool solo se abre con BD que admiten otra conexión: PostgreSQL y un archivo SQLite, no una base en memoria."""
+    assert postgres_backend().supports_clone
+    assert not sqlite_backend().supports_clone
+    with tempfile.TemporaryDirectory() as work:
+        db_path = os.path.join(work, 'bd.sqlite')
+        backend = SQLiteBackend(db_path, sqlite3.connect(db_path))
+        assert backend.supports_clone
+        clone = backend.clone()
+        assert clone is not backend and clone.path == db_path and clone.conn is None
+        backend.close()
+
+    mapper = load_mapper(None)
+    mapper.db = sqlite_backend()
+    assert mapper._open_db_pool(4) is None
+
+
+if __name__ == '__main__':
+    run_tests("🗄️ Prueba de la traducción de consultas de los backends:", globals())
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Prueba de la caché de extracción (processing.extraction_cache): un XML sin cambios se toma de la caché con los
+mismos registros, y un cambio en el contenido del XML o en el plan de extracción (mapeos, motor, delimitador de
+bloques) no la usa. Los filtros de la BD no forman parte de la clave.
+
+Uso: python test_extraction_cache.py  (o python -m pytest test_extraction_cache.py)
+"""
+import os
+import tempfile
+
+from testing_helpers import SAMPLE_ID, SAMPLE_XML, WORKBOOK, load_mapper, run_tests  # primero: agrega src/ al sys.path
+
+
+def cache_mapper(cache_path, filters=None, drop_mappings=0, **processing):
+    """Mapper con la caché de extracción en cache_path; drop_mappings quita los últimos mapeos (otro plan)."""
+    mapper = load_mapper(None, processing=dict({'extraction_cache': True}, **processing), filters=filters or {})
+    mapper.mapping_file = WORKBOOK
+    if drop_mappings:
+        # Recortar el plan antes de preparar la caché, como si el Excel tuviera menos filas
+        resolve = mapper._resolve_mapping_workbook
+        mapper._resolve_mapping_workbook = lambda: resolve()[:-drop_mappings]
+    assert mapper.load_mapping_file()
+    mapper.extraction_cache.path = cache_path
+    return mapper
+
+
+def extract(mapper, folder, name):
+    """(registros, parseado): parseado es False si el archivo se tomó de la caché."""
+    mapper._reset_performance_stats()
+    records = mapper._extract_xml_records(folder, name)
+    mapper._close_xml_input()
+    return records, 'parseo_xml' in mapper.performance_stats['stages']
+
+
+def write_xml(folder, name, incident_id=SAMPLE_ID):
+    with open(SAMPLE_XML, 'rb') as f:
+        data = f.read().replace(SAMPLE_ID.encode(), incident_id.encode())
+    with open(os.path.join(folder, name), 'wb') as f:
+        f.write(data)
+
+
+def test_unchanged_file_hits_with_identical_records():
+    """La segunda extracción de un XML sin cambios no lo parsea y devuelve los mismos registros, con otro nombre también."""
+    with tempfile.TemporaryDirectory() as work:
+        cache_path = os.path.join(work, 'extracciones.sqlite')
+        write_xml(work, 'a.xml')
+        write_xml(work, 'copia.xml')
+
+        mapper = cache_mapper(cache_path)
+        first, parsed = extract(mapper, work, 'a.xml')
+        assert parsed and first[0][3] is None
+
+        second, parsed = extract(cache_mapper(cache_path), work, 'a.xml')
+        assert not parsed
+        assert second == first
+
+        copy, parsed = extract(cache_mapper(cache_path), work, 'copia.xml')
+        assert not parsed
+        assert copy == [('copia.xml',) + first[0][1:]]
+
+        # Los filtros de la BD no cambian la extracción
+        _, parsed = extract(cache_mapper(cache_path, filters={'batt_dept_id': {'values': [4611]}}), work, 'a.xml')
+        assert not parsed
+
+
+def test_changed_xml_misses():
+    """Un XML modificado se vuelve a extraer y la caché devuelve después sus valores nuevos."""
+    with tempfile.TemporaryDirectory() as work:
+        cache_path = os.path.join(work, 'extracciones.sqlite')
+        write_xml(work, 'a.xml')
+        first, _ = extract(cache_mapper(cache_path), work, 'a.xml')
+
+        write_xml(work, 'a.xml', '1725031200000040')
+        changed, parsed = extract(cache_mapper(cache_path), work, 'a.xml')
+        assert parsed
+        assert changed != first and changed[0][1]['xref_id'] == '1725031200000040'
+
+        cached, parsed = extract(cache_mapper(cache_path), work, 'a.xml')
+        assert not parsed and cached == changed
+
+
+def test_changed_plan_misses():
+    """Otro mapeo, otro motor de extracción u otro delimitador de bloques no usan lo guardado con el plan anterior."""
+    with tempfile.TemporaryDirectory() as work:
+        cache_path = os.path.join(work, 'extracciones.sqlite')
+        write_xml(work, 'a.xml')
+        base = cache_mapper(cache_path)
+        extract(base, work, 'a.xml')
+
+        variants = [
+            cache_mapper(cache_path, drop_mappings=1),
+            cache_mapper(cache_path, extraction_engine='xslt'),
+            cache_mapper(cache_path, is_multiple_blocks_file=True, multiple_blocks_delimiter_xpath='//Incident'),
+        ]
+        for mapper in variants:
+            assert mapper.extraction_cache.plan_hash != base.extraction_cache.plan_hash
+            records, parsed = extract(mapper, work, 'a.xml')
+            assert parsed
+            assert all(len(values) == len(mapper.valid_mappings) for _, _, values, _ in records)
+
+
+def test_failed_files_are_not_cached():
+    """Un XML que no se pudo procesar se vuelve a intentar en la próxima ejecución."""
+    with tempfile.TemporaryDirectory() as work:
+        cache_path = os.path.join(work, 'extracciones.sqlite')
+        with open(os.path.join(work, 'roto.xml'), 'wb') as f:
+            f.write(b'')
+        mapper = cache_mapper(cache_path)
+        records, _ = extract(mapper, work, 'roto.xml')
+        assert records[0][3] is not None
+        xml_hash = mapper._get_xml_input(work).content_hash('roto.xml')
+        assert mapper.extraction_cache.get(xml_hash, 'roto.xml') is None
+
+
+if __name__ == '__main__':
+    run_tests("♻️ Prueba de la caché de extracción:", globals())
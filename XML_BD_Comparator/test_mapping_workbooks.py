@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Prueba de la resolución de los Excel de mapeo incluidos en mappings/: qué filas se aceptan y cuáles se rechazan al
+compilar, y que las notas entre corchetes o paréntesis y las cláusulas WHERE / ORDER BY de las descripciones no
+terminen agregadas como pasos de la ruta XPath.
+
+Uso: python test_mapping_workbooks.py  (o python -m pytest test_mapping_workbooks.py)
+"""
+import glob
+import os
+import re
+
+from testing_helpers import BASE_DIR, load_mapper, run_tests  # primero: agrega src/ al sys.path
+from xml_compare import XPathMapper
+
+MOTOROLA = 'Motorola_Flex_FirstDueExport_XML_CAD_Mappings_20240724.xlsx'
+HAMILTON = 'Hamilton_Co_TN_CentralSquareEnt_StandardExportInterface_Mappings_20240724.xlsx'
+
+# Filas rechazadas de cada Excel (el resto de las filas con mapeo se aceptan)
+EXPECTED_REJECTED_ROWS = {
+    MOTOROLA: {13, 36, 69, 71, 72, 75, 77, 79, 80, 82, 83},
+    HAMILTON: {68},
+}
+
+
+def workbooks():
+    return sorted(glob.glob(os.path.join(BASE_DIR, 'mappings', '*.xlsx')) + glob.glob(os.path.join(BASE_DIR, 'mappings', '*', '*.xlsx')))
+
+
+def accepted_xpaths(mapper, row_index):
+    return {mapping['xpath'] for mapping in mapper.valid_mappings if mapping.get('row_index') == row_index}
+
+
+def test_accepted_and_rejected_rows():
+    """Cada Excel incluido rechaza exactamente las filas esperadas y las aceptadas tienen rutas sin notas ni cláusulas."""
+    for workbook in workbooks():
+        name = os.path.basename(workbook)
+        if name.startswith('~$'):
+            continue
+        mapper = load_mapper(workbook)
+        assert mapper.valid_mappings, name
+        assert {rejected['row_index'] for rejected in mapper.rejected_mappings} == EXPECTED_REJECTED_ROWS.get(name, set()), name
+
+        rejected_rows = {rejected['row_index'] for rejected in mapper.rejected_mappings}
+        for mapping in mapper.valid_mappings:
+            assert mapping.get('row_index') not in rejected_rows, (name, mapping.get('row_index'))
+            xpath, xpath_raw = mapping['xpath'], mapping['xpath_raw']
+            if xpath_raw.startswith('/') or mapper._is_when_clause(xpath_raw):
+                continue
+            # Una ruta armada desde '<A> <B>' no tiene notas ni cláusulas, y las de la celda no le agregan pasos
+            assert not re.search(r'[\[\]()]|\b(?:WHERE|ORDER|SELECT)\b', xpath), (name, mapping.get('row_index'), xpath)
+            if not re.search(f"{XPathMapper.MAPPING_NOTE_PATTERN}|{XPathMapper.MAPPING_CLAUSE_PATTERN}", xpath_raw):
+                continue
+            for part in mapper._mapping_xpath_parts(xpath):
+                steps = [step for step in part.split('/') if step]
+                assert steps.count(steps[0]) == 1, (name, mapping.get('row_index'), part)
+
+
+def test_motorola_order_by_and_where_rows():
+    """Motorola: ORDER BY y WHERE sobre literales se rechazan; WHERE sobre '[target agency]' deja solo la ruta."""
+    mapper = load_mapper(os.path.join(BASE_DIR, 'mappings', MOTOROLA))
+    reasons = {rejected['row_index']: rejected['motivo'] for rejected in mapper.rejected_mappings}
+    assert 'ORDER BY' in reasons[36] and 'ORDER BY' in reasons[13]
+    assert all('WHERE' in reasons[row] for row in (69, 71, 72, 75, 77, 79, 80, 82, 83))
+    assert not accepted_xpaths(mapper, 36)
+
+    assert accepted_xpaths(mapper, 6) == {'//CADMasterCallTable/CADActiveCallTable/RelatedRecordNumber'}
+    assert accepted_xpaths(mapper, 11) == {'//CADMasterCallTable/CADActiveCallTable/TimeDateReported'}
+    assert accepted_xpaths(mapper, 33) == {'//CADMasterCallTable/CADActiveCallTable/YCoordinateGeobase'}
+    assert accepted_xpaths(mapper, 45) == {'//CADMasterCallTable/HowReceived'}
+    assert accepted_xpaths(mapper, 38) == {"WHEN //CADMasterCAllTable/CADActiveCallTable/StatusCodeOfCall = 'CMPLT' THEN 'closed' ELSE 'open'"}
+
+
+def test_mapping_notes_and_clauses():
+    """Las notas (también anidadas) no agregan elementos a la ruta; las cláusulas no soportadas dan un motivo."""
+    mapper = load_mapper(None)
+    assert mapper._process_xpath("<Export> <Incident> <City> (see mappings)") == '//Export/Incident/City'
+    assert mapper._process_xpath("<Export><Comments><Comment> (EX: <Comment>08:10 [16] texto</Comment>) [newest first]") == '//Export/Comments/Comment'
+    assert mapper._process_xpath("<A> <B> + <A> <C> [ORDER BY <A> <B> DESC]") == '//A/B + //A/C'
+    assert mapper._process_xpath("<A> <B> <C> WHERE <A> <B> <Agency> = [target agency][1]") == '//A/B/C'
+
+    assert mapper._unsupported_mapping_clause("<A> <B> WHERE <Agency> = [target agency]") is None
+    assert mapper._unsupported_mapping_clause("<A> <B> (where available)") is None
+    assert mapper._unsupported_mapping_clause("//Incident/Units/Unit[1]") is None
+    assert 'ORDER BY' in mapper._unsupported_mapping_clause("<A> <B> [ORDER BY <A> <C> DESC]")
+    assert 'ORDER BY' in mapper._unsupported_mapping_clause("<A> <B> [SELECT TOP 1 ORDER BY <C>]")
+    assert 'WHERE' in mapper._unsupported_mapping_clause("<A> <B> WHERE <Code> = 'PAGED' OR 'RCVD'")
+
+
+if __name__ == '__main__':
+    run_tests("📑 Prueba de los Excel de mapeo incluidos:", globals())
@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Prueba de la extracción en una sola pasada (path_trie): con los Excel de mapeo incluidos, el XML de ejemplo
+y un XML generado con las rutas de cada mapeo, el trie debe dar los mismos identificadores y valores que la
+evaluación de cada XPath sobre el árbol (y que la hoja XSLT). El XML generado repite cada elemento (vale el
+primero en orden del documento) y escribe en minúsculas una de cada tres rutas (respaldo case-insensitive).
+
+Uso: python test_path_trie_extraction.py  (o python -m pytest test_path_trie_extraction.py)
+"""
+import glob
+import os
+import tempfile
+
+from lxml import etree
+
+from testing_helpers import BASE_DIR, load_mapper, run_tests  # primero: agrega src/ al sys.path
+from path_trie import parse_simple_path
+
+WORKBOOKS = [
+    'mappings/xpath_mappings_will_county.xlsx',
+    'mappings/Humphreys_Co_TN_GeoConex_XML_Mappings_20250508.xlsx',
+    'mappings/Motorola_Flex_FirstDueExport_XML_CAD_Mappings_20240724.xlsx',
+    'mappings/Orange_County2_TX_Southern_Software (1).xlsx',
+]
+SAMPLE_XMLS = sorted(glob.glob(os.path.join(BASE_DIR, 'xml', '*', '*.xml')))
+
+
+def engine_mappers(workbook=None, valid_mappings=None):
+    """Un mapper por motor de extracción, desde un Excel de mappings/ o con valid_mappings armados a mano."""
+    workbook = os.path.join(BASE_DIR, workbook) if workbook else None
+    return {
+        engine: load_mapper(workbook, processing=processing, valid_mappings=valid_mappings)
+        for engine, processing in (
+            ('trie', {'trie_extraction': True}),
+            ('xpath', {'trie_extraction': False}),
+            ('xslt', {'extraction_engine': 'xslt'}),
+        )
+    }
+
+
+def extract(mapper, xml_content):
+    """Registros (identificadores, valores) que extrae el mapper de un XML."""
+    with tempfile.TemporaryDirectory() as folder:
+        with open(os.path.join(folder, 'prueba.xml'), 'wb') as f:
+            f.write(xml_content)
+        records = mapper._extract_xml_records(folder, 'prueba.xml')
+        mapper._close_xml_input()
+    assert all(error is None for _, _, _, error in records), records
+    return [(identifiers, values) for _, identifiers, values, _ in records]
+
+
+def _insert_path(root, tags, text, new_parent=False):
+    """Agregar un elemento hoja con text en la ruta tags bajo root (reutilizando los elementos ya creados)."""
+    node = root
+    for depth, tag in enumerate(tags):
+        last = depth == len(tags) - 1
+        child = None if last or (new_parent and depth == len(tags) - 2) else node.find(tag)
+        node = child if child is not None else etree.SubElement(node, tag)
+    node.text = text
+
+
+def synthetic_document(xpaths):
+    """
+    XML con cada ruta simple de xpaths: dos veces (un elemento 'valor N' y luego uno repetido) y, una de cada
+    tres, con los tags en minúsculas. Retorna (contenido, valores de las rutas en minúsculas).
+    """
+    paths = []
+    for xpath in xpaths:
+        parsed = parse_simple_path(xpath)
+        if parsed is not None and parsed not in paths:
+            paths.append(parsed)
+
+    absolute_roots = [tags[0] for absolute, tags in paths if absolute]
+    root_tag = max(set(absolute_roots), key=absolute_roots.count) if absolute_roots else 'Export'
+    root = etree.Element(root_tag)
+    lowercase_values = []
+
+    for index, (absolute, tags) in enumerate(paths):
+        if absolute:
+            if tags[0] != root_tag:
+                continue
+            tags = tags[1:]
+        if not tags:
+            continue
+        text = f"valor {index}"
+        if index % 3 == 2:
+            tags = tuple(tag.lower() for tag in tags)
+            lowercase_values.append(text)
+        _insert_path(root, tags, text)
+        _insert_path(root, tags, f"repetido {index}", new_parent=len(tags) > 1)
+
+    return etree.tostring(root, xml_declaration=True, encoding='utf-8'), lowercase_values
+
+
+def test_workbooks_trie_equals_xpath():
+    """Con cada Excel incluido, el trie y la hoja XSLT extraen lo mismo que un XPath por mapeo."""
+    for workbook in WORKBOOKS:
+        mappers = engine_mappers(workbook=workbook)
+        trie_mapper = mappers['trie']
+        assert trie_mapper.path_trie is not None and sum(trie_mapper._trie_mappings) > 0, workbook
+
+        mapping_xpaths = [row['xpath'] for row in trie_mapper.valid_mappings if row['xpath']]
+        document, lowercase_values = synthetic_document(mapping_xpaths)
+        documents = [open(path, 'rb').read() for path in SAMPLE_XMLS] + [document]
+
+        for number, content in enumerate(documents):
+            expected = extract(mappers['xpath'], content)
+            for engine in ('trie', 'xslt'):
+                assert extract(mappers[engine], content) == expected, f"{workbook}: {engine} != xpath en el documento {number}"
+
+        # El documento generado ejercita el respaldo case-insensitive y los elementos repetidos
+        values = [value for value in extract(trie_mapper, document)[0][1] if value]
+        assert any(value in lowercase_values for value in values), workbook
+        assert not any(str(value).startswith('repetido') for value in values), workbook
+
+
+def _manual_mappings(*xpaths):
+    return [
+        {'xpath': xpath, 'xpath_raw': xpath, 'query': '', 'table_name': 'dispatch', 'column_name': f"campo_{i}",
+         'column_original': f"campo_{i}", 'source': 'Prueba', 'row_index': i}
+        for i, xpath in enumerate(xpaths)
+    ]
+
+
+CASE_DOCUMENT = b"""<?xml version="1.0"?>
+<Export>
+  <incident>
+    <incidentnumber>17-25-0001</incidentnumber>
+    <Location><CITY>HOMER GLEN</CITY></Location>
+  </incident>
+  <Incident>
+    <Units>
+      <Unit><UnitCode>E17</UnitCode></Unit>
+      <Unit><UnitCode>T5</UnitCode></Unit>
+    </Units>
+    <Units><Unit><UnitCode>M3</UnitCode></Unit></Units>
+  </Incident>
+</Export>"""
+
+
+def test_case_insensitive_fallback():
+    """Una ruta del mapeo con otras mayúsculas que el XML se resuelve igual en el trie y con XPath."""
+    mappings = _manual_mappings('//Incident/IncidentNumber', '//Incident/Location/City', '/Export/Incident/IncidentNumber')
+    results = {engine: extract(mapper, CASE_DOCUMENT) for engine, mapper in engine_mappers(valid_mappings=mappings).items()}
+    assert results['trie'][0][1] == ('17-25-0001', 'HOMER GLEN', '17-25-0001')
+    assert results['trie'] == results['xpath'] == results['xslt']
+
+
+def test_repeated_elements():
+    """Con elementos repetidos vale el primero en orden del documento, también cuando se repite un ancestro."""
+    mappings = _manual_mappings('//Units/Unit/UnitCode', '//Incident/Units/Unit/UnitCode', '/Export/Incident/Units/Unit/UnitCode')
+    results = {engine: extract(mapper, CASE_DOCUMENT) for engine, mapper in engine_mappers(valid_mappings=mappings).items()}
+    assert results['trie'][0][1] == ('E17', 'E17', 'E17')
+    assert results['trie'] == results['xpath'] == results['xslt']
+
+
+if __name__ == '__main__':
+    run_tests("🌲 Prueba de la extracción en una sola pasada (trie) contra XPath:", globals())
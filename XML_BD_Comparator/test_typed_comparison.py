@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Prueba de la comparación según el tipo de columna del esquema de la BD (_load_db_schema): las columnas numéricas,
+booleanas y de fecha se comparan por valor ('5' y '5.00', 'Y' y 'true', '2025-03-12T09:59:34' y la fecha de la BD),
+y las de texto o sin esquema se siguen comparando como texto.
+
+Uso: python test_typed_comparison.py  (o python -m pytest test_typed_comparison.py)
+"""
+import sqlite3
+
+from testing_helpers import load_mapper, run_tests  # primero: agrega src/ al sys.path
+from db_backend import SQLiteBackend
+
+# (columna, tipo en la BD, valor del XML, valor de la BD, coincide)
+CASES = [
+    ('units_count', 'INTEGER', '5', 5, True),
+    ('response_minutes', 'NUMERIC(6,2)', '12.5', '12.50', True),
+    ('priority', 'BIGINT', '3', '4', False),
+    ('is_closed', 'BOOLEAN', 'Y', 1, True),
+    ('is_paged', 'BOOLEAN', 'N', 'true', False),
+    ('dispatched_at', 'TIMESTAMP', '2025-03-12T09:59:34', '2025-03-12 09:59:34', True),
+    ('arrived_at', 'TIMESTAMP', '2025-03-12T10:00:47.910', '2025-03-12 10:00:47.910000', True),
+    ('cleared_at', 'DATETIME', '03/12/2025 10:15:00', '2025-03-12 10:15:00', True),
+    ('call_date', 'DATE', '2025-03-12T09:59:34', '2025-03-12', True),
+    ('created_at', 'TIMESTAMP', '2025-03-12T09:59:34', '2025-03-12 09:59:35', False),
+    ('city', 'TEXT', 'HOMER GLEN', 'HOMER GLEN', True),
+    ('zip_code', 'TEXT', '60491.0', '60491', False),
+    ('station', 'VARCHAR(10)', '01', '1', False),
+]
+
+
+def compare_cases(with_schema=True):
+    """Filas del reporte de un archivo con un mapeo por caso, contra una tabla SQLite con los tipos de CASES."""
+    mappings = [
+        {'xpath': f"//Incident/{column}", 'xpath_raw': f"//Incident/{column}", 'query': '', 'table_name': 'dispatch',
+         'column_name': column, 'column_original': column, 'source': 'Prueba', 'row_index': i}
+        for i, (column, _, _, _, _) in enumerate(CASES)
+    ]
+    mapper = load_mapper(None, valid_mappings=mappings)
+    conn = sqlite3.connect(':memory:')
+    conn.execute(f"CREATE TABLE dispatch ({', '.join(f'{column} {data_type}' for column, data_type, _, _, _ in CASES)})")
+    mapper.db = SQLiteBackend(':memory:', conn)
+    if with_schema:
+        mapper._load_db_schema(mapper._group_columns_by_table())
+
+    extracted = ('incidente.xml', {}, tuple(xml_value for _, _, xml_value, _, _ in CASES), None)
+    record_db_values = {'dispatch': {column: mapper._format_db_value(db_value) for column, _, _, db_value, _ in CASES}}
+    results = []
+    mapper._append_comparison_rows(extracted, 'dispatch', record_db_values, results)
+    return results
+
+
+def test_typed_columns_compare_values():
+    """Con el esquema leído, cada columna se compara según su tipo y la observación coincide con el resultado."""
+    results = compare_cases()
+    assert [(row['campo'], row['coincide']) for row in results] == [(column, match) for column, _, _, _, match in CASES]
+    for row, (_, _, xml_value, db_value, match) in zip(results, CASES):
+        # El reporte conserva los valores originales
+        assert row['valor_xml'] == xml_value and row['valor_bd'] == str(db_value), row
+        assert row['observaciones'].startswith('Valores coinciden' if match else 'Valores diferentes'), row
+    notes = {row['campo']: row['observaciones'] for row in results}
+    assert notes['dispatched_at'] == 'Valores coinciden (normalizados como fecha_hora)'
+    assert notes['city'] == 'Valores coinciden'
+
+
+def test_without_schema_compares_text():
+    """Sin esquema de la BD (no se pudo leer) los valores se comparan como texto, igual que antes."""
+    results = compare_cases(with_schema=False)
+    assert [row['campo'] for row in results if row['coincide']] == ['units_count', 'city']
+
+
+def test_type_categories_and_normalization():
+    """Tipos de PostgreSQL y de SQLite, y valores que no se pueden interpretar con su tipo."""
+    mapper = load_mapper(None)
+    categories = {
+        'integer': 'numerico', 'double precision': 'numerico', 'numeric': 'numerico', 'REAL': 'numerico',
+        'boolean': 'booleano', 'timestamp without time zone': 'fecha_hora', 'timestamp with time zone': 'fecha_hora',
+        'date': 'fecha', 'character varying': None, 'interval': None, 'point': None, 'time without time zone': None, '': None,
+    }
+    for data_type, category in categories.items():
+        assert mapper._column_type_category(data_type) == category, data_type
+
+    assert mapper._normalize_typed_value('-0.0', 'numerico') == mapper._normalize_typed_value('0', 'numerico') == '0'
+    assert mapper._normalize_typed_value('1E3', 'numerico') == '1000'
+    assert mapper._normalize_typed_value('N/A', 'numerico') == 'N/A'
+    assert mapper._normalize_typed_value('NaN', 'numerico') == 'NaN'
+    assert mapper._normalize_typed_value('quizás', 'booleano') == 'quizás'
+    assert mapper._normalize_typed_value('mañana', 'fecha_hora') == 'mañana'
+    assert mapper._normalize_typed_value('CAMPO_NO_EXISTE', 'numerico') == 'CAMPO_NO_EXISTE'
+    assert mapper._normalize_typed_value('2025-03-12T14:59:34Z', 'fecha_hora') == mapper._normalize_typed_value('2025-03-12 09:59:34-05:00', 'fecha_hora')
+
+
+if __name__ == '__main__':
+    run_tests("🔢 Prueba de la comparación según el tipo de columna:", globals())
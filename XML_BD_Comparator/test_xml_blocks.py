@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Prueba de los archivos con varios incidentes (xml_blocks y processing.is_multiple_blocks_file): un registro
+por cada elemento que cumple multiple_blocks_delimiter_xpath, con sus propios identificadores y valores, el
+encabezado del lote disponible en cada bloque, y rechazo de un delimitador que no es una ruta simple.
+
+Uso: python test_xml_blocks.py  (o python -m pytest test_xml_blocks.py)
+"""
+import io
+import logging
+import os
+import tempfile
+
+from testing_helpers import load_mapper, run_tests  # primero: agrega src/ al sys.path
+from path_trie import parse_simple_path
+from xml_blocks import iter_blocks
+
+BATCH_XML = b"""<?xml version="1.0"?>
+<Export>
+  <Header><Agency>WILL COUNTY</Agency></Header>
+  <Incidents>
+    <Incident><IncidentNumber>17-25-0001</IncidentNumber><City>HOMER GLEN</City></Incident>
+    <Incident><IncidentNumber>17-25-0002</IncidentNumber><City>LOCKPORT</City></Incident>
+    <Incident><IncidentNumber>17-25-0003</IncidentNumber></Incident>
+  </Incidents>
+</Export>"""
+
+SINGLE_XML = b"""<?xml version="1.0"?>
+<Incident><IncidentNumber>17-25-0009</IncidentNumber><City>JOLIET</City></Incident>"""
+
+MAPPINGS = [
+    {'xpath': xpath, 'xpath_raw': xpath, 'query': '', 'table_name': 'dispatch', 'column_name': column,
+     'column_original': column, 'source': 'Prueba', 'row_index': i}
+    for i, (xpath, column) in enumerate([
+        ('//Incident/IncidentNumber', 'xref_id'),
+        ('//Incident/City', 'city'),
+        ('/Export/Header/Agency', 'agency'),
+    ])
+]
+
+
+def blocks_mapper(delimiter_xpath):
+    processing = {'is_multiple_blocks_file': True, 'multiple_blocks_delimiter_xpath': delimiter_xpath}
+    return load_mapper(None, processing=processing, valid_mappings=MAPPINGS)
+
+
+def extract(mapper, content, name='lote.xml'):
+    with tempfile.TemporaryDirectory() as folder:
+        with open(os.path.join(folder, name), 'wb') as f:
+            f.write(content)
+        records = mapper._extract_xml_records(folder, name)
+        mapper._close_xml_input()
+    return records
+
+
+def test_one_record_per_block():
+    """Cada Incident es un registro 'archivo[n]' con sus identificadores y valores; el encabezado se ve en todos."""
+    for delimiter in ('//Incidents/Incident', '/Export/Incidents/Incident', '//Incident'):
+        records = extract(blocks_mapper(delimiter), BATCH_XML)
+        assert [name for name, _, _, _ in records] == ['lote.xml[1]', 'lote.xml[2]', 'lote.xml[3]'], delimiter
+        assert all(error is None for _, _, _, error in records), delimiter
+        assert [ids['xref_id'] for _, ids, _, _ in records] == ['17-25-0001', '17-25-0002', '17-25-0003'], delimiter
+        assert [values for _, _, values, _ in records] == [
+            ('17-25-0001', 'HOMER GLEN', 'WILL COUNTY'),
+            ('17-25-0002', 'LOCKPORT', 'WILL COUNTY'),
+            ('17-25-0003', None, 'WILL COUNTY'),
+        ], delimiter
+
+
+def test_block_documents_contain_one_block():
+    """Cada documento entregado tiene solo su bloque (los anteriores se liberan y los siguientes no se copian)."""
+    numbers = []
+    for number, root in iter_blocks(io.BytesIO(BATCH_XML), parse_simple_path('//Incidents/Incident')):
+        incidents = root.findall('.//Incident')
+        assert len(incidents) == 1
+        assert root.findtext('Header/Agency') == 'WILL COUNTY'
+        numbers.append((number, incidents[0].findtext('IncidentNumber')))
+    assert numbers == [(1, '17-25-0001'), (2, '17-25-0002'), (3, '17-25-0003')]
+
+
+def test_file_without_blocks_is_one_record():
+    """Un archivo sin ningún bloque se compara completo, con el nombre del archivo."""
+    records = extract(blocks_mapper('//Incidents/Incident'), SINGLE_XML, 'solo.xml')
+    assert [(name, ids['xref_id'], values) for name, ids, values, _ in records] == [
+        ('solo.xml', '17-25-0009', ('17-25-0009', 'JOLIET', None))
+    ]
+
+
+def test_unsupported_delimiter_is_rejected():
+    """Un delimitador con predicados o funciones no es una ruta simple: se rechaza y el archivo es un solo registro."""
+    for delimiter in ("//Incident[City='LOCKPORT']", '//Incidents/*', 'count(//Incident)', ''):
+        mapper = blocks_mapper(delimiter)
+        assert mapper._block_delimiter is None, delimiter
+        records = extract(mapper, BATCH_XML)
+        assert [name for name, _, _, _ in records] == ['lote.xml'], delimiter
+
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.INFO)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def test_malformed_xml_recovery():
+    """Un XML con errores de formato se relee con el parser tolerante, con el mismo log en los tres caminos de lectura."""
+    malformed = BATCH_XML.replace(b'<City>LOCKPORT</City>', b'<City>LOCKPORT & CO</City>')
+    mappers = {
+        'trie': load_mapper(None, valid_mappings=MAPPINGS),
+        'xpath': load_mapper(None, processing={'trie_extraction': False}, valid_mappings=MAPPINGS),
+        'bloques': blocks_mapper('//Incidents/Incident'),
+    }
+    for name, mapper in mappers.items():
+        handler = RecordingHandler()
+        mapper.logger.addHandler(handler)
+        mapper.logger.setLevel(logging.INFO)
+        try:
+            records = extract(mapper, malformed)
+        finally:
+            mapper.logger.removeHandler(handler)
+        assert all(error is None for _, _, _, error in records), (name, records)
+        assert len(records) == (3 if name == 'bloques' else 1), name
+
+        steps = ['Error de formato XML en lote.xml', 'Intentando parseo más tolerante para lote.xml',
+                 'Errores recuperados en lote.xml: ', 'XML parseado exitosamente con recuperación de errores: lote.xml']
+        logged = [next((message for message in handler.messages if message.startswith(step)), None) for step in steps]
+        assert None not in logged, (name, handler.messages)
+        assert [handler.messages.index(message) for message in logged] == sorted(handler.messages.index(message) for message in logged), name
+
+
+if __name__ == '__main__':
+    run_tests("📦 Prueba de los archivos con varios incidentes:", globals())
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Prueba de la entrada comprimida (xml_input): los XML de un .zip o un .tar.gz se listan, filtran y extraen igual
+que desde una carpeta, también con workers; los workers no vuelven a abrir el .tar.gz, y el modo vigilancia usa
+el mismo filtro processing.input_pattern que la ejecución única.
+
+Uso: python test_xml_input.py  (o python -m pytest test_xml_input.py)
+"""
+import os
+import shutil
+import tarfile
+import tempfile
+import zipfile
+
+from testing_helpers import SAMPLE_ID, SAMPLE_XML, load_mapper, run_tests  # primero: agrega src/ al sys.path
+from xml_input import DirectoryInput, TarInput, ZipInput, open_xml_input
+
+
+def write_inputs(work, members):
+    """Carpeta, .zip y .tar.gz con members ({nombre: bytes}, nombres con '/' para subcarpetas del archivo)."""
+    folder = os.path.join(work, 'carpeta')
+    for name, data in members.items():
+        path = os.path.join(folder, *name.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    zip_path = os.path.join(work, 'lote.zip')
+    with zipfile.ZipFile(zip_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for name, data in members.items():
+            archive.writestr(name, data)
+
+    tar_path = os.path.join(work, 'lote.tar.gz')
+    with tarfile.open(tar_path, 'w:gz') as archive:
+        for name in members:
+            archive.add(os.path.join(folder, *name.split('/')), name)
+    return folder, zip_path, tar_path
+
+
+def sample_members(count):
+    """count XML de incidentes a partir del XML de ejemplo, con un identificador distinto cada uno."""
+    with open(SAMPLE_XML, 'rb') as f:
+        data = f.read()
+    members = {f"incidente_{i:02d}.xml": data.replace(SAMPLE_ID.encode(), f"{SAMPLE_ID[:-2]}{39 + i}".encode()) for i in range(count)}
+    members['leeme.txt'] = b'no es un XML'
+    return members
+
+
+def extract_all(mapper, path, workers):
+    files = mapper._get_xml_input(path).list_files()
+    records = list(mapper._iter_extracted_files(path, files, workers))
+    mapper._close_xml_input()
+    return records
+
+
+def test_input_kind_and_listing():
+    """Tipo de entrada según la ruta, XML por extensión sin distinguir mayúsculas y filtro glob por ruta o por nombre."""
+    members = {'lote/a.xml': b'<a/>', 'lote/B.XML': b'<b/>', 'lote/notas.txt': b'x', 'otro/c.xml': b'<c/>'}
+    with tempfile.TemporaryDirectory() as work:
+        folder, zip_path, tar_path = write_inputs(work, members)
+        assert isinstance(open_xml_input(folder), DirectoryInput)
+        assert isinstance(open_xml_input(zip_path), ZipInput)
+        assert isinstance(open_xml_input(tar_path), TarInput)
+        try:
+            open_xml_input(os.path.join(folder, 'lote', 'notas.txt'))
+            assert False, "un .txt no es una entrada válida"
+        except ValueError:
+            pass
+
+        for path in (zip_path, tar_path):
+            assert open_xml_input(path).list_files() == ['lote/a.xml', 'lote/B.XML', 'otro/c.xml'], path
+            assert open_xml_input(path, 'b.*').list_files() == ['lote/B.XML'], path
+            assert open_xml_input(path, 'LOTE/*').list_files() == ['lote/a.xml', 'lote/B.XML', 'lote/notas.txt'], path
+            assert open_xml_input(path, 'otro/*.xml').list_files() == ['otro/c.xml'], path
+        assert sorted(open_xml_input(os.path.join(folder, 'lote')).list_files()) == ['B.XML', 'a.xml']
+        assert open_xml_input(os.path.join(folder, 'lote'), '*.txt').list_files() == ['notas.txt']
+
+
+def test_archive_content_matches_directory():
+    """Cada miembro se lee con el mismo contenido y el mismo hash que el archivo de la carpeta."""
+    members = sample_members(3)
+    with tempfile.TemporaryDirectory() as work:
+        folder, zip_path, tar_path = write_inputs(work, members)
+        directory = open_xml_input(folder)
+        for path in (zip_path, tar_path):
+            xml_input = open_xml_input(path)
+            for name in xml_input.list_files():
+                with xml_input.open(name) as stream:
+                    assert stream.read() == members[name], (path, name)
+                assert xml_input.content_hash(name) == directory.content_hash(name), (path, name)
+                xml_input.release(name)
+            xml_input.close()
+
+
+def test_archive_extraction_matches_directory():
+    """Los registros extraídos de un .zip o un .tar.gz son los de la carpeta, en secuencia y con workers."""
+    mapper = load_mapper()
+    with tempfile.TemporaryDirectory() as work:
+        folder, zip_path, tar_path = write_inputs(work, sample_members(6))
+        expected = sorted(extract_all(mapper, folder, 1))
+        assert len(expected) == 6 and all(error is None for _, _, _, error in expected)
+        for path in (zip_path, tar_path):
+            for workers in (1, 2):
+                assert sorted(extract_all(mapper, path, workers)) == expected, (path, workers)
+
+
+def test_tar_workers_do_not_reopen_archive():
+    """Con workers, el proceso principal lee el .tar.gz y envía el contenido: los workers no abren el archivo."""
+    mapper = load_mapper()
+    with tempfile.TemporaryDirectory() as work:
+        folder, _, tar_path = write_inputs(work, sample_members(6))
+        expected = sorted(extract_all(mapper, folder, 1))
+
+        files = mapper._get_xml_input(tar_path).list_files()
+        # El proceso principal ya tiene el archivo abierto; un worker que lo abriera por su ruta fallaría
+        os.rename(tar_path, tar_path + '.movido')
+        records = sorted(mapper._iter_extracted_files(tar_path, files, 2))
+        mapper._close_xml_input()
+        assert records == expected
+
+
+def test_pattern_filter_and_watch_folder():
+    """processing.input_pattern filtra igual la ejecución única y el modo vigilancia."""
+    mapper = load_mapper(processing={'input_pattern': 'incidente_0[01].xml'})
+    with tempfile.TemporaryDirectory() as work:
+        folder, zip_path, _ = write_inputs(work, sample_members(3))
+        shutil.copy(os.path.join(folder, 'incidente_02.xml'), os.path.join(folder, 'INCIDENTE_01.XML.bak'))
+        assert sorted(mapper._get_xml_input(folder).list_files()) == ['incidente_00.xml', 'incidente_01.xml']
+        assert sorted(mapper._scan_watch_folder(folder)) == ['incidente_00.xml', 'incidente_01.xml']
+        assert [name for name, _, _, _ in extract_all(mapper, zip_path, 1)] == ['incidente_00.xml', 'incidente_01.xml']
+
+    mapper = load_mapper()
+    with tempfile.TemporaryDirectory() as work:
+        folder, _, _ = write_inputs(work, sample_members(2))
+        assert sorted(mapper._scan_watch_folder(folder)) == ['incidente_00.xml', 'incidente_01.xml']
+
+
+if __name__ == '__main__':
+    run_tests("🗜️ Prueba de la entrada comprimida (zip / tar.gz):", globals())
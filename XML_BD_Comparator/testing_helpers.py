@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Utilidades compartidas por las pruebas (test_*.py): agrega src/ al sys.path, el Excel y el XML de ejemplo de
+Will County, el mapper de prueba y el runner de 'python test_xxx.py'.
+"""
+import glob
+import logging
+import os
+import sys
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.join(BASE_DIR, 'src')
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+from xml_compare import XPathMapper  # noqa: E402
+
+WORKBOOK = os.path.join(BASE_DIR, 'mappings', 'xpath_mappings_will_county.xlsx')
+SAMPLE_XML = sorted(glob.glob(os.path.join(BASE_DIR, 'xml', 'will_county', '*.xml')))[0]
+SAMPLE_ID = '1725031200000039'
+
+
+def load_mapper(workbook=WORKBOOK, processing=None, filters=None, valid_mappings=None):
+    """
+    Mapper de prueba con la configuración processing (sin caché del mapeo) y filters. Carga el Excel workbook;
+    con workbook=None usa valid_mappings armados a mano, o queda sin mapeos si tampoco se pasan.
+    """
+    mapper = XPathMapper()
+    mapper.logger.setLevel(logging.ERROR)
+    mapper.config = {'processing': dict({'mapping_cache': False}, **(processing or {}))}
+    if filters is not None:
+        mapper.config['filters'] = filters
+    if workbook:
+        mapper.mapping_file = workbook
+        assert mapper.load_mapping_file(), workbook
+    elif valid_mappings is not None:
+        mapper.valid_mappings = valid_mappings
+        mapper._prepare_path_trie()
+        mapper._prepare_xslt_extractor()
+        mapper._prepare_block_delimiter()
+    return mapper
+
+
+def run_tests(title, namespace):
+    """
+    Ejecutar las funciones test_* de namespace (los globals() del módulo de prueba) e informar cada una. Un error
+    que no es de una aserción cuenta como falla sin cortar las demás; sale con código 1 si alguna falló.
+    """
+    print(title)
+    print("=" * 60)
+    failures = 0
+    for name, test in list(namespace.items()):
+        if name.startswith('test_') and callable(test):
+            try:
+                test()
+                print(f"✅ PASS {name}")
+            except AssertionError as e:
+                failures += 1
+                print(f"❌ FAIL {name}: {e}")
+            except Exception as e:
+                failures += 1
+                print(f"❌ FAIL {name}: {type(e).__name__}: {e}")
+    sys.exit(1 if failures else 0)